@@ -0,0 +1,4 @@
+"""Benchmarks of Bladerunner, run from the repository root.
+
+These aren't installed with the package, see each module for its usage.
+"""
@@ -0,0 +1,375 @@
+"""End-to-end throughput benchmarks of Bladerunner.run against fake hosts.
+
+Hosts are simulated with bladerunner.testing's FakeFleet, so nothing is
+resolved or connected to. Each scenario is run in its own process, so its
+peak RSS and thread count aren't inflated by the scenarios before it.
+
+Usage examples::
+
+    # the 100, 1k and 10k host scenarios, compared to baseline.json
+    python -m benchmarks.fleet
+
+    # only 1k hosts, with slower commands and larger output
+    python -m benchmarks.fleet --hosts 1k --latency 0.5 --output-size 65536
+
+    # record the results as the new baseline
+    python -m benchmarks.fleet --hosts 100 1k --save
+
+The exit code is 1 if any result regressed past the tolerance.
+
+Note that the time taken also includes starting each fake host's process,
+which is why the CPU time of the fake hosts is reported separately.
+"""
+
+
+from __future__ import division
+from __future__ import print_function
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import threading
+import subprocess
+
+from bladerunner.base import Bladerunner
+from bladerunner.testing import FakeFleet
+
+
+SCENARIOS = {"100": 100, "1k": 1000, "10k": 10000}
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        "baseline.json")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# the settings a result must match its baseline's in to be compared
+SETTINGS = ("hosts", "latency", "output_size", "threads", "commands")
+
+# metric => (True if higher is better, smallest change which isn't noise)
+METRICS = {
+    "hosts_per_sec": (True, 1),
+    "wall_seconds": (False, 0.5),
+    "peak_rss_mb": (False, 5),
+    "peak_threads": (False, 2),
+    "cpu_seconds": (False, 0.2),
+    "fake_hosts_cpu_seconds": (False, 0.5),
+}
+
+# the CPU time of the current thread, python 3.7+
+thread_time = getattr(time, "thread_time", None)
+
+
+class PhaseCPU(object):
+    """Measures the CPU time spent in each phase, and the peak threads.
+
+    Used as one of Bladerunner's phase_callbacks, with phase_changed. Each
+    host's phases all change in the worker thread running it, so the CPU
+    time of that thread between changes is the CPU time of the phase.
+    """
+
+    def __init__(self):
+        """Initializes empty totals."""
+
+        self.cpu = {}  # phase => float CPU seconds, across all hosts
+        self.peak_threads = threading.active_count()
+        self._current = {}  # host => (phase, thread CPU time it started)
+        self._lock = threading.Lock()
+
+        super(PhaseCPU, self).__init__()
+
+    def phase_changed(self, server, phase, when):
+        """Adds the host's previous phase's CPU time to its total.
+
+        Args::
+
+            server: the string hostname
+            phase: the string phase name, or None if the host is finished
+            when: the float monotonic time of the change
+        """
+
+        now = thread_time() if thread_time is not None else 0
+        with self._lock:
+            self.peak_threads = max(self.peak_threads,
+                                    threading.active_count())
+            previous = self._current.pop(server, None)
+            if previous is not None:
+                previous_phase, started = previous
+                self.cpu[previous_phase] = (
+                    self.cpu.get(previous_phase, 0) + now - started
+                )
+            if phase is not None:
+                self._current[server] = (phase, now)
+
+
+def _peak_rss_mb():
+    """Returns the peak RSS of this process in MB."""
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return peak / 1024 / 1024  # bytes
+    return peak / 1024  # KB
+
+
+def _children_cpu():
+    """Returns the CPU seconds of finished child processes."""
+
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def run_scenario(hosts, latency=0.05, output_size=1024, threads=100,
+                 commands=("uptime",)):
+    """Runs Bladerunner against fake hosts, in this process.
+
+    Args::
+
+        hosts: the integer number of hosts
+        latency: float seconds before each command's output
+        output_size: integer size of each command's output
+        threads: integer number of Bladerunner's threads
+        commands: a list of string commands to run on each host
+
+    Returns:
+        a dictionary of the settings and measurements
+    """
+
+    commands = list(commands)
+    servers = ["host{0:05d}".format(number) for number in range(hosts)]
+
+    with FakeFleet(latency=latency, output_size=output_size) as fleet:
+        runner = Bladerunner({
+            "ssh": fleet.ssh_command,
+            "threads": threads,
+            "cmd_timeout": max(20, latency * 10),
+        })
+        phase_cpu = PhaseCPU()
+        runner.phase_callbacks.append(phase_cpu.phase_changed)
+
+        children_cpu = _children_cpu()
+        cpu = os.times()
+        started = time.time()
+        results = runner.run(commands, servers)
+        wall = time.time() - started
+        cpu_seconds = sum(os.times()[:2]) - sum(cpu[:2])
+        children_cpu = _children_cpu() - children_cpu
+
+    failures = sum(
+        1 for result in results
+        if [command for command, _ in result["results"]] != commands
+    )
+
+    return {
+        "hosts": hosts,
+        "latency": latency,
+        "output_size": output_size,
+        "threads": threads,
+        "commands": commands,
+        "failures": failures,
+        "wall_seconds": round(wall, 3),
+        "hosts_per_sec": round(hosts / wall, 2),
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+        "peak_threads": phase_cpu.peak_threads,
+        "cpu_seconds": round(cpu_seconds, 3),
+        "fake_hosts_cpu_seconds": round(children_cpu, 3),
+        "phase_cpu_seconds": dict(
+            (phase, round(seconds, 3))
+            for phase, seconds in phase_cpu.cpu.items()
+        ) if thread_time is not None else None,
+    }
+
+
+def run_isolated(hosts, options):
+    """Runs a scenario in a new process, returning its results."""
+
+    command = [
+        sys.executable, "-m", "benchmarks.fleet", "--isolated",
+        "--hosts", str(hosts),
+        "--latency", str(options.latency),
+        "--output-size", str(options.output_size),
+        "--threads", str(options.threads),
+        "--commands",
+    ] + options.commands
+
+    output = subprocess.check_output(command, cwd=ROOT)
+    return json.loads(output.decode("utf-8").strip().splitlines()[-1])
+
+
+def _flatten(result):
+    """Returns the comparable metrics of a result as a flat dictionary."""
+
+    metrics = dict((key, result[key]) for key in METRICS if key in result)
+    for phase, seconds in (result.get("phase_cpu_seconds") or {}).items():
+        metrics["cpu_seconds[{0}]".format(phase)] = seconds
+    return metrics
+
+
+def compare(name, result, baseline, tolerance):
+    """Compares a result to its baseline.
+
+    Args::
+
+        name: the string scenario name
+        result: the dictionary from run_scenario
+        baseline: the dictionary from run_scenario to compare to, or None
+        tolerance: float fraction a metric can be worse by
+
+    Returns:
+        a tuple of (list of string lines, list of string regressed metrics)
+    """
+
+    lines = []
+    regressions = []
+    current = _flatten(result)
+
+    if baseline is None:
+        lines.append("{0}: no baseline".format(name))
+    elif any(result[key] != baseline.get(key) for key in SETTINGS):
+        lines.append("{0}: settings differ from the baseline, not "
+                     "compared".format(name))
+        baseline = None
+    else:
+        lines.append("{0}:".format(name))
+
+    previous = _flatten(baseline) if baseline is not None else {}
+
+    for metric in sorted(current):
+        value = current[metric]
+        higher_better, noise = METRICS.get(metric, (False, 0.2))
+        if metric not in previous:
+            lines.append("  {0:<32} {1:>12}".format(metric, value))
+            continue
+
+        before = previous[metric]
+        change = (value - before) / before if before else 0
+        worse = before - value if higher_better else value - before
+        regressed = worse > abs(before) * tolerance and worse > noise
+        if regressed:
+            regressions.append("{0} {1}".format(name, metric))
+
+        lines.append("  {0:<32} {1:>12} {2:>12} {3:>+8.1%}{4}".format(
+            metric,
+            value,
+            before,
+            change,
+            "  REGRESSED" if regressed else "",
+        ))
+
+    return lines, regressions
+
+
+def load_baseline(path):
+    """Returns the scenarios of a baseline file, or {} if there isn't one."""
+
+    try:
+        with open(path) as baseline_file:
+            return json.load(baseline_file)["scenarios"]
+    except (IOError, OSError):
+        return {}
+
+
+def save_baseline(path, results):
+    """Adds results to a baseline file, replacing any of the same name."""
+
+    scenarios = load_baseline(path)
+    scenarios.update(results)
+    with open(path, "w") as baseline_file:
+        json.dump(
+            {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "scenarios": scenarios,
+            },
+            baseline_file,
+            indent=4,
+            sort_keys=True,
+        )
+        baseline_file.write("\n")
+
+
+def parse_args(args=None):
+    """Parses the benchmark's arguments."""
+
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.fleet",
+        description="End-to-end benchmarks of Bladerunner against fake hosts.",
+    )
+    parser.add_argument(
+        "--hosts",
+        nargs="+",
+        default=["100", "1k", "10k"],
+        help="scenarios to run, as {0} or a number of hosts".format(
+            ", ".join(sorted(SCENARIOS, key=SCENARIOS.get))
+        ),
+    )
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="seconds before each command's output")
+    parser.add_argument("--output-size", type=int, default=1024,
+                        help="size of each command's output")
+    parser.add_argument("--threads", type=int, default=100,
+                        help="Bladerunner's threads")
+    parser.add_argument("--commands", nargs="+", default=["uptime"],
+                        help="commands to run on each host")
+    parser.add_argument("--baseline", default=BASELINE,
+                        help="baseline file to compare to")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="fraction each metric can be worse by")
+    parser.add_argument("--save", action="store_true",
+                        help="save the results to the baseline file")
+    parser.add_argument("--isolated", action="store_true",
+                        help=argparse.SUPPRESS)
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    """Runs the benchmarks and compares them to the baseline."""
+
+    options = parse_args(args)
+
+    if options.isolated:
+        print(json.dumps(run_scenario(
+            int(options.hosts[0]),
+            options.latency,
+            options.output_size,
+            options.threads,
+            options.commands,
+        )))
+        return
+
+    baseline = load_baseline(options.baseline)
+    results = {}
+    regressions = []
+    for name in options.hosts:
+        try:
+            hosts = SCENARIOS.get(name) or int(name)
+        except ValueError:
+            raise SystemExit("Unknown scenario: {0}".format(name))
+
+        result = run_isolated(hosts, options)
+        results[name] = result
+        lines, regressed = compare(
+            name,
+            result,
+            baseline.get(name),
+            options.tolerance,
+        )
+        regressions.extend(regressed)
+        print("\n".join(lines))
+        if result["failures"]:
+            print("  {0} of {1} hosts failed".format(
+                result["failures"],
+                hosts,
+            ))
+
+    if options.save:
+        save_baseline(options.baseline, results)
+        print("saved to {0}".format(options.baseline))
+    elif regressions:
+        raise SystemExit("regressed: {0}".format(", ".join(regressions)))
+
+
+if __name__ == "__main__":
+    main()
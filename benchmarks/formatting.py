@@ -0,0 +1,324 @@
+"""Micro-benchmarks of the formatting functions at fleet scale.
+
+Synthetic results are generated for each case, then each function is timed
+(the best of a few runs) and its peak memory measured with tracemalloc.
+Output is written to a sink which only counts it, so terminal I/O doesn't
+skew the numbers.
+
+Usage examples::
+
+    # every variant at 1k, 10k and 100k hosts
+    python -m benchmarks.formatting
+
+    # only ANSI laden and non-UTF-8 output at 10k hosts, saving the numbers
+    python -m benchmarks.formatting --hosts 10k --variants ansi bytes \\
+        --json formatting.json
+
+Variants:
+    plain: 5 line outputs, 90% of hosts share one of a few outputs
+    large: 50 line outputs
+    unique: every host's output is different
+    ansi: colour escape sequences throughout the output
+    bytes: latin-1 encoded lines, which aren't valid UTF-8
+"""
+
+
+from __future__ import division
+from __future__ import print_function
+
+import gc
+import sys
+import json
+import time
+import random
+import argparse
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None  # python 2
+
+from bladerunner.formatting import OutputSink, consolidate, csv_results
+from bladerunner.formatting import format_line, format_output, no_empties
+from bladerunner.formatting import pretty_results
+
+
+SCALES = {"1k": 1000, "10k": 10000, "100k": 100000}
+
+# variant => settings for synthetic_results
+VARIANTS = {
+    "plain": {},
+    "large": {"lines": 50},
+    "unique": {"duplication": 0},
+    "ansi": {"ansi": True},
+    "bytes": {"non_utf8": True},
+}
+
+COMMAND = "ls -l /srv/app"
+PASSWORD = "hunter7"
+
+WORDS = ["root", "app", "drwxr-xr-x", "-rw-r--r--", "4096", "Oct", "18",
+         "12:00", "config.yml", "releases", "current", "shared", "logs",
+         "error", "warning", "ok", "connected", "timeout", "pid", "1337"]
+
+ANSI_COLOURS = ["\x1b[01;34m", "\x1b[01;32m", "\x1b[0;31m", "\x1b[1;33m"]
+
+perf_counter = getattr(time, "perf_counter", time.time)
+
+
+class CountingSink(OutputSink):
+    """An OutputSink which only counts what's written."""
+
+    def __init__(self, options=None):
+        """Initializes the count."""
+
+        self.written = 0
+        super(CountingSink, self).__init__(options)
+
+    def flush(self):
+        """Counts and drops the buffer."""
+
+        self.written += self._buffered
+        self._buffer = []
+        self._buffered = 0
+
+
+def _line(rand, line_length, ansi, non_utf8):
+    """Returns a random line of output, as bytes."""
+
+    words = []
+    length = 0
+    while length < line_length:
+        word = rand.choice(WORDS)
+        if ansi and rand.random() < 0.3:
+            word = "{0}{1}\x1b[0m".format(rand.choice(ANSI_COLOURS), word)
+        words.append(word)
+        length += len(word) + 1
+
+    line = " ".join(words)
+    if non_utf8:
+        return "{0} café naïve".format(line).encode("latin-1")
+    return line.encode("utf-8")
+
+
+def synthetic_results(hosts, lines=5, line_length=60, duplication=0.9,
+                      ansi=False, non_utf8=False, seed=0):
+    """Generates raw and formatted results of a fleet.
+
+    Args::
+
+        hosts: the integer number of hosts
+        lines: integer lines of output per host
+        line_length: integer (approximate) characters per line
+        duplication: float fraction of hosts sharing one of a few outputs
+        ansi: boolean to add colour escape sequences to the output
+        non_utf8: boolean to encode the output as latin-1
+        seed: the random seed, so cases are repeatable
+
+    Returns:
+        a dictionary of raw (a list of each host's output as pexpect gives
+        it, bytes including the echoed command and the prompt), results (as
+        Bladerunner.run returns them) and options
+    """
+
+    rand = random.Random(seed)
+    options = {"password": PASSWORD, "width": 80, "style": 0}
+    shared = [
+        [_line(rand, line_length, ansi, non_utf8) for _ in range(lines)]
+        for _ in range(3)
+    ]
+
+    raw = []
+    results = []
+    for number in range(hosts):
+        if rand.random() < duplication:
+            output = rand.choice(shared)
+        else:
+            output = [
+                _line(rand, line_length, ansi, non_utf8)
+                for _ in range(lines)
+            ]
+        before = b"\r\n".join(
+            [COMMAND.encode("utf-8")] + output + [b"root@host:~# "]
+        )
+        raw.append(before)
+        results.append({
+            "name": "host{0:06d}.example.com".format(number),
+            "results": [(COMMAND, format_output(before, COMMAND, options))],
+        })
+
+    return {"raw": raw, "results": results, "options": options}
+
+
+def bench_format_output(case):
+    """Formats every host's raw output."""
+
+    for before in case["raw"]:
+        format_output(before, COMMAND, case["options"])
+
+
+def bench_format_line(case):
+    """Formats every line of every host's raw output."""
+
+    for before in case["raw"]:
+        for line in before.split(b"\r\n"):
+            format_line(line, case["options"])
+
+
+def bench_no_empties(case):
+    """Drops empty lines from every result, as the writers do."""
+
+    for result in case["results"]:
+        for _, output in result["results"]:
+            no_empties(output.split("\n"))
+
+
+def bench_consolidate(case):
+    """Groups the hosts with the same output."""
+
+    consolidate(case["results"])
+
+
+def bench_csv_results(case):
+    """Writes the results as CSV."""
+
+    csv_results(case["results"], dict(case["options"]), CountingSink())
+
+
+def bench_pretty_results(case):
+    """Writes the results in the pretty table."""
+
+    pretty_results(case["results"], dict(case["options"]), CountingSink())
+
+
+BENCHMARKS = [
+    ("format_output", bench_format_output),
+    ("format_line", bench_format_line),
+    ("no_empties", bench_no_empties),
+    ("consolidate", bench_consolidate),
+    ("csv_results", bench_csv_results),
+    ("pretty_results", bench_pretty_results),
+]
+
+
+def measure(function, case, repeat=3):
+    """Times a benchmark and measures its peak memory.
+
+    Args::
+
+        function: the benchmark function, called with the case
+        case: the dictionary from synthetic_results
+        repeat: integer number of times to time it, the best is used
+
+    Returns:
+        a tuple of (float seconds, integer peak bytes allocated or None)
+    """
+
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        started = perf_counter()
+        function(case)
+        times.append(perf_counter() - started)
+
+    peak = None
+    if tracemalloc is not None:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            function(case)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    return min(times), peak
+
+
+def parse_args(args=None):
+    """Parses the benchmark's arguments."""
+
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.formatting",
+        description="Micro-benchmarks of Bladerunner's formatting.",
+    )
+    parser.add_argument(
+        "--hosts",
+        nargs="+",
+        default=["1k", "10k", "100k"],
+        help="numbers of hosts, as {0} or a number".format(
+            ", ".join(sorted(SCALES, key=SCALES.get))
+        ),
+    )
+    parser.add_argument(
+        "--variants",
+        nargs="+",
+        default=sorted(VARIANTS),
+        choices=sorted(VARIANTS),
+        help="kinds of output to generate",
+    )
+    parser.add_argument(
+        "--functions",
+        nargs="+",
+        default=[name for name, _ in BENCHMARKS],
+        choices=[name for name, _ in BENCHMARKS],
+        help="functions to benchmark",
+    )
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="times to run each, the best is used")
+    parser.add_argument("--json", metavar="FILE",
+                        help="also write the results to a JSON file")
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    """Runs each function against each case, printing a table."""
+
+    options = parse_args(args)
+
+    try:
+        scales = [SCALES.get(scale) or int(scale) for scale in options.hosts]
+    except ValueError:
+        raise SystemExit("Invalid number of hosts: {0}".format(options.hosts))
+
+    if tracemalloc is None:
+        print("tracemalloc is unavailable, memory is not measured",
+              file=sys.stderr)
+
+    print("{0:<8} {1:>7} {2:<15} {3:>10} {4:>10} {5:>12}".format(
+        "variant", "hosts", "function", "seconds", "us/host", "peak KB",
+    ))
+
+    rows = []
+    for hosts in scales:
+        for variant in options.variants:
+            case = synthetic_results(hosts, **VARIANTS[variant])
+            for name, function in BENCHMARKS:
+                if name not in options.functions:
+                    continue
+                seconds, peak = measure(function, case, options.repeat)
+                rows.append({
+                    "variant": variant,
+                    "hosts": hosts,
+                    "function": name,
+                    "seconds": seconds,
+                    "peak_bytes": peak,
+                })
+                print("{0:<8} {1:>7} {2:<15} {3:>10.4f} {4:>10.2f} "
+                      "{5:>12}".format(
+                          variant,
+                          hosts,
+                          name,
+                          seconds,
+                          seconds / hosts * 1e6,
+                          "-" if peak is None else peak // 1024,
+                      ))
+                sys.stdout.flush()
+            del case
+
+    if options.json:
+        with open(options.json, "w") as json_file:
+            json.dump(rows, json_file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
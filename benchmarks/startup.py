@@ -0,0 +1,160 @@
+"""Import time and CLI startup budgets.
+
+Each case is run in a new interpreter a number of times, and the best wall
+time less that of an empty interpreter is compared to its budget. Each case
+is also checked for importing any of the heavy modules it shouldn't need.
+
+Usage examples::
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --runs 30 --scale 2
+
+The exit code is 1 if any case is over its budget or imports too much.
+"""
+
+
+from __future__ import print_function
+
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+from benchmarks.fleet import ROOT
+
+
+# modules only needed once hosts are being run on
+HEAVY = ["pexpect", "concurrent.futures", "six", "ipaddress", "inspect",
+         "sqlite3", "cProfile", "socket", "numpy"]
+
+# name => (python code, milliseconds budget, modules it shouldn't import)
+CASES = {
+    "import bladerunner": (
+        "import bladerunner",
+        10,
+        HEAVY + ["argparse", "bladerunner.formatting"],
+    ),
+    "import bladerunner.formatting": (
+        "import bladerunner.formatting",
+        40,
+        HEAVY + ["argparse"],
+    ),
+    "bladerunner --version": (
+        "import sys\n"
+        "sys.argv = ['bladerunner', '--version']\n"
+        "from bladerunner.cmdline import main\n"
+        "main()",
+        60,
+        HEAVY,
+    ),
+    "bladerunner --help": (
+        "import sys\n"
+        "sys.argv = ['bladerunner', '--help']\n"
+        "from bladerunner.cmdline import main\n"
+        "main()",
+        60,
+        HEAVY,
+    ),
+}
+
+# appended to a case's code to report which modules it imported
+CHECK_MODULES = """
+import sys as _sys, json as _json
+_sys.stderr.write(_json.dumps([_m for _m in {0!r} if _m in _sys.modules]))
+"""
+
+
+def best_time(code, runs):
+    """Returns the best wall time of running code in a new interpreter.
+
+    Args::
+
+        code: the string python code
+        runs: integer number of times to run it
+
+    Returns:
+        the float seconds of the fastest run
+    """
+
+    best = None
+    for _ in range(runs):
+        started = time.time()
+        subprocess.call(
+            [sys.executable, "-c", code],
+            cwd=ROOT,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        elapsed = time.time() - started
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def imported(code, modules):
+    """Returns which of the modules are imported by running code."""
+
+    wrapped = "try:\n{0}\nexcept SystemExit:\n    pass\n{1}".format(
+        "\n".join("    {0}".format(line) for line in code.splitlines()),
+        CHECK_MODULES.format(modules),
+    )
+    process = subprocess.Popen(
+        [sys.executable, "-c", wrapped],
+        cwd=ROOT,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    _, stderr = process.communicate()
+    return json.loads(stderr.decode("utf-8").strip().splitlines()[-1])
+
+
+def parse_args(args=None):
+    """Parses the benchmark's arguments."""
+
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.startup",
+        description="Import time and CLI startup budgets of Bladerunner.",
+    )
+    parser.add_argument("--runs", type=int, default=15,
+                        help="times to run each case, the best is used")
+    parser.add_argument("--scale", type=float, default=1,
+                        help="multiply the budgets, for slower machines")
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    """Runs each case and compares it to its budget."""
+
+    options = parse_args(args)
+    interpreter = best_time("pass", options.runs)
+    print("empty interpreter: {0:.1f}ms".format(interpreter * 1000))
+
+    failures = []
+    for name in sorted(CASES):
+        code, budget, heavy = CASES[name]
+        budget *= options.scale
+        overhead = (best_time(code, options.runs) - interpreter) * 1000
+        unexpected = imported(code, heavy)
+
+        status = "ok"
+        if overhead > budget:
+            status = "OVER BUDGET"
+        if unexpected:
+            status = "imports {0}".format(", ".join(unexpected))
+        if status != "ok":
+            failures.append(name)
+
+        print("{0:<32} {1:>7.1f}ms {2:>7.1f}ms  {3}".format(
+            name,
+            overhead,
+            budget,
+            status,
+        ))
+
+    if failures:
+        raise SystemExit("failed: {0}".format(", ".join(failures)))
+
+
+if __name__ == "__main__":
+    main()
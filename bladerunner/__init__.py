@@ -1,12 +1,53 @@
-"""Bladerunner top level module exports and version information."""
+"""Bladerunner top level module exports and version information.
+
+The exports are imported on first use, so importing bladerunner (or only its
+formatting, or the CLI for --version) doesn't pull in pexpect and friends.
+"""
+
+
+import sys
+import importlib
 
 
 __version__ = "4.1.9"
 __release_date__ = "November 27, 2015"
 
 
-from bladerunner.base import Bladerunner
-from bladerunner.interactive import BladerunnerInteractive
-from bladerunner.cmdline import cmdline_entry, cmdline_exit
-from bladerunner.progressbar import ProgressBar, get_term_width
-from bladerunner.formatting import consolidate, pretty_results, csv_results
+# exported name => the module it's imported from
+_EXPORTS = {
+    "Bladerunner": "bladerunner.base",
+    "BladerunnerInteractive": "bladerunner.interactive",
+    "cmdline_entry": "bladerunner.cmdline",
+    "cmdline_exit": "bladerunner.cmdline",
+    "ProgressBar": "bladerunner.progressbar",
+    "get_term_width": "bladerunner.progressbar",
+    "consolidate": "bladerunner.formatting",
+    "pretty_results": "bladerunner.formatting",
+    "csv_results": "bladerunner.formatting",
+}
+
+
+def __getattr__(name):
+    """Imports an export on first use, see PEP 562."""
+
+    try:
+        module = _EXPORTS[name]
+    except KeyError:
+        raise AttributeError("module 'bladerunner' has no attribute "
+                             "'{0}'".format(name))
+
+    value = getattr(importlib.import_module(module), name)
+    globals()[name] = value  # only import it once
+    return value
+
+
+def __dir__():
+    """Lists the exports along with what's already imported."""
+
+    return sorted(set(globals()) | set(_EXPORTS))
+
+
+if sys.version_info < (3, 7):
+    # modules can't have __getattr__ before 3.7, import everything up front
+    for _name in _EXPORTS:
+        __getattr__(_name)
@@ -0,0 +1,292 @@
+"""Numeric aggregation of command outputs across hosts.
+
+Uses NumPy when it's installed, otherwise falls back to pure python with the
+same results (pip install bladerunner[numpy] for large fleets).
+"""
+
+
+from __future__ import division
+
+import re
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from bladerunner.timings import percentile
+from bladerunner.formatting import OutputSink
+from bladerunner.progressbar import get_term_width
+
+
+NUMBER = re.compile("[-+]?\\d+(?:\\.\\d+)?(?:[eE][-+]?\\d+)?")
+PERCENTILES = [50, 90, 95, 99]
+
+# what Bladerunner gives in place of the output of commands which failed
+FAILED_OUTPUTS = [
+    "did not return after issuing: {0}",
+    "no output from: {0}",
+]
+
+
+def extract_value(output, pattern=None, field=None):
+    """Extracts a single number from a command's output.
+
+    Args::
+
+        output: the string output of a command
+        pattern: an optional compiled regex, its first group (or the whole
+                 match, if it has no groups) is searched for the number
+        field: an optional integer index of the whitespace separated field
+               to search for the number
+
+    Returns:
+        the float value, or None if there wasn't one
+    """
+
+    text = output
+    if field is not None:
+        try:
+            text = text.split()[field]
+        except IndexError:
+            return None
+
+    if pattern is not None:
+        match = pattern.search(text)
+        if match is None:
+            return None
+        text = match.group(1) if match.groups() else match.group(0)
+
+    match = NUMBER.search(text or "")
+    if match is None:
+        return None
+    return float(match.group(0))
+
+
+def extract_values(results, pattern=None, field=None, command=None):
+    """Extracts a number from each host's results.
+
+    The first command's output with a number in it is used for each host.
+    Failed logins, commands which timed out and commands without output are
+    skipped, their error messages aren't values.
+
+    Args::
+
+        results: the results from Bladerunner.run, or consolidated results
+        pattern: an optional regex string or compiled regex, see extract_value
+        field: an optional integer field index, see extract_value
+        command: an optional command string, only its output is used
+
+    Returns:
+        a tuple of (names, values, missing), names and values are lists of
+        the same length, missing is a list of names without a value
+    """
+
+    if pattern is not None and not hasattr(pattern, "search"):
+        pattern = re.compile(pattern)
+
+    names = []
+    values = []
+    missing = []
+    for server in results:
+        value = None
+        for server_command, output in server["results"]:
+            if command is not None and server_command != command:
+                continue
+            if server_command == "login" and len(server["results"]) == 1:
+                break  # couldn't connect or login
+            if any(output == failed.format(server_command)
+                   for failed in FAILED_OUTPUTS):
+                continue
+            value = extract_value(output, pattern, field)
+            if value is not None:
+                break
+
+        server_names = server.get("names") or [server["name"]]
+        if value is None:
+            missing.extend(server_names)
+        else:
+            names.extend(server_names)
+            values.extend([value] * len(server_names))
+
+    return names, values, missing
+
+
+def aggregate(names, values, bins=10):
+    """Calculates statistics over the values extracted from each host.
+
+    Outliers are values more than 1.5 times the interquartile range outside
+    of the first or third quartiles.
+
+    Args::
+
+        names: the list of host names
+        values: the list of float values, one for each host name
+        bins: integer number of histogram bins
+
+    Returns:
+        a dictionary with the keys count, min, max, mean, std, percentiles
+        (a dictionary of percentile => value), histogram (a list of (low,
+        high, count) tuples) and outliers (a list of (name, value) tuples).
+        Only count is included if there are no values.
+    """
+
+    if not values:
+        return {"count": 0}
+
+    if numpy is not None:
+        return _aggregate_numpy(names, values, bins)
+    return _aggregate_python(names, values, bins)
+
+
+def _aggregate_numpy(names, values, bins):
+    """Vectorized aggregate, with NumPy."""
+
+    array = numpy.asarray(values, dtype=numpy.float64)
+    quartiles = numpy.percentile(array, [25, 75])
+    percentiles = numpy.percentile(array, PERCENTILES)
+    counts, edges = numpy.histogram(array, bins=bins)
+
+    low, high = _outlier_limits(*quartiles)
+    outliers = numpy.nonzero((array < low) | (array > high))[0]
+
+    return {
+        "count": int(array.size),
+        "min": float(array.min()),
+        "max": float(array.max()),
+        "mean": float(array.mean()),
+        "std": float(array.std()),
+        "percentiles": dict(
+            (percentile, float(value))
+            for percentile, value in zip(PERCENTILES, percentiles)
+        ),
+        "histogram": [
+            (float(edges[index]), float(edges[index + 1]), int(count))
+            for index, count in enumerate(counts)
+        ],
+        "outliers": [(names[index], values[index]) for index in outliers],
+    }
+
+
+def _aggregate_python(names, values, bins):
+    """Pure python aggregate, for when NumPy isn't installed."""
+
+    ordered = sorted(values)
+    count = len(ordered)
+    mean = math.fsum(ordered) / count
+    std = math.sqrt(math.fsum((value - mean) ** 2 for value in ordered) /
+                    count)
+
+    low, high = _outlier_limits(
+        percentile(ordered, 25),
+        percentile(ordered, 75),
+    )
+
+    return {
+        "count": count,
+        "min": ordered[0],
+        "max": ordered[-1],
+        "mean": mean,
+        "std": std,
+        "percentiles": dict(
+            (rank, percentile(ordered, rank)) for rank in PERCENTILES
+        ),
+        "histogram": _histogram(ordered, bins),
+        "outliers": [
+            (name, value) for name, value in zip(names, values)
+            if value < low or value > high
+        ],
+    }
+
+
+def _outlier_limits(first_quartile, third_quartile):
+    """Returns the (low, high) values outside of which are outliers."""
+
+    spread = (third_quartile - first_quartile) * 1.5
+    return first_quartile - spread, third_quartile + spread
+
+
+def _histogram(ordered, bins):
+    """Equal width histogram of a sorted list, as NumPy does."""
+
+    low, high = ordered[0], ordered[-1]
+    if low == high:
+        low, high = low - 0.5, high + 0.5
+
+    width = (high - low) / bins
+    counts = [0] * bins
+    for value in ordered:
+        # the last bin includes the maximum value
+        counts[min(int((value - low) / width), bins - 1)] += 1
+
+    return [
+        (low + width * index, low + width * (index + 1), bin_count)
+        for index, bin_count in enumerate(counts)
+    ]
+
+
+def aggregate_results(results, options=None, sink=None):
+    """Prints statistics of a number extracted from each host's output.
+
+    Args::
+
+        results: the results from Bladerunner.run, or consolidated results
+        options: a dictionary with optional keys:
+            value_regex: regex to extract the number with, see extract_value
+            value_field: integer field index, see extract_value
+            width: integer fixed width for output
+    """
+
+    if options is None:
+        options = {}
+
+    names, values, missing = extract_values(
+        results,
+        pattern=options.get("value_regex"),
+        field=options.get("value_field"),
+    )
+    stats = aggregate(names, values)
+    width = options.get("width") or get_term_width()
+
+    with sink or OutputSink(options) as sink:
+        sink.write("count: {0} hosts ({1} without a value)".format(
+            stats["count"],
+            len(missing),
+        ), end="\n")
+
+        if stats["count"]:
+            sink.write(
+                "min: {min:g}  max: {max:g}  mean: {mean:g}  "
+                "std: {std:g}".format(**stats),
+                end="\n",
+            )
+            sink.write("  ".join(
+                "p{0}: {1:g}".format(percentile, stats["percentiles"][
+                    percentile])
+                for percentile in PERCENTILES
+            ), end="\n")
+
+            sink.write("histogram:", end="\n")
+            labels = [
+                "  [{0:g}, {1:g})".format(low, high)
+                for low, high, _ in stats["histogram"]
+            ]
+            label_width = max(len(label) for label in labels)
+            largest = max(count for _, _, count in stats["histogram"])
+            bar_width = max(width - label_width - len(str(largest)) - 3, 1)
+            for label, (_, _, count) in zip(labels, stats["histogram"]):
+                sink.write("{0} {1} {2}".format(
+                    label.ljust(label_width),
+                    "#" * int(round(count / largest * bar_width)),
+                    count,
+                ), end="\n")
+
+            sink.write("outliers: {0}".format(len(stats["outliers"])),
+                       end="\n")
+            for name, value in stats["outliers"]:
+                sink.write("  {0}: {1:g}".format(name, value), end="\n")
+
+        if missing:
+            sink.write("without a value: {0}".format(", ".join(
+                str(name) for name in missing)), end="\n")
@@ -0,0 +1,698 @@
+"""SQLite archive of Bladerunner runs, for querying across runs and hosts."""
+
+
+from __future__ import print_function
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+import datetime
+import threading
+
+from six.moves import queue
+
+from bladerunner.formatting import (
+    DEFAULT_ENCODING,
+    csv_results,
+    jsonl_results,
+    pretty_results,
+    stacked_results,
+)
+
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS runs (
+        id INTEGER PRIMARY KEY,
+        started REAL NOT NULL,
+        finished REAL,
+        commands TEXT
+    )""",
+    """CREATE TABLE IF NOT EXISTS hosts (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE
+    )""",
+    """CREATE TABLE IF NOT EXISTS commands (
+        id INTEGER PRIMARY KEY,
+        command TEXT NOT NULL UNIQUE
+    )""",
+    """CREATE TABLE IF NOT EXISTS outputs (
+        id INTEGER PRIMARY KEY,
+        digest TEXT NOT NULL UNIQUE,
+        output TEXT NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS run_hosts (
+        run_id INTEGER NOT NULL REFERENCES runs (id),
+        host_id INTEGER NOT NULL REFERENCES hosts (id),
+        error INTEGER,
+        started REAL,
+        elapsed REAL,
+        PRIMARY KEY (run_id, host_id)
+    )""",
+    """CREATE TABLE IF NOT EXISTS results (
+        run_id INTEGER NOT NULL REFERENCES runs (id),
+        host_id INTEGER NOT NULL REFERENCES hosts (id),
+        position INTEGER NOT NULL,
+        command_id INTEGER NOT NULL REFERENCES commands (id),
+        output_id INTEGER NOT NULL REFERENCES outputs (id),
+        PRIMARY KEY (run_id, host_id, position)
+    )""",
+    "CREATE INDEX IF NOT EXISTS runs_started ON runs (started)",
+    """CREATE INDEX IF NOT EXISTS results_host_command
+        ON results (host_id, command_id, run_id)""",
+    """CREATE INDEX IF NOT EXISTS results_command_run
+        ON results (command_id, run_id)""",
+    "CREATE INDEX IF NOT EXISTS results_output ON results (output_id)",
+]
+
+# full text search on the outputs, in order of preference
+FTS_SCHEMA = [
+    """CREATE VIRTUAL TABLE outputs_fts USING fts5 (
+        output, content='outputs', content_rowid='id'
+    )""",
+    "CREATE VIRTUAL TABLE outputs_fts USING fts4 (output)",
+]
+
+TIME_FORMATS = ["%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"]
+
+# seconds to wait on other writers' locks, for runs archiving concurrently
+DEFAULT_TIMEOUT = 30
+
+
+def connect(path, timeout=DEFAULT_TIMEOUT):
+    """Opens the archive database, creating the schema if required.
+
+    Args::
+
+        path: the string file path of the sqlite database
+        timeout: float seconds to wait for another connection's lock
+
+    Returns:
+        a tuple of (sqlite3 connection, boolean if full text search exists)
+    """
+
+    conn = sqlite3.connect(path, timeout=timeout)
+    for statement in SCHEMA:
+        conn.execute(statement)
+
+    fts = _has_fts(conn)
+    if not fts:
+        for statement in FTS_SCHEMA:
+            try:
+                conn.execute(statement)
+            except sqlite3.OperationalError:
+                pass  # not compiled into this sqlite
+            else:
+                fts = True
+                break
+
+    conn.commit()
+    return conn, fts
+
+
+def _has_fts(conn):
+    """Returns a boolean of if the outputs_fts table exists."""
+
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'outputs_fts'"
+    ).fetchone() is not None
+
+
+def output_digest(output):
+    """Returns the content address of an output string."""
+
+    return hashlib.sha1(output.encode(DEFAULT_ENCODING)).hexdigest()
+
+
+class ArchiveWriter(object):
+    """Writes a single run into the archive from a background thread.
+
+    The write_result method can be passed as one of Bladerunner's
+    result_callbacks. Results are queued and inserted in batches by the
+    writer thread, which owns the only connection to the database. If the
+    writer fails, the error is raised as a SystemExit from the next
+    write_result or close.
+
+    Args::
+
+        path: the string file path of the sqlite database
+        commands: an optional list of the commands being run
+        batch_size: integer maximum number of hosts to insert at once
+    """
+
+    def __init__(self, path, commands=None, batch_size=500):
+        """Starts the writer thread, which records the start of the run."""
+
+        self.path = path
+        self.batch_size = batch_size
+        self.run_id = None
+        self._queue = queue.Queue()
+        self._ready = threading.Event()
+        self._error = None
+        self._thread = threading.Thread(target=self._run, args=(commands,))
+        self._thread.daemon = True
+        self._thread.start()
+
+        self._ready.wait()
+        if self._error is not None:
+            raise SystemExit("Could not open archive: {0}".format(
+                self._error))
+
+        super(ArchiveWriter, self).__init__()
+
+    def write_result(self, server, info=None):
+        """Queues a single host's results to be archived.
+
+        Args::
+
+            server: the results dictionary for a single host
+            info: optional dictionary from Bladerunner's result_callbacks
+        """
+
+        self._raise_error()
+        self._queue.put((server, info or {}))
+
+    def close(self):
+        """Waits for everything queued to be written and closes the run."""
+
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self._raise_error()
+
+    def _raise_error(self):
+        """Exits if the writer thread failed."""
+
+        if self._error is not None:
+            raise SystemExit("Could not write archive: {0}".format(
+                self._error))
+
+    def __enter__(self):
+        """Context management, the run is closed on exit."""
+
+        return self
+
+    def __exit__(self, *args, **kwargs):
+        """Closes the run."""
+
+        self.close()
+
+    def _run(self, commands):
+        """The writer thread, inserts batches until the sentinel is seen."""
+
+        try:
+            conn, fts = connect(self.path)
+            self.run_id = conn.execute(
+                "INSERT INTO runs (started, commands) VALUES (?, ?)",
+                (time.time(), json.dumps(commands)),
+            ).lastrowid
+            conn.commit()
+        except sqlite3.Error as error:
+            self._error = error
+            return
+        finally:
+            self._ready.set()
+
+        ids = {"hosts": {}, "commands": {}, "outputs": {}}
+        finished = False
+        try:
+            while not finished:
+                batch = [self._queue.get()]
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+
+                if None in batch:
+                    finished = True
+                    batch = [item for item in batch if item is not None]
+
+                with conn:
+                    self._insert(conn, fts, ids, batch)
+
+            with conn:
+                conn.execute(
+                    "UPDATE runs SET finished = ? WHERE id = ?",
+                    (time.time(), self.run_id),
+                )
+        except Exception as error:
+            # locked or full databases, reported by write_result and close
+            self._error = error
+        finally:
+            conn.close()
+
+    def _insert(self, conn, fts, ids, batch):
+        """Inserts a batch of (server, info) tuples in one transaction."""
+
+        run_hosts = []
+        results = []
+        for server, info in batch:
+            host_id = _get_id(conn, ids["hosts"], "hosts", "name",
+                              str(server["name"]))
+            run_hosts.append((
+                self.run_id,
+                host_id,
+                info.get("error"),
+                info.get("started"),
+                info.get("elapsed"),
+            ))
+            for position, (command, output) in enumerate(server["results"]):
+                results.append((
+                    self.run_id,
+                    host_id,
+                    position,
+                    _get_id(conn, ids["commands"], "commands", "command",
+                            command),
+                    _get_output_id(conn, fts, ids["outputs"], output),
+                ))
+
+        conn.executemany(
+            "INSERT OR REPLACE INTO run_hosts VALUES (?, ?, ?, ?, ?)",
+            run_hosts,
+        )
+        conn.executemany(
+            "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+            results,
+        )
+
+
+def _get_id(conn, cache, table, column, value):
+    """Returns the id of a unique value in a table, inserting it if needed.
+
+    Args::
+
+        conn: the sqlite3 connection
+        cache: a dictionary of value => id for this table
+        table: the string table name
+        column: the string name of the unique column
+        value: the value to find the id of
+
+    Returns:
+        the integer id of the row
+    """
+
+    if value not in cache:
+        row = conn.execute(
+            "SELECT id FROM {0} WHERE {1} = ?".format(table, column),
+            (value,),
+        ).fetchone()
+        if row is None:
+            cache[value] = conn.execute(
+                "INSERT INTO {0} ({1}) VALUES (?)".format(table, column),
+                (value,),
+            ).lastrowid
+        else:
+            cache[value] = row[0]
+    return cache[value]
+
+
+def _get_output_id(conn, fts, cache, output):
+    """Returns the id of an output, inserting it and indexing if it's new.
+
+    Args::
+
+        conn: the sqlite3 connection
+        fts: boolean if the outputs_fts table exists
+        cache: a dictionary of digest => id for the outputs table
+        output: the string output of a command
+
+    Returns:
+        the integer id of the output
+    """
+
+    digest = output_digest(output)
+    if digest not in cache:
+        row = conn.execute(
+            "SELECT id FROM outputs WHERE digest = ?",
+            (digest,),
+        ).fetchone()
+        if row is None:
+            output_id = conn.execute(
+                "INSERT INTO outputs (digest, output) VALUES (?, ?)",
+                (digest, output),
+            ).lastrowid
+            if fts:
+                conn.execute(
+                    "INSERT INTO outputs_fts (rowid, output) VALUES (?, ?)",
+                    (output_id, output),
+                )
+            cache[digest] = output_id
+        else:
+            cache[digest] = row[0]
+    return cache[digest]
+
+
+class Archive(object):
+    """Read access to the archive. Results are returned in the same structure
+    as Bladerunner.run, so they can be passed to consolidate or any of the
+    output functions.
+
+    Args:
+        path: the string file path of the sqlite database
+    """
+
+    def __init__(self, path):
+        """Opens the database."""
+
+        self.conn, self.fts = connect(path)
+
+        super(Archive, self).__init__()
+
+    def close(self):
+        """Closes the database."""
+
+        self.conn.close()
+
+    def runs(self):
+        """Returns a list of dictionaries describing every archived run."""
+
+        rows = self.conn.execute(
+            """SELECT runs.id, runs.started, runs.finished, runs.commands,
+               COUNT(run_hosts.host_id) FROM runs
+               LEFT JOIN run_hosts ON run_hosts.run_id = runs.id
+               GROUP BY runs.id ORDER BY runs.id"""
+        )
+        return [
+            {
+                "id": run_id,
+                "started": started,
+                "finished": finished,
+                "commands": json.loads(commands or "null"),
+                "hosts": hosts,
+            }
+            for run_id, started, finished, commands, hosts in rows
+        ]
+
+    def find_run(self, run=None):
+        """Finds the id of a run.
+
+        Args:
+            run: an integer run id, a string time (the latest run started at
+                 or before it), or None for the latest run
+
+        Returns:
+            the integer run id, raises ValueError if there's no such run
+        """
+
+        if run is None:
+            row = self.conn.execute("SELECT MAX(id) FROM runs").fetchone()
+        elif isinstance(run, int) or str(run).isdigit():
+            row = self.conn.execute(
+                "SELECT id FROM runs WHERE id = ?",
+                (int(run),),
+            ).fetchone()
+        else:
+            row = self.conn.execute(
+                "SELECT MAX(id) FROM runs WHERE started <= ?",
+                (parse_time(run),),
+            ).fetchone()
+
+        if row is None or row[0] is None:
+            raise ValueError("No such run: {0}".format(run))
+        return row[0]
+
+    def results(self, run=None, hosts=None, commands=None, search=None):
+        """Returns the results of a run, optionally filtered.
+
+        Args::
+
+            run: the run to use, see find_run
+            hosts: an optional list of host names to include
+            commands: an optional list of commands to include
+            search: an optional full text search on the outputs
+
+        Returns:
+            a list of dictionaries with two keys: name, and results
+        """
+
+        run_id = self.find_run(run)
+        where = ["results.run_id = ?"]
+        params = [run_id]
+        where, params = self._filters(where, params, hosts, commands)
+
+        if search:
+            if self.fts:
+                where.append(
+                    "results.output_id IN (SELECT rowid FROM outputs_fts "
+                    "WHERE outputs_fts MATCH ?)"
+                )
+                params.append(search)
+            else:
+                where.append("outputs.output LIKE ? ESCAPE '\\'")
+                params.append("%{0}%".format(
+                    search.replace("\\", "\\\\")
+                    .replace("%", "\\%")
+                    .replace("_", "\\_")
+                ))
+
+        return self._select(where, params)
+
+    def changed(self, since, run=None, hosts=None, commands=None):
+        """Returns the results of hosts whose output changed between runs.
+
+        Hosts which weren't in the earlier run are included as changed.
+
+        Args::
+
+            since: the earlier run to compare against, see find_run
+            run: the later run, see find_run
+            hosts: an optional list of host names to include
+            commands: an optional list of commands to compare
+
+        Returns:
+            a list of dictionaries with two keys: name, and results. Only the
+            changed commands of the later run are included
+        """
+
+        old_id = self.find_run(since)
+        new_id = self.find_run(run)
+
+        where = [
+            "results.run_id = ?",
+            """NOT EXISTS (SELECT 1 FROM results AS old
+               WHERE old.run_id = ? AND old.host_id = results.host_id
+               AND old.position = results.position
+               AND old.command_id = results.command_id
+               AND old.output_id = results.output_id)""",
+        ]
+        params = [new_id, old_id]
+        where, params = self._filters(where, params, hosts, commands)
+        return self._select(where, params)
+
+    @staticmethod
+    def _filters(where, params, hosts, commands):
+        """Adds the host and command filters to the where clauses."""
+
+        for column, values in (("hosts.name", hosts),
+                               ("commands.command", commands)):
+            if values:
+                where.append("{0} IN ({1})".format(
+                    column,
+                    ", ".join("?" * len(values)),
+                ))
+                params.extend(values)
+        return where, params
+
+    def _select(self, where, params):
+        """Selects results, grouping them into result dictionaries by host."""
+
+        rows = self.conn.execute(
+            """SELECT hosts.name, commands.command, outputs.output
+               FROM results
+               JOIN hosts ON hosts.id = results.host_id
+               JOIN commands ON commands.id = results.command_id
+               JOIN outputs ON outputs.id = results.output_id
+               JOIN run_hosts ON run_hosts.run_id = results.run_id
+                AND run_hosts.host_id = results.host_id
+               WHERE {0}
+               ORDER BY run_hosts.rowid, results.position""".format(
+                " AND ".join(where)),
+            params,
+        )
+
+        results = []
+        for name, command, output in rows:
+            if not results or results[-1]["name"] != name:
+                results.append({"name": name, "results": []})
+            results[-1]["results"].append((command, output))
+        return results
+
+
+def parse_time(value):
+    """Converts a local time string into seconds since the epoch.
+
+    Args:
+        value: string time in one of the TIME_FORMATS
+
+    Returns:
+        float seconds since the epoch, raises ValueError on unknown formats
+    """
+
+    for time_format in TIME_FORMATS:
+        try:
+            parsed = datetime.datetime.strptime(value, time_format)
+        except ValueError:
+            continue
+        if time_format == "%Y-%m-%d":
+            # a date alone includes the whole day
+            parsed += datetime.timedelta(days=1, microseconds=-1)
+        return time.mktime(parsed.timetuple()) + parsed.microsecond / 1e6
+
+    raise ValueError("Unknown time format: {0}".format(value))
+
+
+def setup_query_argparse(args):
+    """Sets up the parser's arguments for bladerunner-query."""
+
+    parser = argparse.ArgumentParser(
+        prog="bladerunner-query",
+        description="Query the results archived with bladerunner --archive.",
+    )
+
+    parser.add_argument(dest="archive", metavar="DB")
+    parser.add_argument(
+        "--runs",
+        dest="list_runs",
+        action="store_true",
+        default=False,
+        help="list the archived runs",
+    )
+    parser.add_argument(
+        "--run",
+        dest="run",
+        metavar="RUN",
+        help="run id or local time (YYYY-MM-DD [HH:MM[:SS]]), default latest",
+    )
+    parser.add_argument(
+        "--since",
+        dest="since",
+        metavar="RUN",
+        help="only show output which changed since this run id or time",
+    )
+    parser.add_argument(
+        "--host",
+        dest="hosts",
+        metavar="HOST",
+        nargs="+",
+        help="only include these hosts",
+    )
+    parser.add_argument(
+        "--command",
+        dest="commands",
+        metavar="COMMAND",
+        nargs="+",
+        help="only include these commands",
+    )
+    parser.add_argument(
+        "--search",
+        dest="search",
+        metavar="TEXT",
+        help="full text search on the output",
+    )
+    parser.add_argument(
+        "--csv",
+        dest="csv",
+        action="store_true",
+        default=False,
+        help="output in CSV format",
+    )
+    parser.add_argument(
+        "--flat",
+        dest="stacked",
+        action="store_true",
+        default=False,
+        help="output with a flattened/stacked style",
+    )
+    parser.add_argument(
+        "--jsonl",
+        dest="jsonl",
+        action="store_true",
+        default=False,
+        help="output JSON Lines",
+    )
+    parser.add_argument(
+        "--style",
+        dest="style",
+        metavar="INT",
+        type=int,
+        default=0,
+        help="output style (0=default, 1=ASCII, 2=double, 3=rounded)",
+    )
+    parser.add_argument(
+        "--width",
+        dest="width",
+        metavar="INT",
+        type=int,
+        default=None,
+        help="the maximum width to display results in",
+    )
+
+    return parser.parse_args(args)
+
+
+def query_main():
+    """Main entry point for bladerunner-query."""
+
+    settings = setup_query_argparse(sys.argv[1:])
+    if not os.path.isfile(settings.archive):
+        # sqlite would create an empty database rather than fail
+        raise SystemExit("No archive found at {0}".format(settings.archive))
+
+    archive = None
+    try:
+        archive = Archive(settings.archive)
+        if settings.list_runs:
+            for run in archive.runs():
+                print("{id}\t{start}\t{end}\t{hosts} hosts\t{cmds}".format(
+                    id=run["id"],
+                    start=_format_time(run["started"]),
+                    end=_format_time(run["finished"]),
+                    hosts=run["hosts"],
+                    cmds=json.dumps(run["commands"]),
+                ))
+            return
+
+        if settings.since:
+            results = archive.changed(
+                settings.since,
+                settings.run,
+                settings.hosts,
+                settings.commands,
+            )
+        else:
+            results = archive.results(
+                settings.run,
+                settings.hosts,
+                settings.commands,
+                settings.search,
+            )
+    except (ValueError, sqlite3.Error) as error:
+        raise SystemExit(str(error))
+    finally:
+        if archive is not None:
+            archive.close()
+
+    if not results:
+        raise SystemExit("No results found")
+
+    options = {"style": settings.style, "width": settings.width}
+    if settings.jsonl:
+        jsonl_results(results, options)
+    elif settings.csv:
+        csv_results(results, options)
+    elif settings.stacked:
+        stacked_results(results, options)
+    else:
+        pretty_results(results, options)
+
+
+def _format_time(timestamp):
+    """Formats seconds since the epoch as a local time string, or '-'."""
+
+    if timestamp is None:
+        return "-"
+    return time.strftime(TIME_FORMATS[0], time.localtime(timestamp))
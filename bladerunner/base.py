@@ -8,11 +8,15 @@ import math
 import time
 import codecs
 import getpass
-import inspect
 import pexpect
 import threading
 from concurrent.futures import ThreadPoolExecutor
 
+from bladerunner.trace import Tracer
+from bladerunner.metrics import Metrics, parse_statsd
+from bladerunner.teardown import Teardown
+from bladerunner.timings import Timings, monotonic
+from bladerunner.dashboard import Dashboard
 from bladerunner.progressbar import ProgressBar
 from bladerunner.interactive import BladerunnerInteractive
 from bladerunner.networking import can_resolve, ips_in_subnet
@@ -43,6 +47,14 @@ class Bladerunner(object):
         style: integer for outputting. Between 0-3 are pretty, or CSV (0)
         csv_char: string character to use for CSV results (",")
         progressbar: boolean to declare if we want a progress display (False)
+        dashboard: boolean to show rates, phases and errors with the progress
+                   display (False)
+        keep_results: boolean to collect every host's results from run (True)
+        timings: boolean to add the seconds spent in each phase and command
+                 to each host's results, under a 'timings' key (False)
+        trace: string file path to write a Chrome trace of the run to (None)
+        metrics_file: string file path to write Prometheus metrics to (None)
+        statsd: string host[:port] to send StatsD metrics to over UDP (None)
         unix_line_endings: force sending LF as line endings for commands
         windows_line_endings: force sending CRLF as line endings for commands
         ssh: string executable to use for creating ssh connections (ssh)
@@ -58,12 +70,15 @@ class Bladerunner(object):
             "cmd_timeout": 20,
             "csv_char": ",",
             "debug": False,
+            "dashboard": False,
             "delay": None,
             "extra_prompts": [],
             "jump_host": None,
             "jump_password": None,
             "jump_user": None,
             "jump_port": 22,
+            "keep_results": True,
+            "metrics_file": None,
             "output_file": False,
             "password": None,
             "password_safety": False,
@@ -72,9 +87,12 @@ class Bladerunner(object):
             "second_password": None,
             "ssh": "ssh",
             "ssh_key": None,
+            "statsd": None,
             "style": 0,
             "threads": 100,
             "timeout": 20,
+            "timings": False,
+            "trace": None,
             "unix_line_endings": False,
             "username": None,
             "width": None,
@@ -104,6 +122,13 @@ class Bladerunner(object):
         self.commands = None
         self.commands_on_servers = None
         self.interactive_hosts = {}
+        self.result_callbacks = []
+        self.phase_callbacks = []
+        self.timings = None
+        self.tracer = None
+        self.metrics = None
+        self.command_timeouts = {}  # hostname => commands which timed out
+        self.teardown = Teardown(threads=self.options["threads"])
 
         if not self.options["windows_line_endings"] and \
            not self.options["unix_line_endings"] and hasattr(os, "uname") and \
@@ -135,34 +160,97 @@ class Bladerunner(object):
             commands = [commands]
 
         servers = self._prep_servers(commands, servers, commands_on_servers)
+        started = monotonic()
 
-        if self.options["progressbar"]:
+        if self.options["progressbar"] and self.options["dashboard"]:
+            self.progress = Dashboard(len(servers), self.options, self.errors)
+            self.phase_callbacks.append(self.progress.phase_changed)
+            self.result_callbacks.append(self.progress.host_finished)
+        elif self.options["progressbar"]:
             self.progress = ProgressBar(len(servers), self.options)
+
+        if self.options["progressbar"]:
             self.progress.setup()
+            self.progress.start()
 
-        if self.options["jump_host"]:
-            jumpuser = self.options["jump_user"] or self.options["username"]
-            (self.sshc, error_code) = self.connect(
-                self.options["jump_host"],
-                jumpuser,
-                self.options["jump_pass"],
-                self.options["jump_port"],
-            )
-            if error_code < 0:
-                message = int(math.fabs(error_code)) - 1
-                raise SystemExit("Jumpbox Error: {0}".format(
-                    self.errors[message]))
+        try:
+            if self.options["timings"]:
+                self.timings = Timings()
+                self.phase_callbacks.append(self.timings.phase_changed)
+
+            if self.options["trace"]:
+                self.tracer = Tracer()
+                self.phase_callbacks.append(self.tracer.phase_changed)
+
+            if self.options["metrics_file"] or self.options["statsd"]:
+                self.metrics = Metrics(statsd=(
+                    self.options["statsd"] and
+                    parse_statsd(self.options["statsd"])
+                ))
+                self.phase_callbacks.append(self.metrics.phase_changed)
+                self.result_callbacks.append(self.metrics.host_finished)
 
-        if self.options["delay"] or self.options["jump_host"]:
-            results = self._run_serial(servers)
-        else:
-            results = self._run_parallel(servers)
+            if self.options["jump_host"]:
+                jumpuser = (
+                    self.options["jump_user"] or self.options["username"]
+                )
+                (self.sshc, error_code) = self.connect(
+                    self.options["jump_host"],
+                    jumpuser,
+                    self.options["jump_pass"],
+                    self.options["jump_port"],
+                )
+                self._phase(self.options["jump_host"], None)
+                if error_code < 0:
+                    message = int(math.fabs(error_code)) - 1
+                    raise SystemExit("Jumpbox Error: {0}".format(
+                        self.errors[message]))
+
+            if self.options["delay"] or self.options["jump_host"]:
+                results = self._run_serial(servers)
+            else:
+                results = self._run_parallel(servers)
 
-        if self.options["jump_host"]:
-            self.close(self.sshc, True)
+            if self.options["jump_host"]:
+                self.close(self.sshc, True)
 
-        if self.options["progressbar"]:
-            self.progress.clear()
+            # reap anything left over from failed logins, but leave interactive
+            self.teardown.close_all(exclude=[
+                session.sshr for session in self.interactive_hosts.values()
+            ])
+        finally:
+            # stop drawing and feeding this run's collectors, even on errors
+            if self.options["progressbar"]:
+                self.progress.clear()
+
+            if self.options["progressbar"] and self.options["dashboard"]:
+                _discard(self.phase_callbacks, self.progress.phase_changed)
+                _discard(self.result_callbacks, self.progress.host_finished)
+
+            if self.options["timings"] and self.timings is not None:
+                _discard(self.phase_callbacks, self.timings.phase_changed)
+
+            if self.options["trace"] and self.tracer is not None:
+                _discard(self.phase_callbacks, self.tracer.phase_changed)
+
+            if self.options["metrics_file"] or self.options["statsd"]:
+                if self.metrics is not None:
+                    _discard(self.phase_callbacks, self.metrics.phase_changed)
+                    _discard(self.result_callbacks,
+                             self.metrics.host_finished)
+                    # failed runs are exported too, for monitoring them
+                    self.metrics.run_finished(
+                        len(servers),
+                        monotonic() - started,
+                    )
+                    self.metrics.close()
+                    if self.options["metrics_file"]:
+                        self.metrics.write_textfile(
+                            self.options["metrics_file"],
+                        )
+
+        if self.options["trace"]:
+            self.tracer.write(self.options["trace"])
 
         return results
 
@@ -266,8 +354,14 @@ class Bladerunner(object):
 
         max_threads = self.options["threads"]
         with ThreadPoolExecutor(max_workers=max_threads) as executor:
-            for result_dict in executor.map(self._run_single, servers):
-                results.append(result_dict)
+            try:
+                for result_dict in executor.map(self._run_single, servers):
+                    if self.options["keep_results"]:
+                        results.append(result_dict)
+            except KeyboardInterrupt:
+                # kill the children now, or the pool waits on every worker
+                self.teardown.interrupt()
+                raise
 
         return results
 
@@ -278,7 +372,7 @@ class Bladerunner(object):
             servers: the list of servers to run
         """
 
-        results = []
+        started = time.time()
         sshr, error_code = self.connect(
             servers[0],
             self.options["username"],
@@ -287,21 +381,24 @@ class Bladerunner(object):
         )
         if error_code < 0:
             message = int(math.fabs(error_code)) - 1
-            results.append({
+            first = {
                 "name": servers[0],
                 "results": [("login", self.errors[message])],
-            })
-            return results + self._run_serial(
-                servers[1:],
-            )
+            }
+            run_rest = self._run_serial
         else:
-            results.append(self.send_commands(sshr, servers[0]))
+            first = self.send_commands(sshr, servers[0])
+            self._phase(servers[0], "closing")
             self.close(sshr, not self.options["jump_host"])
             sshr = None
             if self.options["progressbar"]:
                 self.progress.update()
+            run_rest = self._run_parallel_no_check
 
-            return results + self._run_parallel_no_check(servers[1:])
+        self._phase(servers[0], None)
+        first = self._host_finished(first, started, error_code)
+        results = [first] if self.options["keep_results"] else []
+        return results + run_rest(servers[1:])
 
     def _run_serial(self, servers):
         """Runs commands on servers in serial after jumpbox."""
@@ -310,12 +407,15 @@ class Bladerunner(object):
         for server in servers:
             if self.options["delay"] and servers.index(server) > 0:
                 time.sleep(self.options["delay"])
-            results.append(self._run_single(server))
+            result_dict = self._run_single(server)
+            if self.options["keep_results"]:
+                results.append(result_dict)
         return results
 
     def _run_single(self, server):
         """Runs commands on a single server."""
 
+        started = time.time()
         (sshr, error_code) = self.connect(
             server,
             self.options["username"],
@@ -330,14 +430,74 @@ class Bladerunner(object):
             }
         else:
             results = self.send_commands(sshr, server)
+            self._phase(server, "closing")
             self.close(sshr, not self.options["jump_host"])
             sshr = None
 
         if self.options["progressbar"]:
             self.progress.update()
 
+        self._phase(server, None)
+        return self._host_finished(results, started, error_code)
+
+    def _host_finished(self, results, started, error_code):
+        """Passes a single host's results to each of the result_callbacks.
+
+        Callbacks are called from the worker threads as each host completes,
+        so they must be thread safe. They're called with the results and a
+        dictionary of the host's error code, start time, elapsed seconds and
+        the number of commands which timed out.
+
+        Args::
+
+            results: the results dictionary for a single host
+            started: float time.time() the host was started at
+            error_code: the integer error code from connect, 0 on success
+
+        Returns:
+            the results dictionary, unchanged
+        """
+
+        if self.options["timings"]:
+            results["timings"] = self.timings.pop(results["name"])
+
+        timeouts = 0
+        if self.command_timeouts:
+            timeouts = self.command_timeouts.pop(results["name"], 0)
+
+        info = {
+            "error": min(error_code, 0),
+            "started": started,
+            "elapsed": time.time() - started,
+            "timeouts": timeouts,
+        }
+        for callback in self.result_callbacks:
+            callback(results, info)
+
         return results
 
+    def _phase(self, server, phase):
+        """Passes a host's change of phase to each of the phase_callbacks.
+
+        The phases are resolving, connecting, logging in, running and
+        closing, in that order, then None once the host is finished. Hosts
+        which fail skip the remaining phases. Callbacks are called from the
+        worker threads with the host, phase and float monotonic time of the
+        change (see bladerunner.timings.monotonic).
+
+        Args::
+
+            server: the string hostname
+            phase: the string name of the phase starting, or None when done
+        """
+
+        if not self.phase_callbacks:
+            return
+
+        now = monotonic()
+        for callback in self.phase_callbacks:
+            callback(server, phase, now)
+
     def _send_cmd(self, command, server):
         """Internal method to send a single command to the pexpect object.
 
@@ -408,6 +568,9 @@ class Bladerunner(object):
             format_output if it can find a new prompt, or -1 on error
         """
 
+        if self.options["trace"] and self.tracer is not None:
+            self.tracer.instant("prompt guess: {0}".format(command))
+
         # do /not/ format_line the prompt, it could contain special characters
         try:
             new_prompt = output.splitlines()[-1]
@@ -477,6 +640,8 @@ class Bladerunner(object):
                 results: a list of tuples with each command and its result
         """
 
+        self._phase(hostname, "running")
+
         results = {"name": hostname}
         command_results = []
 
@@ -485,14 +650,27 @@ class Bladerunner(object):
         else:
             commands = self.commands
 
+        timeouts = 0
         for command in commands:
+            started = monotonic()
             command_result = self._send_cmd(command, server)
+            seconds = monotonic() - started
+            if self.options["timings"]:
+                self.timings.command_finished(hostname, command, seconds)
+            if self.options["trace"] and self.tracer is not None:
+                self.tracer.command_finished(
+                    hostname,
+                    command,
+                    started,
+                    seconds,
+                )
             if not command_result or command_result == "\n":
                 command_results.append((
                     command,
                     "no output from: {0}".format(command),
                 ))
             elif command_result == -1:
+                timeouts += 1
                 command_results.append((
                     command,
                     "did not return after issuing: {0}".format(command),
@@ -500,6 +678,8 @@ class Bladerunner(object):
             else:
                 command_results.append((command, command_result))
 
+        if timeouts:
+            self.command_timeouts[hostname] = timeouts
         results["results"] = command_results
         return results
 
@@ -549,16 +729,21 @@ class Bladerunner(object):
 
         Returns:
             a pexpect object that can be passed back here or to send_commands()
+            and the error code. Children of failed logins are closed
         """
 
-        if self.options["ssh"] == "ssh" and not can_resolve(target):
-            return (None, -3)
+        if self.options["ssh"] == "ssh":
+            self._phase(target, "resolving")
+            if not can_resolve(target):
+                return (None, -3)
 
         ssh_cmd = self._build_ssh_command(target, username, port)
+        self._phase(target, "connecting")
 
         if not self.sshc:
             try:
                 sshr = pexpect.spawn(ssh_cmd, timeout=self.options["timeout"])
+                self.teardown.track(sshr)
 
                 if self.options["debug"]:
                     sshr.logfile_read = FakeStdOut
@@ -573,18 +758,26 @@ class Bladerunner(object):
                 if self.options["jump_host"]:
                     self.sshc = sshr
 
-                return self._multipass(sshr, password, login_response)
+                self._phase(target, "logging in")
+                result = self._multipass(sshr, password, login_response)
             except (pexpect.TIMEOUT, pexpect.EOF):
                 if sshr.isalive():
                     # logged in with no passwd and an unknown prompt
-                    return self._try_for_unmatched_prompt(
+                    result = self._try_for_unmatched_prompt(
                         sshr,
                         sshr.before,
                         ssh_cmd,
                         _from_login=True,
                     )
                 else:
-                    return (None, -7)
+                    result = (None, -7)
+
+            if result[0] is None:
+                # don't hold the pty open for the rest of the run
+                if self.sshc is sshr:
+                    self.sshc = None
+                self.teardown.close(sshr)
+            return result
         else:
             self.sshc.sendline(ssh_cmd)
 
@@ -612,6 +805,7 @@ class Bladerunner(object):
                     self.send_interrupt(self.sshc)
                     return (None, -7)
 
+            self._phase(target, "logging in")
             return self._multipass(self.sshc, password, login_response)
 
     def _multipass(self, sshc, passwords, login_response):
@@ -718,6 +912,9 @@ class Bladerunner(object):
             None: the sshc maintains its state and should be ready for use
         """
 
+        if self.options["trace"] and self.tracer is not None:
+            self.tracer.instant("interrupt")
+
         try:
             sshc.sendline(six.unichr(0x003))
             sshc.expect(
@@ -765,6 +962,9 @@ class Bladerunner(object):
             None: the sshc will be at the jumpbox, or the connection is closed
         """
 
+        if sshc.closed is True:
+            return  # already closed and reaped by the teardown
+
         try:
             sshc.sendline("exit")
         except OSError:
@@ -772,6 +972,7 @@ class Bladerunner(object):
 
         if terminate:
             sshc.terminate()
+            self.teardown.release(sshc)
         else:
             try:
                 sshc.expect(
@@ -841,13 +1042,6 @@ class Bladerunner(object):
                 if con:
                     self.interactive_hosts[con.server] = con
 
-    def _end_interactive_session(self, host):
-        """Ends the interactive session on a single host."""
-
-        session = self.interactive_hosts.pop(host, None)
-        if session is not None:
-            session.end()
-
     def end_interactive(self, hosts=None):
         """Ends an interactive stored session.
 
@@ -858,9 +1052,16 @@ class Bladerunner(object):
         hosts = list(self.interactive_hosts.keys()) if hosts is None else hosts
         hosts = self._prep_interactive_hosts(hosts)
 
-        with ThreadPoolExecutor(max_workers=self.options["threads"]) as execor:
-            for host in hosts:
-                execor.submit(self._end_interactive_session, host)
+        sessions = []
+        for host in hosts:
+            session = self.interactive_hosts.pop(host, None)
+            if session is not None:
+                sessions.append(session)
+
+        # close all of the children at once, then end() has nothing to wait on
+        self.teardown.close_all([session.sshr for session in sessions])
+        for session in sessions:
+            session.end()
 
     def run_interactive(self, command, hosts=None, print_results=True):
         """Runs a single command interactively on a list of hostnames.
@@ -937,7 +1138,9 @@ class Bladerunner(object):
             "and returned as a group once all runs are complete."
         )
 
-        # signature check the passed in function.
+        # signature check the passed in function. inspect is slow to import
+        # and only needed here, so it's imported on first use
+        import inspect
         if hasattr(inspect, "getfullargspec"):  # newer pythons
             func_sig = inspect.getfullargspec(function)
             if len(func_sig.args) != 1 or func_sig.varargs or \
@@ -1005,3 +1208,10 @@ def _set_shells(options):
         options["extra_prompts"] = [options["extra_prompts"]]
 
     return options
+
+
+def _discard(callbacks, callback):
+    """Removes callback from the list of callbacks, if it's in there."""
+
+    if callback in callbacks:
+        callbacks.remove(callback)
@@ -3,15 +3,21 @@
 
 import io
 import os
+import re
 import sys
 import getpass
 import argparse
 
-from bladerunner import Bladerunner, __version__, __release_date__
+from bladerunner import __version__, __release_date__
+from bladerunner.normalizers import DEFAULT_NORMALIZERS, RegexMask
 from bladerunner.formatting import (
+    CsvWriter,
+    JsonlWriter,
     csv_results,
+    jsonl_results,
     pretty_results,
     stacked_results,
+    summary_results,
     DEFAULT_ENCODINGS,
 )
 
@@ -40,14 +46,50 @@ def cmdline_entry():
         settings.username = settings.username[0]
     if settings.jump_user:
         settings.jump_user = settings.jump_user[0]
+    if settings.archive:
+        settings.archive = settings.archive[0]
+    if settings.trace:
+        settings.trace = settings.trace[0]
+    if settings.metrics_file:
+        settings.metrics_file = settings.metrics_file[0]
+    if settings.statsd:
+        settings.statsd = settings.statsd[0]
+    if settings.watch is not None:
+        settings.watch = settings.watch[0]
+        if settings.watch <= 0:
+            raise SystemExit("--watch needs a positive number of seconds")
+    if settings.daemon_socket:
+        settings.daemon_socket = settings.daemon_socket[0]
+        settings.daemon = True
+    if settings.value_regex is not None or settings.value_field is not None:
+        settings.aggregate = True
+    if settings.value_regex is not None:
+        try:
+            re.compile(settings.value_regex)
+        except re.error as error:
+            raise SystemExit("Invalid --value-regex: {0}".format(error))
+    if settings.summary_hosts:
+        settings.summary_hosts = settings.summary_hosts[0]
+        settings.summary = settings.summary or 10
     if settings.debug is None:
         settings.debug = True
+    if settings.jsonl_groups:
+        settings.jsonl = True
 
     options = convert_to_options(settings)
 
-    if settings.printCSV or settings.csv_char != ",":
+    if settings.masks or settings.normalize:
+        options["normalizers"] = [RegexMask(mask) for mask in settings.masks]
+        if settings.normalize:
+            options["normalizers"].extend(DEFAULT_NORMALIZERS)
+
+    if settings.printCSV or settings.csv_char != "," or settings.csv_stream:
         options['style'] = -1
 
+    if (settings.csv_stream or settings.jsonl) and not settings.output_file:
+        # rows are printed as hosts complete, don't mix in the progressbar
+        options["progressbar"] = False
+
     if settings.settingsDebug:
         raise SystemExit(str(options))
 
@@ -56,25 +98,154 @@ def cmdline_entry():
     return commands, settings.servers, options
 
 
-def cmdline_exit(results, options):
-    """A buffer for selecting the correct output function and exiting.
+def cmdline_exit(results, options, timings=None):
+    """Outputs the results with cmdline_output, then exits.
 
     Args::
 
         results: the results dictionary from Bladerunner.run
-        options: the options dictionary, uses 'style' and 'stacked' keys
+        options: the options dictionary, see cmdline_output
+        timings: the optional Timings object from the run, summarized after
+                 the results
     """
 
-    if options.get("stacked"):
+    cmdline_output(results, options, timings)
+    raise SystemExit
+
+
+def cmdline_output(results, options, timings=None):
+    """A buffer for selecting the correct output function.
+
+    Args::
+
+        results: the results dictionary from Bladerunner.run
+        options: the options dictionary, uses 'aggregate', 'style', 'stacked'
+                 and 'summary' keys
+        timings: the optional Timings object from the run, summarized after
+                 the results
+    """
+
+    if options.get("aggregate"):
+        from bladerunner.aggregate import aggregate_results
+        aggregate_results(results, options)
+    elif options.get("summary") and 0 <= options["style"] <= 3:
+        summary_results(results, options)
+    elif options.get("stacked"):
         stacked_results(results, options)
     elif options["style"] < 0 or options["style"] > 3:
         csv_results(results, options)
     else:
         pretty_results(results, options)
 
+    if timings is not None:
+        from bladerunner.timings import timings_results
+        timings_results(timings, options)
+
+
+def cmdline_stream(runner, commands, servers, options):
+    """Runs with each host written out as it completes, then exits.
+
+    Args::
+
+        runner: the Bladerunner object to run with
+        commands: the list of commands to run
+        servers: the list of servers to run on
+        options: the options dictionary, uses 'jsonl' to select JSON Lines
+                 output over CSV, and the keys used by each writer
+    """
+
+    writer_class = JsonlWriter if options.get("jsonl") else CsvWriter
+    with writer_class(options, stream=True) as writer:
+        runner.result_callbacks.append(writer.write_result)
+        runner.run(commands, servers)
+
+    if runner.timings is not None:
+        from bladerunner.timings import timings_results
+        timings_results(runner.timings, options)
+
     raise SystemExit
 
 
+def cmdline_daemon(commands, servers, options):
+    """Runs on bladerunnerd's warm sessions, then outputs results and exits.
+
+    Results are output as they would be without the daemon. Timings, traces,
+    metrics and the progressbar are only available running locally.
+
+    Args::
+
+        commands: the list of commands to run
+        servers: the list of servers to run on
+        options: the options dictionary, uses 'daemon_socket' for the path
+                 of bladerunnerd's socket, and the keys used by the output
+    """
+
+    from bladerunner.daemon import run_job
+    from bladerunner.archive import ArchiveWriter
+
+    callbacks = []
+    archive = None
+    if options.get("archive"):
+        archive = ArchiveWriter(options["archive"], commands)
+        callbacks.append(archive.write_result)
+
+    def callback(server):
+        """Passes each host's results to the callbacks."""
+
+        for host_callback in callbacks:
+            host_callback(server)
+
+    try:
+        if options.get("csv_stream") or options.get("jsonl"):
+            writer_class = JsonlWriter if options.get("jsonl") else CsvWriter
+            with writer_class(options, stream=True) as writer:
+                callbacks.append(writer.write_result)
+                run_job(options.get("daemon_socket"), commands, servers,
+                        options, callback)
+            raise SystemExit
+
+        results = run_job(options.get("daemon_socket"), commands, servers,
+                          options, callback)
+    finally:
+        if archive is not None:
+            archive.close()
+
+    cmdline_exit(results, options)
+
+
+def cmdline_watch(commands, servers, options):
+    """Re-runs the commands on warm sessions until interrupted.
+
+    Every options['watch'] seconds the commands are run again, only the
+    hosts whose output changed since the last time are output.
+
+    Args::
+
+        commands: the list of commands to run
+        servers: the list of servers to run on
+        options: the options dictionary, uses 'watch' and 'jsonl', and the
+                 keys used by cmdline_output
+    """
+
+    import time
+    from bladerunner.base import Bladerunner
+    from bladerunner.watch import Watch, watch_header
+
+    watch = Watch(Bladerunner(options), commands, servers)
+    try:
+        while True:
+            started = time.time()
+            changed = watch.poll()
+            watch_header(watch, changed, options["watch"], options)
+            if changed and options.get("jsonl"):
+                jsonl_results(changed, options)
+            elif changed:
+                cmdline_output(changed, options)
+            time.sleep(max(0, options["watch"] - (time.time() - started)))
+    finally:
+        watch.close()
+
+
 def convert_to_options(settings):
     """Converts argparse's namespace into a dictionary. Removes temp keys."""
 
@@ -94,16 +265,34 @@ def convert_to_options(settings):
         "ssh_key": settings.ssh_key,
         "style": settings.style,
         "csv_char": settings.csv_char,
+        "csv_stream": settings.csv_stream,
+        "archive": settings.archive,
+        "jsonl": settings.jsonl,
+        "jsonl_groups": settings.jsonl_groups,
+        "keep_results": not (settings.csv_stream or settings.jsonl),
         "threads": settings.threads,
         "stacked": settings.stacked,
+        "summary": settings.summary,
+        "aggregate": settings.aggregate,
+        "value_regex": settings.value_regex,
+        "value_field": settings.value_field,
+        "summary_hosts": settings.summary_hosts,
         "width": settings.printFixed or settings.width,
         "extra_prompts": settings.extra_prompts or [],
         "progressbar": True,
+        "dashboard": settings.dashboard,
         "port": settings.port,
         "unix_line_endings": settings.unix_line_endings,
         "windows_line_endings": settings.windows_line_endings,
         "timeout": settings.timeout,
+        "timings": settings.timings,
+        "trace": settings.trace,
+        "metrics_file": settings.metrics_file,
+        "statsd": settings.statsd,
         "cmd_timeout": settings.cmd_timeout,
+        "daemon": settings.daemon,
+        "daemon_socket": settings.daemon_socket,
+        "watch": settings.watch,
     }
 
 
@@ -117,11 +306,16 @@ Note:
   <COMMAND> becomes optional if a command --file is used
   <HOST> becomes optional if a --host-file is supplied
 Options:
+  -A --archive=<db>\t\t\tAlso store the results in a SQLite database
   -a --ascii\t\t\t\tUse ASCII output with normal results (same as --style=1)
+     --aggregate\t\t\tShow statistics of a number in each host's output
   -c --command-timeout=<seconds>\tTimeout between commands (default: 20s)
   -T --connection-timeout=<seconds>\tSpecify the SSH timeout (default: 20s)
   -C --csv\t\t\t\tOutput in CSV format, not grouped by similarity
   -E --csv-separator=<char>\t\tSpecify the seperation character with CSV output
+     --daemon\t\t\t\tRun on bladerunnerd's warm sessions instead
+     --daemon-socket=<path>\t\tThe bladerunnerd socket (implies --daemon)
+     --dashboard\t\t\tShow hosts/sec, ETA, phases and errors while running
      --debug=[int]\t\t\tDebug to stdout, with optional int of ssh debug level
   -e --end\t\t\t\tSignal the end of flags, useful with --debug or -m ordering
   -f --file=<file>\t\t\tLoad commands from a file
@@ -129,25 +323,40 @@ Options:
   -x --fixed\t\t\t\tUse a fixed 80 character width for output
   -h --help\t\t\t\tThis help screen
   -H --host-file=<file>\t\t\tLoad hosts from a file
+     --jsonl\t\t\t\tOutput JSON Lines as each host completes
+     --jsonl-groups\t\t\tAlso output the --jsonl results grouped at the end
   -j --jumpbox=<host>\t\t\tUse a jumpbox to intermediary the targets
   -P --jumpbox-password=<password>\tSeparate jumpbox password (-P to prompt)
   -J --jumpbox-port=<port>\t\tUse a non-standard SSH port for the jumpbox
   -U --jumpbox-username=<username>\tJumpbox user name (default: {username})
+  -M --mask=<regex> [regex] ...\t\tIgnore matches when grouping results
   -m --match=<pattern> [pattern] ...\tMatch additional shell prompts
+     --metrics-file=<file>\t\tWrite Prometheus metrics of the run to a file
   -n --no-password\t\t\tNo password prompt
   -N --no-password-check\t\tDon't check if the first login succeeded
+     --normalize\t\t\tGroup results ignoring host names, times and PIDs
   -o --output-file=<file>\t\tAppend the output to a file rather than stdout
   -p --password=<password>\t\tSupply the host password on the command line
+     --profile\t\t\t\tProfile bladerunner itself, report it to stderr
   -D --port\t\t\t\tUse a non non-standard SSH port for the target hosts
   -s --second-password=<password>\tSupply a second password (-s to prompt)
   -S --style=<int>\t\t\tOutput style (0=default, 1=ASCII, 2=double, 3=rounded)
      --ssh=<cmd>\t\t\tSSH command to use (default: ssh)
+     --statsd=<host[:port]>\t\tSend StatsD metrics as hosts complete
   -k --ssh-key=<file>\t\t\tUse a non-default ssh key
+     --stream\t\t\t\tWrite CSV output as each host completes
+     --summary=[int]\t\t\tOnly show the largest groups (default: 10)
+     --summary-hosts=<file>\t\tWrite every group's hosts to a file
   -t --threads=<int>\t\t\tMaximum concurrent threads (default: 100)
   -d --time-delay=<seconds>\t\tAdd a time delay between hosts (default: 0s)
+     --timings\t\t\t\tSummarize the time spent in each phase and command
+     --trace=<file>\t\t\tWrite a Chrome trace timeline of the run to a file
   -X --unix-line-endings\t\tForce the use of \\n for newlines
   -u --username=<username>\t\tUse a different user name (default: {username})
+     --value-field=<int>\t\t\tAggregate the number in this output field
+     --value-regex=<regex>\t\tAggregate the number this regex matches
   -v --version\t\t\t\tDisplays version information
+     --watch=<seconds>\t\t\tRe-run every interval, output only what changed
   -w --width=<int>\t\t\tSpecify the maximum width to display results in
   -W --windows-line-endings\t\tForce the use of \\r\\n for newlines
 """.format(
@@ -318,6 +527,22 @@ def setup_argparse(args):
         formatter_class=argparse.RawDescriptionHelpFormatter,
     )
 
+    parser.add_argument(
+        "--aggregate",
+        dest="aggregate",
+        action="store_true",
+        default=False,
+    )
+
+    parser.add_argument(
+        "--archive",
+        "-A",
+        dest="archive",
+        metavar="DB",
+        nargs=1,
+        default=False,
+    )
+
     parser.add_argument(
         "--ascii",
         "-a",
@@ -364,6 +589,28 @@ def setup_argparse(args):
         default=",",
     )
 
+    parser.add_argument(
+        "--daemon",
+        dest="daemon",
+        action="store_true",
+        default=False,
+    )
+
+    parser.add_argument(
+        "--daemon-socket",
+        dest="daemon_socket",
+        metavar="PATH",
+        nargs=1,
+        default=None,
+    )
+
+    parser.add_argument(
+        "--dashboard",
+        dest="dashboard",
+        action="store_true",
+        default=False,
+    )
+
     parser.add_argument(
         "--debug",
         dest="debug",
@@ -425,6 +672,20 @@ def setup_argparse(args):
         default=False,
     )
 
+    parser.add_argument(
+        "--jsonl",
+        dest="jsonl",
+        action="store_true",
+        default=False,
+    )
+
+    parser.add_argument(
+        "--jsonl-groups",
+        dest="jsonl_groups",
+        action="store_true",
+        default=False,
+    )
+
     parser.add_argument(
         "--jumpbox",
         "-j",
@@ -459,6 +720,15 @@ def setup_argparse(args):
         default=22,
     )
 
+    parser.add_argument(
+        "--mask",
+        "-M",
+        dest="masks",
+        metavar="REGEX",
+        nargs="+",
+        default=[],
+    )
+
     parser.add_argument(
         "--match",
         "-m",
@@ -467,6 +737,14 @@ def setup_argparse(args):
         nargs="+",
     )
 
+    parser.add_argument(
+        "--metrics-file",
+        dest="metrics_file",
+        metavar="FILE",
+        nargs=1,
+        default=None,
+    )
+
     parser.add_argument(
         "--no-password",
         "-n",
@@ -475,6 +753,13 @@ def setup_argparse(args):
         default=True,
     )
 
+    parser.add_argument(
+        "--normalize",
+        dest="normalize",
+        action="store_true",
+        default=False,
+    )
+
     parser.add_argument(
         "--output-file",
         "-o",
@@ -516,6 +801,13 @@ def setup_argparse(args):
         default=False,
     )
 
+    parser.add_argument(
+        "--profile",
+        dest="profile",
+        action="store_true",
+        default=False,
+    )
+
     parser.add_argument(
         "--second-password",
         dest="second_password",
@@ -547,6 +839,21 @@ def setup_argparse(args):
         nargs=1,
     )
 
+    parser.add_argument(
+        "--statsd",
+        dest="statsd",
+        metavar="HOST[:PORT]",
+        nargs=1,
+        default=None,
+    )
+
+    parser.add_argument(
+        "--stream",
+        dest="csv_stream",
+        action="store_true",
+        default=False,
+    )
+
     parser.add_argument(
         "--style",
         "-S",
@@ -556,6 +863,24 @@ def setup_argparse(args):
         default=0,
     )
 
+    parser.add_argument(
+        "--summary",
+        dest="summary",
+        metavar="INT",
+        nargs="?",
+        type=int,
+        const=10,
+        default=False,
+    )
+
+    parser.add_argument(
+        "--summary-hosts",
+        dest="summary_hosts",
+        metavar="FILE",
+        nargs=1,
+        default=False,
+    )
+
     parser.add_argument(
         "--time-delay",
         "-d",
@@ -576,6 +901,21 @@ def setup_argparse(args):
         default=100,
     )
 
+    parser.add_argument(
+        "--timings",
+        dest="timings",
+        action="store_true",
+        default=False,
+    )
+
+    parser.add_argument(
+        "--trace",
+        dest="trace",
+        metavar="FILE",
+        nargs=1,
+        default=None,
+    )
+
     parser.add_argument(
         "--username",
         "-u",
@@ -600,6 +940,21 @@ def setup_argparse(args):
         default=True,
     )
 
+    parser.add_argument(
+        "--value-field",
+        dest="value_field",
+        metavar="INT",
+        type=int,
+        default=None,
+    )
+
+    parser.add_argument(
+        "--value-regex",
+        dest="value_regex",
+        metavar="REGEX",
+        default=None,
+    )
+
     parser.add_argument(
         "--version",
         "-v",
@@ -615,6 +970,15 @@ def setup_argparse(args):
         default=False,
     )
 
+    parser.add_argument(
+        "--watch",
+        dest="watch",
+        metavar="SECONDS",
+        type=float,
+        nargs=1,
+        default=None,
+    )
+
     parser.add_argument(
         "--width",
         "-w",
@@ -642,11 +1006,50 @@ def setup_argparse(args):
 
 
 def main():
+    """Main entry point, runs under the profiler with --profile."""
+
+    if "--profile" not in sys.argv[1:]:
+        return run_main()
+
+    from bladerunner.profiling import Profiler
+    profiler = Profiler()
+    profiler.start()
+    try:
+        return run_main()
+    finally:
+        profiler.stop()
+        profiler.report(sys.stderr)
+
+
+def run_main():
     """Main run loop, except KeyboardInterrupts."""
 
+    runner = None
     try:
         commands, servers, options = cmdline_entry()
-        results = Bladerunner(options).run(commands, servers)
-        cmdline_exit(results, options)
+        if options.get("watch"):
+            cmdline_watch(commands, servers, options)
+        if options.get("daemon"):
+            cmdline_daemon(commands, servers, options)
+
+        # imported here so --help and --version don't wait for them
+        from bladerunner.base import Bladerunner
+        from bladerunner.archive import ArchiveWriter
+
+        runner = Bladerunner(options)
+        archive = None
+        if options.get("archive"):
+            archive = ArchiveWriter(options["archive"], commands)
+            runner.result_callbacks.append(archive.write_result)
+        try:
+            if options.get("csv_stream") or options.get("jsonl"):
+                cmdline_stream(runner, commands, servers, options)
+            results = runner.run(commands, servers)
+        finally:
+            if archive is not None:
+                archive.close()
+        cmdline_exit(results, options, runner.timings)
     except KeyboardInterrupt:
+        if runner is not None:
+            runner.teardown.interrupt()
         raise SystemExit("interrupted")
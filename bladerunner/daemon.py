@@ -0,0 +1,552 @@
+"""bladerunnerd, keeping warm ssh sessions to run jobs sent over a socket.
+
+The daemon keeps a logged in BladerunnerInteractive session open to each
+host it has run on, so repeated jobs only pay for their commands' round
+trips. Sessions left idle are ended after a timeout.
+
+Jobs are sent over a Unix domain socket as a single line of JSON::
+
+    {"commands": ["uptime"], "servers": ["host1"], "options": {...}}
+
+Each host's results are sent back as a line of JSON as soon as it finishes,
+in the same shape as Bladerunner.run's results, then a last line of either
+{"done": true, "hosts": int, "elapsed": float} or {"error": "message"}.
+
+The socket is only accessible by the user running the daemon, anyone who
+can connect to it can run commands on its warm sessions. It's kept in a
+directory only that user can write to, and the client checks who owns the
+socket and the daemon listening on it before sending any passwords.
+
+Usage example::
+
+    $ bladerunnerd &
+    $ bladerunner --daemon uptime host1 host2 host3
+"""
+
+
+from __future__ import print_function
+
+import os
+import sys
+import json
+import stat
+import time
+import errno
+import socket
+import signal
+import struct
+import argparse
+import tempfile
+import threading
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver  # python 2
+
+
+# options sent with jobs, everything else only matters to the client
+JOB_OPTIONS = [
+    "cmd_timeout",
+    "debug",
+    "extra_prompts",
+    "jump_host",
+    "jump_pass",
+    "jump_password",
+    "jump_port",
+    "jump_user",
+    "password",
+    "port",
+    "second_password",
+    "ssh",
+    "ssh_key",
+    "threads",
+    "timeout",
+    "unix_line_endings",
+    "username",
+    "windows_line_endings",
+]
+
+# options which change how a session connects, sessions are kept per host
+# and combination of these. The rest of the job's options are applied to
+# existing sessions for each job
+SESSION_OPTIONS = [
+    "jump_host",
+    "jump_port",
+    "jump_user",
+    "port",
+    "ssh",
+    "ssh_key",
+    "unix_line_endings",
+    "username",
+    "windows_line_endings",
+]
+
+DEFAULT_IDLE_TIMEOUT = 600
+
+
+def default_socket_path():
+    """Returns the user's default socket path, in a directory of their own."""
+
+    directory = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return os.path.join(
+        directory,
+        "bladerunnerd-{0}".format(os.getuid()),
+        "bladerunnerd.sock",
+    )
+
+
+def _check_socket_directory(path, create=False):
+    """Exits unless the socket's directory can only be written to by us.
+
+    Otherwise another user could replace the socket with their own, and
+    collect the passwords sent with jobs.
+
+    Args::
+
+        path: the string path of the socket
+        create: boolean to create the directory, mode 0700, if it's missing
+    """
+
+    directory = os.path.dirname(os.path.abspath(path))
+    if create and not os.path.lexists(directory):
+        os.mkdir(directory, 0o700)
+
+    try:
+        details = os.lstat(directory)
+    except OSError as error:
+        raise SystemExit("Could not connect to bladerunnerd at {0}: "
+                         "{1}".format(path, error))
+
+    if not stat.S_ISDIR(details.st_mode) or details.st_uid != os.getuid():
+        raise SystemExit("bladerunnerd socket directory {0} is not a "
+                         "directory owned by this user".format(directory))
+    if details.st_mode & 0o022:
+        raise SystemExit("bladerunnerd socket directory {0} is writable by "
+                         "other users".format(directory))
+
+
+def _check_socket_owner(path, client):
+    """Exits unless the socket, and the daemon on it, belong to this user.
+
+    Args::
+
+        path: the string path of the socket
+        client: the socket object connected to it
+    """
+
+    details = os.lstat(path)
+    if not stat.S_ISSOCK(details.st_mode) or details.st_uid != os.getuid():
+        raise SystemExit("bladerunnerd socket {0} is not a socket owned by "
+                         "this user".format(path))
+
+    peer_credentials = getattr(socket, "SO_PEERCRED", None)  # linux only
+    if peer_credentials is not None:
+        _, uid, _ = struct.unpack("3i", client.getsockopt(
+            socket.SOL_SOCKET,
+            peer_credentials,
+            struct.calcsize("3i"),
+        ))
+        if uid != os.getuid():
+            raise SystemExit("bladerunnerd on {0} is running as another "
+                             "user (uid {1})".format(path, uid))
+
+
+class Session(object):
+    """A warm session to a host, used by one job at a time.
+
+    Args:
+        interactive: the BladerunnerInteractive session, not yet connected
+    """
+
+    def __init__(self, interactive):
+        """Initializes the session's lock and idle time."""
+
+        self.interactive = interactive
+        self.lock = threading.Lock()
+        self.last_used = time.time()
+        self.ended = False
+
+        super(Session, self).__init__()
+
+    def run(self, commands, options):
+        """Runs commands in the session, connecting first if needed.
+
+        Args::
+
+            commands: a list of string commands
+            options: the job's options, applied to the session's runner
+
+        Returns:
+            a list of (command, output) tuples, or None if it couldn't connect
+        """
+
+        runner = self.interactive.bladerunner
+        for key, value in options.items():
+            if key not in SESSION_OPTIONS:
+                runner.options[key] = value
+
+        if not self.interactive.sshr:
+            if not self.interactive.connect(status_return=True):
+                return None
+
+        results = []
+        for command in commands:
+            output = self.interactive.run(command)
+            if not output or output == "\n":
+                output = "no output from: {0}".format(command)
+            results.append((command, output))
+
+        self.last_used = time.time()
+        return results
+
+    def end(self):
+        """Ends the session, it can't be used again."""
+
+        self.ended = True
+        self.interactive.end()
+
+
+class SessionPool(object):
+    """The warm sessions of the daemon, by host and connection options.
+
+    Args:
+        idle_timeout: float seconds a session can be unused before it ends
+    """
+
+    def __init__(self, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+        """Initializes an empty pool."""
+
+        self.idle_timeout = idle_timeout
+        self.sessions = {}  # (host, SESSION_OPTIONS values) => Session
+        self._lock = threading.Lock()
+
+        super(SessionPool, self).__init__()
+
+    def session(self, host, options):
+        """Returns the session to a host, creating it if needed.
+
+        Args::
+
+            host: the string hostname
+            options: the job's options dictionary
+        """
+
+        # imported here so the client side of this module stays light
+        from bladerunner.base import Bladerunner
+
+        key = (host, json.dumps(
+            [options.get(option) for option in SESSION_OPTIONS]
+        ))
+        with self._lock:
+            if key not in self.sessions:
+                runner = Bladerunner(dict(options, progressbar=False))
+                self.sessions[key] = Session(
+                    runner.interactive(host, connect=False)
+                )
+            return self.sessions[key]
+
+    def run_host(self, host, commands, options):
+        """Runs commands on a host, as a single host of Bladerunner.run.
+
+        Args::
+
+            host: the string hostname
+            commands: a list of string commands
+            options: the job's options dictionary
+
+        Returns:
+            the results dictionary of the host
+        """
+
+        while True:
+            session = self.session(host, options)
+            with session.lock:
+                if session.ended:
+                    continue  # reaped while waiting for it, make a new one
+
+                results = session.run(commands, options)
+                if results is None:
+                    error = session.interactive.error or -1
+                    results = [(
+                        "login",
+                        session.interactive.bladerunner.errors[abs(error) - 1],
+                    )]
+                    self.remove(session)
+
+                return {"name": host, "results": results}
+
+    def remove(self, session):
+        """Removes and ends a session."""
+
+        with self._lock:
+            for key, value in list(self.sessions.items()):
+                if value is session:
+                    del self.sessions[key]
+        session.end()
+
+    def reap(self, now=None):
+        """Ends the sessions idle for longer than the idle timeout.
+
+        Args:
+            now: the float time.time() to check against
+        """
+
+        now = time.time() if now is None else now
+        with self._lock:
+            idle = [
+                session for session in self.sessions.values()
+                if now - session.last_used > self.idle_timeout
+            ]
+
+        for session in idle:
+            if session.lock.acquire(False):  # otherwise it's in use
+                try:
+                    self.remove(session)
+                finally:
+                    session.lock.release()
+
+    def close(self):
+        """Ends every session."""
+
+        with self._lock:
+            sessions = list(self.sessions.values())
+            self.sessions = {}
+        for session in sessions:
+            session.end()
+
+
+class JobHandler(socketserver.StreamRequestHandler):
+    """Handles a single job from a client connection."""
+
+    def handle(self):
+        """Reads the job, then streams back each host's results."""
+
+        write_lock = threading.Lock()
+
+        def send(message):
+            """Sends a line of JSON to the client, from any thread."""
+
+            line = "{0}\n".format(json.dumps(message)).encode("utf-8")
+            with write_lock:
+                self.wfile.write(line)
+                self.wfile.flush()
+
+        try:
+            job = json.loads(self.rfile.readline().decode("utf-8"))
+            commands = job["commands"]
+            servers = job["servers"]
+            options = job.get("options") or {}
+        except (ValueError, KeyError, TypeError) as error:
+            send({"error": "Invalid job: {0}".format(error)})
+            return
+
+        try:
+            self.server.run_job(commands, servers, options, send)
+        except socket.error as error:
+            if error.errno != errno.EPIPE:
+                raise  # the client went away, otherwise let it be logged
+
+
+class BladerunnerDaemon(socketserver.ThreadingMixIn,
+                        socketserver.UnixStreamServer):
+    """The daemon's socket server, running each job in its own thread.
+
+    Args::
+
+        path: the string path of the Unix socket to listen on
+        idle_timeout: float seconds sessions can be unused before they end
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+        """Binds the socket, only accessible by this user."""
+
+        self.path = path
+        self.pool = SessionPool(idle_timeout)
+        self._stopped = threading.Event()
+
+        _check_socket_directory(path, create=True)
+        _remove_stale_socket(path)
+        umask = os.umask(0o177)
+        try:
+            socketserver.UnixStreamServer.__init__(self, path, JobHandler)
+        finally:
+            os.umask(umask)
+
+    def run_job(self, commands, servers, options, send):
+        """Runs a job on the session pool, sending each host's results.
+
+        Args::
+
+            commands: a list of string commands
+            servers: a list of string hostnames or networks
+            options: the job's options dictionary
+            send: a function to send each message to the client with
+        """
+
+        # imported here so the client side of this module stays light
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+        from bladerunner.networking import ips_in_subnet
+
+        started = time.time()
+        hosts = []
+        for server in servers:
+            hosts.extend(ips_in_subnet(server) or [server])
+
+        with ThreadPoolExecutor(max_workers=options.get("threads") or 100) \
+                as executor:
+            futures = [
+                executor.submit(self.pool.run_host, host, commands, options)
+                for host in hosts
+            ]
+            for future in as_completed(futures):
+                send(future.result())
+
+        send({
+            "done": True,
+            "hosts": len(hosts),
+            "elapsed": time.time() - started,
+        })
+
+    def _reap_loop(self):
+        """Ends idle sessions until the daemon stops."""
+
+        interval = max(1, min(self.pool.idle_timeout / 4, 30))
+        while not self._stopped.wait(interval):
+            self.pool.reap()
+
+    def serve(self):
+        """Serves jobs until interrupted, then ends every session."""
+
+        reaper = threading.Thread(target=self._reap_loop)
+        reaper.daemon = True
+        reaper.start()
+        try:
+            self.serve_forever()
+        finally:
+            self._stopped.set()
+            self.server_close()
+            self.pool.close()
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+
+def _remove_stale_socket(path):
+    """Removes a socket left behind, exits if a daemon is using it."""
+
+    if not os.path.exists(path):
+        return
+
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(path)
+    except socket.error:
+        os.remove(path)  # nothing is listening
+    else:
+        raise SystemExit("bladerunnerd is already running on {0}".format(path))
+    finally:
+        client.close()
+
+
+def run_job(path, commands, servers, options, callback=None):
+    """Sends a job to bladerunnerd, returning the results once it's done.
+
+    Args::
+
+        path: the string path of the daemon's socket, or None for the default
+        commands: a list of string commands
+        servers: a list of string hostnames or networks
+        options: the options dictionary, only the JOB_OPTIONS are sent
+        callback: an optional function called with each host's results as
+                  they're received
+
+    Returns:
+        a list of results dictionaries, as Bladerunner.run returns
+    """
+
+    path = path or default_socket_path()
+    job = {
+        "commands": list(commands),
+        "servers": list(servers),
+        "options": dict(
+            (key, options[key]) for key in JOB_OPTIONS if key in options
+        ),
+    }
+
+    _check_socket_directory(path)
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(path)
+    except socket.error as error:
+        client.close()
+        raise SystemExit("Could not connect to bladerunnerd at {0}: "
+                         "{1}".format(path, error))
+
+    results = []
+    try:
+        _check_socket_owner(path, client)
+        client.sendall("{0}\n".format(json.dumps(job)).encode("utf-8"))
+        for line in client.makefile("rb"):
+            message = json.loads(line.decode("utf-8"))
+            if "error" in message:
+                raise SystemExit("bladerunnerd: {0}".format(message["error"]))
+            if message.get("done"):
+                return results
+
+            message["results"] = [
+                tuple(result) for result in message["results"]
+            ]
+            if callback is not None:
+                callback(message)
+            if options.get("keep_results", True):
+                results.append(message)
+    finally:
+        client.close()
+
+    raise SystemExit("bladerunnerd closed the connection before finishing")
+
+
+def main(args=None):
+    """Runs bladerunnerd in the foreground until interrupted."""
+
+    parser = argparse.ArgumentParser(
+        prog="bladerunnerd",
+        description="Keeps warm ssh sessions for bladerunner --daemon.",
+    )
+    parser.add_argument(
+        "--socket",
+        metavar="PATH",
+        default=default_socket_path(),
+        help="Unix socket to listen on (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--idle-timeout",
+        metavar="SECONDS",
+        type=float,
+        default=DEFAULT_IDLE_TIMEOUT,
+        help="end sessions unused for this long (default: %(default)ss)",
+    )
+    options = parser.parse_args(args)
+
+    def stop(signum, frame):
+        """Stops serving on SIGTERM."""
+
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+
+    server = BladerunnerDaemon(options.socket, options.idle_timeout)
+    print("bladerunnerd listening on {0}".format(options.socket),
+          file=sys.stderr)
+    try:
+        server.serve()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""A live status line for long runs, built on the ProgressBar."""
+
+
+from __future__ import division, unicode_literals
+
+import time
+import datetime
+from collections import deque
+
+from bladerunner.progressbar import ProgressBar
+
+
+# in the order hosts move through them, see Bladerunner._phase
+PHASES = ["resolving", "connecting", "logging in", "running", "closing"]
+
+
+class Dashboard(ProgressBar):
+    """A progress bar followed by the run's rate, ETA, phases and errors.
+
+    Used as one of Bladerunner's phase_callbacks and result_callbacks, with
+    phase_changed and host_finished. Those only update counters under the
+    lock, the line is drawn by the ProgressBar's render thread.
+
+    Args::
+
+        total_updates: an integer of how many hosts will finish
+        options: the ProgressBar's options dictionary, plus an optional
+                 integer 'rate_window', of how many of the most recent
+                 hosts to average the rate over (default 50)
+        errors: the list of error messages from Bladerunner, their codes
+                are counted
+    """
+
+    def __init__(self, total_updates, options=None, errors=None):
+        """Initializes the counters and shrinks the bar to fit them."""
+
+        options = dict(options or {})
+        options.setdefault("show_counters", True)
+
+        self.phases = {}  # host => its current phase
+        self.in_flight = dict((phase, 0) for phase in PHASES)
+        self.errors = dict(
+            (-(index + 1), 0) for index in range(len(errors or []))
+        )
+        self.finished = deque(maxlen=options.get("rate_window") or 50)
+        self.started = time.time()
+        self.events = 0  # number of changes, for _state
+
+        super(Dashboard, self).__init__(total_updates, options)
+
+        self.bar_width = max(self.total_width // 3, 12)
+        self.width = max(self.width - (self.total_width - self.bar_width), 1)
+        self.drawn = None
+
+    def start(self):
+        """Restarts the clock for the rate with the render thread."""
+
+        self.started = time.time()
+        super(Dashboard, self).start()
+
+    def phase_changed(self, server, phase, when):
+        """Moves a host into a phase, used as a phase callback.
+
+        Args::
+
+            server: the string hostname
+            phase: the string phase name, or None if the host is finished
+            when: the float monotonic time of the change
+        """
+
+        with self.lock:
+            previous = self.phases.pop(server, None)
+            if previous in self.in_flight:
+                self.in_flight[previous] -= 1
+            if phase is not None:
+                self.phases[server] = phase
+                self.in_flight[phase] = self.in_flight.get(phase, 0) + 1
+            self.events += 1
+
+    def host_finished(self, results, info):
+        """Counts a finished host and its error code, as a result callback.
+
+        Args::
+
+            results: the results dictionary for a single host
+            info: the info dictionary from Bladerunner's result_callbacks
+        """
+
+        with self.lock:
+            error = info.get("error") or 0
+            if error < 0:
+                self.errors[error] = self.errors.get(error, 0) + 1
+            self.finished.append(time.time())
+            self.events += 1
+
+    def stats(self, now=None):
+        """Returns the current statistics of the run.
+
+        Args:
+            now: optional float time.time() to calculate the rate at
+
+        Returns:
+            a dictionary with the keys rate (hosts per second), eta (seconds
+            remaining, or None while the rate is unknown), in_flight (a
+            dictionary of phase => hosts) and errors (a dictionary of error
+            code => hosts)
+        """
+
+        if now is None:
+            now = time.time()
+
+        with self.lock:
+            counter = self.counter
+            finished = list(self.finished)
+            in_flight = dict(self.in_flight)
+            errors = dict(self.errors)
+
+        # a moving average over the window, or since start until it fills
+        if len(finished) < self.finished.maxlen:
+            count, since = len(finished), self.started
+        else:
+            count, since = len(finished) - 1, finished[0]
+
+        rate = count / (now - since) if now > since else 0.0
+        if rate:
+            eta = max(self.total - counter, 0) / rate
+        else:
+            eta = None
+
+        return {
+            "rate": rate,
+            "eta": eta,
+            "in_flight": in_flight,
+            "errors": errors,
+        }
+
+    def _state(self):
+        """Redraws on any change, and once a second for the rate and ETA."""
+
+        return (self.counter, self.events, int(time.time()))
+
+    def _draw(self, counter):
+        """Returns the bar with the statistics after it."""
+
+        stats = self.stats()
+
+        parts = ["{0:.1f}/s".format(stats["rate"])]
+        if stats["eta"] is not None:
+            parts.append("ETA {0}".format(
+                datetime.timedelta(seconds=int(stats["eta"]))
+            ))
+        else:
+            parts.append("ETA -")
+
+        parts.extend(
+            "{0} {1}".format(phase, stats["in_flight"][phase])
+            for phase in PHASES if stats["in_flight"].get(phase)
+        )
+
+        errors = [
+            "{0}={1}".format(code, count)
+            for code, count in sorted(stats["errors"].items(), reverse=True)
+            if count
+        ]
+        if errors:
+            parts.append("err {0}".format(" ".join(errors)))
+
+        line = "{0} {1}".format(
+            super(Dashboard, self)._draw(counter),
+            ", ".join(parts),
+        )
+
+        # the leading \r doesn't take up a column
+        return line[:self.total_width + 1].ljust(self.total_width + 1)
@@ -7,9 +7,14 @@ from __future__ import print_function
 import io
 import os
 import re
+import csv
 import sys
+import json
 import codecs
+import hashlib
+import threading
 
+from bladerunner.normalizers import normalize
 from bladerunner.progressbar import get_term_width
 
 
@@ -21,6 +26,18 @@ if sys.version_info > (3,):
 else:
     UNICODE_TYPE = unicode  # nopep8
 
+LINE_BREAKS = re.compile("\r\n|\r|\n")
+LEADING_WHITESPACE = re.compile("^\\s+")
+BLOCK_LEADING_WHITESPACE = re.compile("^\\s+", re.M)
+ESCAPE_SEQUENCES = [
+    re.compile("\033\\[[0-9;]+m"),  # no colours
+    re.compile("\x1b\\[[0-9;]+G"),  # no crazy tabs
+    re.compile("\\x1b\\[m\\x0f"),
+]
+
+# OutputCleaners by password, see get_cleaner
+_CLEANERS = {}
+
 
 class FakeStdOut(object):
     """An object to pass to pexpect's debug logger to simulate sys.stdout."""
@@ -50,58 +67,198 @@ def no_empties(input_list):
     out_list = []
     for item in input_list:
         if item:
-            for encoding in DEFAULT_ENCODINGS:
-                try:
-                    out_list.append(codecs.decode(
-                        codecs.encode(item, encoding),
-                        encoding,
-                    ).strip())
-                except UnicodeEncodeError:
-                    pass
-                else:
-                    break
+            if isinstance(item, bytes):
+                item = decode_output(item)
+            out_list.append(item.strip())
     return out_list
 
 
-def format_output(output, command, options=None):
-    """Formatting function to strip colours, remove tabs, etc.
+def decode_output(output):
+    """Decodes a block of output bytes in a single pass.
 
-    Args::
+    The whole block is decoded as DEFAULT_ENCODING when possible. Otherwise
+    each line is decoded on its own with the first of DEFAULT_ENCODINGS that
+    works, so a single odd line can't change how the rest are decoded.
 
-        output: the pexpect object's before method after issuing the command
-        command: the command last issued
+    Args:
+        output: bytes (or an already decoded string) of command output
+
+    Returns:
+        the decoded string, or the original output if it cannot be decoded
+    """
+
+    if isinstance(output, UNICODE_TYPE):
+        return output
+
+    try:
+        return codecs.decode(output, DEFAULT_ENCODING)
+    except (UnicodeDecodeError, UnicodeEncodeError):
+        pass
+
+    lines = []
+    for line in output.splitlines(True):
+        for encoding in DEFAULT_ENCODINGS:
+            try:
+                lines.append(codecs.decode(line, encoding))
+            except (UnicodeDecodeError, UnicodeEncodeError):
+                pass
+            else:
+                break
+        else:
+            return output  # can't decode this, pass it back as is
+    return "".join(lines)
+
+
+def _split_lines(output):
+    """Splits lines on the same boundaries bytes.splitlines() uses."""
+
+    lines = LINE_BREAKS.split(output)
+    if lines[-1] == "":
+        lines.pop()
+    return lines
+
+
+class OutputCleaner(object):
+    """Cleans command output, with everything it needs compiled up front.
+
+    Cleaning is done on a whole block of output at once and gives the same
+    results as running format_line over every line of it.
+
+    Args:
+        options: dictionary of Bladerunner options, uses the password keys
+    """
+
+    # the size of command sections we look for in cmd_in_line
+    fragment_size = 30
+
+    def __init__(self, options=None):
+        """Collects the passwords to hide from the options."""
+
+        if options is None:
+            options = {}
+
+        self.passwords = []
+        for key in ["password", "second_password", "jump_password"]:
+            password = options.get(key)
+            if not password:
+                continue
+            if not isinstance(password, (list, tuple)):
+                password = [password]
+            for passwd in password:
+                if passwd and passwd not in self.passwords:
+                    self.passwords.append(passwd)
+
+        self._fragments = {}
+
+        super(OutputCleaner, self).__init__()
+
+    def fragments(self, command):
+        """Returns the sections of a long command to look for in its output.
+
+        Args:
+            command: the command issued
+
+        Returns:
+            list of strings, empty for commands too short to wrap
+        """
+
+        try:
+            return self._fragments[command]
+        except KeyError:
+            pass
+
+        if len(command) < 60:
+            fragments = []
+        else:
+            size = self.fragment_size
+            fragments = [command[i:i + size] for i in
+                         range(0, len(command), size)]
+
+        if len(self._fragments) > 1024:
+            self._fragments.clear()  # don't grow forever in interactive use
+        self._fragments[command] = fragments
+        return fragments
+
+    def clean(self, output, command):
+        """Formats a block of output from a command, see format_output."""
+
+        output = decode_output(output)
+        if not isinstance(output, UNICODE_TYPE):
+            # undecodable, leave each line to format_line to pass back as is
+            return self._clean_lines(output, command)
+
+        # the first line is the command, the last is /probably/ the prompt
+        # there can be cases that disobey this though, like exiting without \n
+        block = "\n".join(_split_lines(output)[1:-1])
+
+        if "\x1b" in block:
+            for escapes in ESCAPE_SEQUENCES:
+                block = escapes.sub("", block)
+        block = BLOCK_LEADING_WHITESPACE.sub("", block)
+        for password in self.passwords:
+            block = block.replace(password, "*" * len(password))
+
+        fragments = self.fragments(command)
+        return "\n".join([
+            line for line in block.split("\n") if line and
+            not any(line.find(fragment) > -1 for fragment in fragments)
+        ])
+
+    def _clean_lines(self, output, command):
+        """Fallback to clean output which could not be decoded line by line."""
+
+        options = {"password": self.passwords}
+        fragments = self.fragments(command)
+        results = []
+        for line in output.splitlines()[1:-1]:
+            line = format_line(line, options)
+            if line and not any(line.find(frag) > -1 for frag in fragments):
+                results.append(line)
+        return "\n".join(results)
+
+
+def get_cleaner(options=None):
+    """Returns an OutputCleaner for the options, building it only once.
+
+    Args:
         options: dictionary of Bladerunner options
 
     Returns:
-        a (hopefully) nicely formatted string of the command's output
+        an OutputCleaner, shared between calls with the same passwords
     """
 
     if options is None:
         options = {}
 
-    def cmd_in_line(command, line):
-        """Checks for long commands wrapping into the output."""
+    key = tuple(
+        tuple(password) if isinstance(password, list) else password
+        for password in [options.get(key) for key in
+                         ["password", "second_password", "jump_password"]]
+    )
 
-        if len(command) < 60:
-            return False
+    try:
+        return _CLEANERS[key]
+    except KeyError:
+        if len(_CLEANERS) > 64:
+            _CLEANERS.clear()
+        cleaner = _CLEANERS[key] = OutputCleaner(options)
+        return cleaner
 
-        # how large of command sections we'll look for.
-        size = 30
-        cmd_split = [command[i:i + size] for i in range(0, len(command), size)]
 
-        for fraction in cmd_split:
-            if line.find(fraction) > -1:
-                return True
+def format_output(output, command, options=None):
+    """Formatting function to strip colours, remove tabs, etc.
 
-    output = output.splitlines()
-    results = []
-    # the first line is the command, the last is /probably/ the prompt
-    # there can be cases that disobey this though, like exiting without a \n
-    for line in output[1:-1]:
-        line = format_line(line, options)
-        if line and not cmd_in_line(command, line):
-            results.append(line)
-    return "\n".join(results)
+    Args::
+
+        output: the pexpect object's before method after issuing the command
+        command: the command last issued
+        options: dictionary of Bladerunner options
+
+    Returns:
+        a (hopefully) nicely formatted string of the command's output
+    """
+
+    return get_cleaner(options).clean(output, command)
 
 
 def format_line(line, options=None):
@@ -113,9 +270,6 @@ def format_line(line, options=None):
         options: dictionary of Bladerunner options
     """
 
-    if options is None:
-        options = {}
-
     for encoding in DEFAULT_ENCODINGS:
         try:
             line = codecs.decode(line, encoding)
@@ -126,12 +280,20 @@ def format_line(line, options=None):
     else:
         return line  # can't decode this, not sure what to do. pass it back
 
+    return _clean_line(line, options)
+
+
+def _clean_line(line, options=None):
+    """Cleans an already decoded line, see format_line."""
+
+    if options is None:
+        options = {}
+
     line = line.strip(os.linesep)  # can't strip new lines enough
     line = line.replace("\r", "")  # no extra carriage returns
-    line = re.sub("\033\[[0-9;]+m", "", line)  # no colours
-    line = re.sub("\x1b\[[0-9;]+G", "", line)  # no crazy tabs
-    line = re.sub("\\x1b\[m\\x0f", "", line)
-    line = re.sub("^\s+", "", line)  # no trailing whitespace
+    for escapes in ESCAPE_SEQUENCES:
+        line = escapes.sub("", line)
+    line = LEADING_WHITESPACE.sub("", line)  # no leading whitespace
 
     # hide the user's passwords in the output in case the term echo'd them
     for key in ["password", "second_password", "jump_password"]:
@@ -146,32 +308,184 @@ def format_line(line, options=None):
     return line
 
 
-def consolidate(results):
-    """Makes a list of servers and replies, consolidates dupes.
+def results_digest(results):
+    """Builds a digest of a server's results, used to group matching servers.
 
     Args:
+        results: the list of (command, result) tuples for a server
+
+    Returns:
+        a hex string digest, equal for equal results
+    """
+
+    digest = hashlib.sha1()
+    for command_result in results:
+        for value in command_result:
+            if not isinstance(value, bytes):
+                value = UNICODE_TYPE(value).encode(DEFAULT_ENCODING, "replace")
+            # length prefixed, so ("ab", "c") and ("a", "bc") can't collide
+            digest.update("{0}:".format(len(value)).encode("ascii"))
+            digest.update(value)
+        digest.update(b";")
+    return digest.hexdigest()
+
+
+class Consolidator(object):
+    """Groups servers with matching results as they are added.
+
+    Servers are grouped by a digest of their results, so each server added
+    costs the same no matter how many groups there already are. The servers
+    added are never modified.
+
+    With normalizers (see bladerunner.normalizers), servers are grouped by
+    their normalized results instead. Each group keeps the raw results of its
+    first server, and a deltas dictionary of name => [(index, raw output)]
+    for the other servers, with an entry for each result which differs from
+    the first server's.
+
+    Usage example::
+
+        consolidator = Consolidator()
+        for server in results:
+            consolidator.add(server)
+        pretty_results(consolidator.groups)
+
+    Args::
+
+        results: an optional list of results to add
+        normalizers: an optional list of normalizer callables
+    """
+
+    def __init__(self, results=None, normalizers=None):
+        """Initializes with an optional list of results to add."""
+
+        self.groups = []
+        self.by_digest = {}
+        self.normalizers = normalizers or []
+        self._normalized = {}  # id(group) => normalized results
+
+        for server in results or []:
+            self.add(server)
+
+        super(Consolidator, self).__init__()
+
+    def add(self, server):
+        """Adds a server result, or an already consolidated group of them.
+
+        Args:
+            server: a result dictionary from Bladerunner.run or consolidate
+
+        Returns:
+            the group dictionary the server was added to
+        """
+
+        if "names" in server:
+            names = server["names"]
+        else:
+            names = [server["name"]]
+
+        results = [tuple(result) for result in server["results"]]
+
+        if self.normalizers:
+            deltas = server.get("deltas") or {}
+            group = None
+            for name in names:
+                group = self._add_normalized(
+                    name,
+                    apply_deltas(results, deltas.get(name)),
+                    server,
+                )
+            return group
+
+        digest = results_digest(results)
+
+        for group in self.by_digest.get(digest, []):
+            if group["results"] == results:
+                group["names"].extend(names)
+                return group
+
+        group = self._new_group(server, names, results)
+        self.by_digest.setdefault(digest, []).append(group)
+        return group
+
+    def _add_normalized(self, name, results, server):
+        """Adds a single server, grouped by its normalized results."""
+
+        normalized = [
+            (command, normalize(output, name, self.normalizers))
+            for command, output in results
+        ]
+        digest = results_digest(normalized)
+
+        for group in self.by_digest.get(digest, []):
+            if self._normalized[id(group)] == normalized:
+                group["names"].append(name)
+                delta = [
+                    (index, result[1]) for index, result in enumerate(results)
+                    if result != group["results"][index]
+                ]
+                if delta:
+                    group["deltas"][name] = delta
+                return group
+
+        group = self._new_group(server, [name], results)
+        group["deltas"] = {}
+        self._normalized[id(group)] = normalized
+        self.by_digest.setdefault(digest, []).append(group)
+        return group
+
+    def _new_group(self, server, names, results):
+        """Starts a new group, keeping any extra keys from the server."""
+
+        group = dict(
+            (key, value) for key, value in server.items()
+            if key not in ("name", "names", "results", "deltas", "timings")
+        )
+        group["names"] = list(names)
+        group["results"] = results
+        self.groups.append(group)
+        return group
+
+
+def apply_deltas(results, delta):
+    """Rebuilds a server's raw results from its group's results and delta.
+
+    Args::
+
+        results: the list of (command, output) tuples of the group
+        delta: the list of (index, output) differences, or None
+
+    Returns:
+        the list of (command, output) tuples for the server
+    """
+
+    if not delta:
+        return results
+
+    results = list(results)
+    for index, output in delta:
+        results[index] = (results[index][0], output)
+    return results
+
+
+def consolidate(results, normalizers=None):
+    """Makes a list of servers and replies, consolidates dupes.
+
+    Args::
+
         results: the results dictionary from Bladerunner.run
+        normalizers: an optional list of normalizer callables, to also group
+                     servers whose outputs only differ by the parts masked
 
     Returns:
         a results dictionary, with a names key instead of name, containing a
         lists of hosts with matching outputs
     """
 
-    finalresults = []
-    for server in results:
-        for tempserver in finalresults:
-            if tempserver["results"] == server["results"]:
-                tempserver["names"].append(server["name"])
-                break
-        else:
-            server["names"] = [server["name"]]
-            del server["name"]
-            finalresults.append(server)
-
-    return finalresults
+    return Consolidator(results, normalizers).groups
 
 
-def csv_results(results, options=None):
+def csv_results(results, options=None, sink=None):
     """Prints the results consolidated and in a CSV-ish fashion.
 
     Args::
@@ -181,40 +495,271 @@ def csv_results(results, options=None):
             csv_char: a character or string to separate with
     """
 
-    if options is None:
-        options = {}
+    with CsvWriter(options, sink) as writer:
+        for server in results:
+            writer.write_result(server)
 
-    if "csv_char" in options:
-        csv_char = options["csv_char"]
-    else:
-        csv_char = ","
 
-    write("server{csv}command{csv}result\r\n".format(csv=csv_char), options)
-    for server in results:
-        for command, command_result in server["results"]:
-            server_name = server.get("name")
-            if not server_name:  # catch for consolidated results
-                server_name = " ".join(server.get("names"))
-
-            command_result = "\n".join(no_empties(command_result.split("\n")))
-            write(
-                (
-                    "{name_quote}{name}{name_quote}{csv}{cmd_quote}{command}"
-                    "{cmd_quote}{csv}{res_quote}{result}{res_quote}\r\n"
-                ).format(
-                    name_quote='"' * int(" " in server_name),
-                    name=server_name,
-                    csv=csv_char,
-                    cmd_quote='"' * int(" " in command),
-                    command=command,
-                    res_quote='"' * int(" " in command_result),
-                    result=command_result,
-                ),
-                options,
+def jsonl_results(results, options=None, sink=None):
+    """Prints the results as JSON Lines, one object per host or group.
+
+    Args::
+
+        results: the results dictionary from Bladerunner.run
+        options: the options dictionary, uses the 'output_file' key
+    """
+
+    with JsonlWriter(options, sink) as writer:
+        for server in results:
+            writer.write_result(server)
+
+
+class ResultWriter(object):
+    """Base class for writing out results one host at a time.
+
+    The write_result method can be passed as one of Bladerunner's
+    result_callbacks to write each host as it completes, it's thread safe.
+    The output file stays open until the writer is closed.
+
+    Args::
+
+        options: dictionary with optional keys:
+            output_file: a file to append to rather than printing
+        sink: an optional OutputSink to write to
+        stream: boolean to flush after each host rather than buffering
+    """
+
+    def __init__(self, options=None, sink=None, stream=False):
+        """Sets up the output, the file is opened on the first flush."""
+
+        self.options = {} if options is None else options
+        self.sink = sink or OutputSink(self.options)
+        self.stream = stream
+        self._lock = threading.Lock()
+
+        super(ResultWriter, self).__init__()
+
+    def write_result(self, server, info=None):
+        """Writes out the results of a single host.
+
+        Args::
+
+            server: a result dictionary, either consolidated or not
+            info: optional dictionary from Bladerunner's result_callbacks
+        """
+
+        with self._lock:
+            self._write(server, info or {})
+            if self.stream:
+                self.sink.flush()
+
+    def _write(self, server, info):
+        """Writes a single result to the sink, called with the lock held."""
+
+        raise NotImplementedError
+
+    def _finish(self):
+        """Writes anything left before closing, called with the lock held."""
+
+        pass
+
+    def close(self):
+        """Flushes and closes the output."""
+
+        with self._lock:
+            self._finish()
+            self.sink.close()
+
+    def __enter__(self):
+        """Context management, the sink is closed on exit if it's ours."""
+
+        self.sink.__enter__()
+        return self
+
+    def __exit__(self, *args, **kwargs):
+        """Leaves the sink's context, closing it if it's the outermost."""
+
+        with self._lock:
+            self._finish()
+            self.sink.__exit__(*args, **kwargs)
+
+
+class CsvWriter(ResultWriter):
+    """Writes results out as CSV rows with the stdlib csv module.
+
+    Args::
+
+        options: dictionary with optional keys:
+            csv_char: a character or string to separate with
+            output_file: a file to append to rather than printing
+        sink: an optional OutputSink to write to
+        stream: boolean to flush after each host rather than buffering
+    """
+
+    def __init__(self, options=None, sink=None, stream=False):
+        """Writes the header row."""
+
+        super(CsvWriter, self).__init__(options, sink, stream)
+
+        delimiter = str(self.options.get("csv_char") or ",")
+        if len(delimiter) == 1:
+            self._writer = csv.writer(
+                self.sink,
+                delimiter=delimiter,
+                lineterminator="\r\n",
             )
+        else:
+            # the csv module only takes single character delimiters
+            self._writer = _SeparatedWriter(self.sink, delimiter)
+        self._writer.writerow(["server", "command", "result"])
+
+    def _write(self, server, info):
+        """Writes a row per command for a single result dictionary."""
+
+        server_name = server.get("name")
+        if not server_name:  # catch for consolidated results
+            server_name = " ".join(server.get("names"))
+
+        self._writer.writerows([
+            [
+                server_name,
+                command,
+                "\n".join(no_empties(command_result.split("\n"))),
+            ]
+            for command, command_result in server["results"]
+        ])
+
+
+class _SeparatedWriter(object):
+    """Writes rows as csv.writer does, with a multiple character separator.
+
+    Fields with the separator, a quote or a line break in them are quoted,
+    with quotes doubled, as csv.QUOTE_MINIMAL does.
+
+    Args::
+
+        sink: the OutputSink to write to
+        separator: the string to separate fields with
+    """
+
+    def __init__(self, sink, separator):
+        """Stores the sink and separator."""
+
+        self.sink = sink
+        self.separator = separator
+
+        super(_SeparatedWriter, self).__init__()
+
+    def _field(self, field):
+        """Returns a single field, quoted if required."""
+
+        if not isinstance(field, UNICODE_TYPE):
+            field = "{0}".format(field)
+        if self.separator in field or any(
+                char in field for char in ('"', "\r", "\n")):
+            return '"{0}"'.format(field.replace('"', '""'))
+        return field
+
+    def writerow(self, row):
+        """Writes a single row."""
+
+        self.sink.write(
+            self.separator.join(self._field(field) for field in row),
+            end="\r\n",
+        )
 
+    def writerows(self, rows):
+        """Writes each of the rows."""
 
-def stacked_results(results, options=None):
+        for row in rows:
+            self.writerow(row)
+
+
+class JsonlWriter(ResultWriter):
+    """Writes results out as JSON Lines, one object per host.
+
+    Each host is written as {"name", "results", "error", "started",
+    "elapsed"}, where results is a list of {"command", "output"} objects and
+    the rest come from Bladerunner's result_callbacks, or are null. When
+    grouping, one {"group", "names", "results"} object per group of matching
+    hosts is written after all of the hosts, the group is the digest from
+    results_digest.
+
+    Args::
+
+        options: dictionary with optional keys:
+            output_file: a file to append to rather than printing
+            jsonl_groups: boolean to also write the consolidated groups
+            normalizers: optional list of normalizers to group with
+        sink: an optional OutputSink to write to
+        stream: boolean to flush after each host rather than buffering
+    """
+
+    def __init__(self, options=None, sink=None, stream=False):
+        """Sets up the consolidator if we're grouping."""
+
+        super(JsonlWriter, self).__init__(options, sink, stream)
+
+        if self.options.get("jsonl_groups"):
+            self.consolidator = Consolidator(
+                normalizers=self.options.get("normalizers"),
+            )
+        else:
+            self.consolidator = None
+
+    def _write(self, server, info):
+        """Writes a single host, or consolidated group, as a JSON object."""
+
+        line = {
+            "results": [
+                {"command": command, "output": output}
+                for command, output in server["results"]
+            ],
+            "error": info.get("error"),
+            "started": info.get("started"),
+            "elapsed": info.get("elapsed"),
+        }
+        if "names" in server:
+            line["names"] = server["names"]
+        else:
+            line["name"] = server["name"]
+
+        if "timings" in server:
+            line["timings"] = {
+                "phases": server["timings"]["phases"],
+                "commands": [
+                    {"command": command, "seconds": seconds}
+                    for command, seconds in server["timings"]["commands"]
+                ],
+            }
+
+        self.sink.write(json.dumps(line, sort_keys=True), end="\n")
+
+        if self.consolidator is not None:
+            self.consolidator.add(server)
+
+    def _finish(self):
+        """Writes out each of the groups, if grouping."""
+
+        if self.consolidator is None:
+            return
+
+        for group in self.consolidator.groups:
+            line = {
+                "group": results_digest(group["results"]),
+                "names": group["names"],
+                "results": [
+                    {"command": command, "output": output}
+                    for command, output in group["results"]
+                ],
+            }
+            if "deltas" in group:
+                line["deltas"] = group["deltas"]
+            self.sink.write(json.dumps(line, sort_keys=True), end="\n")
+        self.consolidator = None
+
+
+def stacked_results(results, options=None, sink=None):
     """Display the results in a vertical stack without a frame.
 
     Args::
@@ -224,31 +769,55 @@ def stacked_results(results, options=None):
     """
 
     results, options = prepare_results(results, options)
-    spacer = False
-    for result_set in results:
-        if spacer:
-            write("=" * options["width"], options, end="\n")
+    with sink or OutputSink(options) as sink:
+        for chunk in stacked_rows(results, options):
+            sink.write(chunk)
+
+
+def stacked_rows(results, options):
+    """Generates the output of stacked_results, one chunk per result group.
+
+    Args::
+
+        results: the consolidated results, from prepare_results
+        options: the options dictionary, from prepare_results
+
+    Yields:
+        strings, each is the complete output for one group of servers
+    """
+
+    width = options["width"]
+    spacer = "{0}\n".format("=" * width)
+    divider = "{0}\n".format("-" * width)
+
+    for index, result_set in enumerate(results):
+        rows = [spacer] if index else []
 
         server_lines = []
         line = []
+        line_len = 0  # the sum of the name lengths in line
         for name in result_set["names"]:
             # get the current line length...
-            currently = sum([len(x) for x in line]) + + len(line)
-            # if the name and space for a comma afterwards fit, add to the line
-            if currently + (len(name) * 2) + 1 < options["width"]:
+            currently = line_len + len(line)
+            # if the name and space for a comma afterwards fit, add it
+            if currently + (len(name) * 2) + 1 < width:
                 line.append(name)
+                line_len += len(name)
             else:
                 server_lines.append(", ".join(line + [""]).strip())
                 line = [name]
+                line_len = len(name)
 
         server_lines.append(", ".join(line))
 
-        write("\n".join(server_lines), options, end="\n")
-        write("-" * options["width"], options, end="\n")
+        rows.append("\n".join(server_lines))
+        rows.append("\n")
+        rows.append(divider)
         for _, result in result_set["results"]:
-            write(result, options, end="\n")
+            rows.append(result)
+            rows.append("\n")
 
-        spacer = True
+        yield "".join(rows)
 
 
 def prepare_results(results, options=None):
@@ -311,12 +880,12 @@ def prepare_results(results, options=None):
         options["width"] = width
 
     if not already_consolidated:
-        results = consolidate(results)
+        results = consolidate(results, options.get("normalizers"))
 
     return (results, options)
 
 
-def pretty_results(results, options=None):
+def pretty_results(results, options=None, sink=None):
     """Prints the results in a relatively pretty way.
 
     Args::
@@ -330,110 +899,202 @@ def pretty_results(results, options=None):
 
     results, options = prepare_results(results, options)
 
-    pretty_header(options)
-
-    for result in results:
-        _pretty_result(result, options, results)
-
-    write(
-        "{left_corner}{left}{up}{right}{right_corner}\n".format(
-            left_corner=options["chars"]["bot_left"][options["style"]],
-            left=options["chars"]["bot"][options["style"]] * (
-                options["left_len"] + 2),
-            up=options["chars"]["bot_up"][options["style"]],
-            right=options["chars"]["bot"][options["style"]] * (
-                options["width"] - options["left_len"] - 5),
-            right_corner=options["chars"]["bot_right"][options["style"]],
-        ),
-        options,
-    )
+    with sink or OutputSink(options) as sink:
+        for chunk in pretty_rows(results, options):
+            sink.write(chunk)
 
 
-def pretty_header(options):
-    """Internal function for printing the header of pretty_results.
+def pretty_rows(results, options):
+    """Generates the output of pretty_results, one chunk per result group.
+
+    The frame is built once up front, so the cost of rendering is linear in
+    the size of the results.
+
+    Args::
+
+        results: the consolidated results, from prepare_results
+        options: the options dictionary, from prepare_results
+
+    Yields:
+        strings, the header, each group of servers, then the bottom border
+    """
+
+    frame = PrettyFrame(options)
+    yield frame.header
+    for index, result in enumerate(results):
+        yield "".join(frame.rows(result, first=index == 0))
+    yield frame.bottom
+
+
+class PrettyFrame(object):
+    """The borders and cell padding of pretty_results, for one set of options.
 
     Args::
 
         options: a dictionary with the following keys:
-            width: terminal width, already determined in pretty_results
-            chars: the character dictionary map, defined in pretty_results
-            left_len: the left side length, defined in pretty_results
+            width: terminal width, already determined in prepare_results
+            chars: the character dictionary map, defined in prepare_results
+            left_len: the left side length, defined in prepare_results
+            style: integer style, from 0-3
             jump_host: a string hostname of the jumpbox (if any)
     """
 
-    jumphost = options.get("jump_host")
-
-    if jumphost:
-        write(
-            "{l_corner}{left}{down}{right}{down}{jumpbox}{r_corner}\n".format(
-                l_corner=options["chars"]["top_left"][options["style"]],
-                left=options["chars"]["top"][options["style"]] * (
-                    options["left_len"]
-                    + 2
-                ),
-                down=options["chars"]["top_down"][options["style"]],
-                right=options["chars"]["top"][options["style"]] * (
-                    options["width"]
-                    - options["left_len"]
-                    - 17
-                    - len(jumphost)
-                ),
-                jumpbox=options["chars"]["top"][options["style"]] * (
-                    len(jumphost) + 11
-                ),
-                r_corner=options["chars"]["top_right"][options["style"]],
-            ),
-            options,
+    def __init__(self, options):
+        """Builds every border string for the options given."""
+
+        chars = dict(
+            (key, value[options["style"]])
+            for key, value in options["chars"].items()
         )
+        jumphost = options.get("jump_host") or ""
+        width = options["width"]
+
+        self.left_len = options["left_len"]
+        self.right_len = width - self.left_len - 7
+        self.side = chars["side"]
 
-        write(
-            (
-                "{side} Server{l_gap} {side} Result{r_gap} {side} Jumpbox: "
-                "{jumphost} {side}\n"
+        left_top = chars["top"] * (self.left_len + 2)
+        right_top = chars["top"] * (width - self.left_len - 5)
+
+        if jumphost:
+            self.header = (
+                "{l_corner}{left}{down}{right}{down}{jumpbox}{r_corner}\n"
+                "{side} Server{l_gap} {side} Result{r_gap} {side} "
+                "Jumpbox: {jumphost} {side}\n"
             ).format(
-                side=options["chars"]["side"][options["style"]],
-                l_gap=" " * (options["left_len"] - 6),
-                r_gap=" " * (
-                    options["width"]
-                    - options["left_len"]
-                    - 25
-                    - len(jumphost)
-                ),
+                l_corner=chars["top_left"],
+                left=left_top,
+                down=chars["top_down"],
+                right=chars["top"] * (
+                    width - self.left_len - 17 - len(jumphost)),
+                jumpbox=chars["top"] * (len(jumphost) + 11),
+                r_corner=chars["top_right"],
+                side=self.side,
+                l_gap=" " * (self.left_len - 6),
+                r_gap=" " * (width - self.left_len - 25 - len(jumphost)),
                 jumphost=jumphost,
-            ),
-            options,
+            )
+            # first split has a bottom up character when using a jumpbox
+            self.first_split = (
+                "{l_edge}{left}{middle}{right}{up}{jumpbox}{r_edge}\n"
+            ).format(
+                l_edge=chars["side_left"],
+                left=left_top,
+                middle=chars["middle"],
+                right=chars["top"] * (
+                    width - self.left_len - 17 - len(jumphost)),
+                up=chars["bot_up"],
+                jumpbox=chars["top"] * (len(jumphost) + 11),
+                r_edge=chars["side_right"],
+            )
+        else:
+            self.header = (
+                "{l_corner}{left}{down}{right}{r_corner}\n"
+                "{side} Server{l_gap} {side} Result{r_gap} {side}\n"
+            ).format(
+                l_corner=chars["top_left"],
+                left=left_top,
+                down=chars["top_down"],
+                right=right_top,
+                r_corner=chars["top_right"],
+                side=self.side,
+                l_gap=" " * (self.left_len - 6),
+                r_gap=" " * (width - self.left_len - 13),
+            )
+            self.first_split = None
+
+        # typical horizontal split
+        self.split = "{l_side}{left}{middle}{right}{r_side}\n".format(
+            l_side=chars["side_left"],
+            left=left_top,
+            middle=chars["middle"],
+            right=right_top,
+            r_side=chars["side_right"],
         )
-    else:
-        write(
-            "{l_corner}{left}{down}{right}{r_corner}\n".format(
-                l_corner=options["chars"]["top_left"][options["style"]],
-                left=options["chars"]["top"][options["style"]] * (
-                    options["left_len"]
-                    + 2
-                ),
-                down=options["chars"]["top_down"][options["style"]],
-                right=options["chars"]["top"][options["style"]] * (
-                    options["width"]
-                    - options["left_len"]
-                    - 5
-                ),
-                r_corner=options["chars"]["top_right"][options["style"]],
-            ),
-            options,
+        self.first_split = self.first_split or self.split
+
+        self.bottom = "{l_corner}{left}{up}{right}{r_corner}\n".format(
+            l_corner=chars["bot_left"],
+            left=chars["bot"] * (self.left_len + 2),
+            up=chars["bot_up"],
+            right=chars["bot"] * (width - self.left_len - 5),
+            r_corner=chars["bot_right"],
         )
 
-        write(
-            "{side} Server{l_gap} {side} Result{r_gap} {side}\n".format(
-                side=options["chars"]["side"][options["style"]],
-                l_gap=" " * (options["left_len"] - 6),
-                r_gap=" " * (options["width"] - options["left_len"] - 13),
-            ),
-            options,
-        )
+        self.name_edge = "{0} ".format(self.side)
+        self.name_divider = " {0} ".format(self.side)
+        self.result_edge = " {0}\n".format(self.side)
+        self.blank_name = "{0} {1} {0} ".format(
+            self.side, " " * self.left_len)
+        self.blank_result = "{0} {1}\n".format(
+            " " * self.right_len, self.side)
+
+        super(PrettyFrame, self).__init__()
+
+    def rows(self, result, first=False):
+        """Generates the rows for one group of servers, starting with a split.
+
+        Args::
+
+            result: a single consolidated result group
+            first: boolean, if this is the first group of the results
+
+        Yields:
+            strings, each is a complete row of output
+        """
+
+        yield self.first_split if first else self.split
+
+        result_lines = []
+        for _, command_result in result["results"]:
+            result_lines.extend(no_empties(command_result.split("\n")))
+
+        names = result["names"]
+        for index in range(max(len(result_lines), len(names))):
+            # server name or whitespace, mid mark, and leading space
+            if index < len(names):
+                name = str(names[index])
+                left = "{0}{1}{2}{3}".format(
+                    self.name_edge,
+                    names[index],
+                    " " * (self.left_len - len(name)),
+                    self.name_divider,
+                )
+            else:
+                left = self.blank_name
+
+            # result line, or whitespace, and side mark
+            if index < len(result_lines):
+                line = result_lines[index]
+                right = "{0}{1}{2}".format(
+                    line,
+                    " " * (self.right_len - len(line)),
+                    self.result_edge,
+                )
+            else:
+                right = self.blank_result
+
+            yield left + right
 
 
-def _pretty_result(result, options, consolidated_results):
-    """Internal function, ran inside of a loop to print super fancy results.
+def pretty_header(options, sink=None):
+    """Internal function for printing the header of pretty_results.
+
+    Args::
+
+        options: a dictionary with the following keys:
+            width: terminal width, already determined in pretty_results
+            chars: the character dictionary map, defined in pretty_results
+            left_len: the left side length, defined in pretty_results
+            jump_host: a string hostname of the jumpbox (if any)
+    """
+
+    with sink or OutputSink(options) as sink:
+        sink.write(PrettyFrame(options).header)
+
+
+def _pretty_result(result, options, consolidated_results, sink=None):
+    """Internal function, prints a single group of pretty_results.
 
     Args::
 
@@ -442,99 +1103,222 @@ def _pretty_result(result, options, consolidated_results):
         consolidate_results: the output from consolidate
     """
 
-    result_lines = []
-    for command, command_result in result["results"]:
-        command_split = no_empties(command_result.split("\n"))
-        for command_line in command_split:
-            result_lines.append(command_line)
+    first = bool(consolidated_results) and consolidated_results[0] is result
+    with sink or OutputSink(options) as sink:
+        sink.write("".join(PrettyFrame(options).rows(result, first=first)))
 
-    if len(result_lines or "") > len(result["names"]):
-        max_length = len(result_lines)
-    else:
-        max_length = len(result["names"])
-
-    if consolidated_results.index(result) == 0 and options.get("jump_host"):
-        # first split has a bottom up character when using a jumpbox
-        write(
-            "{l_edge}{left}{middle}{right}{up}{jumpbox}{r_edge}\n".format(
-                l_edge=options["chars"]["side_left"][options["style"]],
-                left=options["chars"]["top"][options["style"]] * (
-                    options["left_len"] + 2),
-                middle=options["chars"]["middle"][options["style"]],
-                right=options["chars"]["top"][options["style"]] * (
-                    options["width"]
-                    - options["left_len"]
-                    - 17
-                    - len(options["jump_host"] or "")
-                ),
-                up=options["chars"]["bot_up"][options["style"]],
-                jumpbox=options["chars"]["top"][options["style"]] * (
-                    len(options["jump_host"] or "")
-                    + 11
-                ),
-                r_edge=options["chars"]["side_right"][options["style"]],
-            ),
-            options,
-        )
+
+def summary_results(results, options=None, sink=None):
+    """Prints only the largest groups of results, for huge numbers of hosts.
+
+    Each of the top groups shows its host count and a few sample host names,
+    the rest of the groups are summarized as a single long tail group. The
+    full host lists can be written to a side file, one JSON object per group.
+
+    Args::
+
+        results: the results dictionary from Bladerunner.run
+        options: a dictionary with optional keys, as well as those used by
+                 pretty_results and stacked_results:
+            summary: integer number of groups to show (10)
+            summary_hosts: a file to write every group's host list to
+            normalizers: a list of normalizers to group results with
+            stacked: boolean to use stacked_results style output
+    """
+
+    if options is None:
+        options = {}
+
+    try:
+        already_consolidated = "names" in results[0]
+    except IndexError:
+        already_consolidated = False
+
+    if not already_consolidated:
+        results = consolidate(results, options.get("normalizers"))
+
+    ranked = sorted(
+        results,
+        key=lambda group: len(group["names"]),
+        reverse=True,
+    )
+    top = options.get("summary") or 10
+    summary = [summary_group(group) for group in ranked[:top]]
+
+    tail = ranked[top:]
+    if tail:
+        if options.get("summary_hosts"):
+            where = "see {0}".format(options["summary_hosts"])
+        else:
+            where = "not shown"
+        summary.append({
+            "names": [
+                "{0} hosts".format(sum(len(group["names"]) for group in tail)),
+                "in {0} groups".format(len(tail)),
+            ],
+            "results": [("", "{0} other outputs, {1}".format(
+                len(tail),
+                where,
+            ))],
+        })
+
+    if options.get("summary_hosts"):
+        write_summary_hosts(ranked, options["summary_hosts"])
+
+    summary, options = prepare_results(summary, options)
+    if options.get("stacked"):
+        rows = stacked_rows(summary, options)
     else:
-        # typical horizontal split
-        write(
-            "{l_side}{left}{middle}{right}{r_side}\n".format(
-                l_side=options["chars"]["side_left"][options["style"]],
-                left=options["chars"]["top"][options["style"]] * (
-                    options["left_len"] + 2),
-                middle=options["chars"]["middle"][options["style"]],
-                right=options["chars"]["top"][options["style"]] * (
-                    options["width"] - options["left_len"] - 5),
-                r_side=options["chars"]["side_right"][options["style"]],
-            ),
-            options,
-        )
+        rows = pretty_rows(summary, options)
 
-    for command in range(max_length):
-        # print server name or whitespace, mid mark, and leading space
-        try:
-            write(
-                "{side} {server}{gap} {side} ".format(
-                    side=options["chars"]["side"][options["style"]],
-                    server=result["names"][command],
-                    gap=" " * (options["left_len"] - len(
-                        str(result["names"][command]))),
-                ),
-                options,
-            )
-        except IndexError:
-            write(
-                "{side} {gap} {side} ".format(
-                    side=options["chars"]["side"][options["style"]],
-                    gap=" " * options["left_len"],
-                ),
-                options,
-            )
+    with sink or OutputSink(options) as sink:
+        for chunk in rows:
+            sink.write(chunk)
 
-        # print result line, or whitespace, and side mark
-        try:
-            write(
-                "{result}{gap} {side}\n".format(
-                    result=result_lines[command],
-                    gap=" " * (
-                        options["width"]
-                        - options["left_len"]
-                        - 7
-                        - len(result_lines[command])
-                    ),
-                    side=options["chars"]["side"][options["style"]],
-                ),
-                options,
-            )
-        except IndexError:
-            write(
-                "{gap} {side}\n".format(
-                    gap=" " * (options["width"] - options["left_len"] - 7),
-                    side=options["chars"]["side"][options["style"]],
-                ),
-                options,
-            )
+
+def summary_group(group, samples=3):
+    """Builds the summarized version of a consolidated group.
+
+    Args::
+
+        group: a single consolidated result group
+        samples: integer number of host names to show
+
+    Returns:
+        a group dictionary with a host count and sample names as its names
+    """
+
+    names = group["names"]
+    summarized = ["{0} host{1}".format(len(names), "s" * (len(names) != 1))]
+    summarized.extend(str(name) for name in names[:samples])
+    if len(names) > samples:
+        summarized.append("...")
+    if group.get("deltas"):
+        summarized.append("{0} varied".format(len(group["deltas"])))
+
+    return {"names": summarized, "results": group["results"]}
+
+
+def write_summary_hosts(groups, path):
+    """Writes every group's hosts to a file, one JSON object per group.
+
+    Args::
+
+        groups: the list of consolidated groups, largest first
+        path: the file path to write to
+    """
+
+    with io.open(path, "w", encoding=DEFAULT_ENCODING) as hosts_file:
+        for rank, group in enumerate(groups, 1):
+            line = json.dumps({
+                "rank": rank,
+                "group": results_digest(group["results"]),
+                "count": len(group["names"]),
+                "names": group["names"],
+            }, sort_keys=True)
+            hosts_file.write(UNICODE_TYPE(line))
+            hosts_file.write(UNICODE_TYPE("\n"))
+
+
+class OutputSink(object):
+    """Buffers the output of a report, writing it out in large chunks.
+
+    The output file is opened once for the whole report rather than once per
+    write. Output is encoded as DEFAULT_ENCODING, falling back to write() for
+    any chunk which can't be, which also handles prompting the user.
+
+    Used as a context manager the sink is flushed and closed on exit. Nested
+    use (passing a sink down to helper functions) only closes the outermost.
+
+    Args::
+
+        options: the options dictionary, uses the 'output_file' key
+        buffer_size: integer number of characters to buffer before writing
+    """
+
+    def __init__(self, options=None, buffer_size=2 ** 20):
+        """Initializes an empty buffer, the file is opened on first flush."""
+
+        self.options = {} if options is None else options
+        self.buffer_size = buffer_size
+        self._buffer = []
+        self._buffered = 0
+        self._file = None
+        self._depth = 0
+
+        super(OutputSink, self).__init__()
+
+    def write(self, string, end=""):
+        """Adds a string to the buffer, flushing if the buffer is full.
+
+        Args::
+
+            string: the string to write out
+            end: character or empty string to end the string with
+        """
+
+        if not isinstance(string, UNICODE_TYPE):
+            string = "{0}".format(string)
+
+        self._buffer.append(string)
+        self._buffered += len(string)
+        if end:
+            self._buffer.append(end)
+            self._buffered += len(end)
+
+        if self._buffered >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        """Writes everything buffered to the output file or stdout."""
+
+        if not self._buffer:
+            return
+
+        data = "".join(self._buffer)
+        self._buffer = []
+        self._buffered = 0
+
+        if self.options.get("output_file"):
+            if self._file is None:
+                self._file = io.open(
+                    self.options["output_file"],
+                    "a",
+                    encoding=DEFAULT_ENCODING,
+                )
+            try:
+                self._file.write(UNICODE_TYPE(data))
+            except (UnicodeEncodeError, UnicodeDecodeError):
+                write(data, self.options)
+            else:
+                self._file.flush()
+        else:
+            try:
+                print(data, end="")
+            except (UnicodeEncodeError, UnicodeDecodeError):
+                _retry_write(data, self.options, "")
+
+    def close(self):
+        """Flushes the buffer and closes the output file, if any."""
+
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        """Context management, see the class docstring."""
+
+        self._depth += 1
+        return self
+
+    def __exit__(self, *args, **kwargs):
+        """Closes the sink when leaving the outermost context."""
+
+        self._depth -= 1
+        if self._depth <= 0:
+            self._depth = 0
+            self.close()
 
 
 def write(string, options, end=""):
@@ -23,6 +23,7 @@ class BladerunnerInteractive(object):
         self.bladerunner = bladerunner
         self.server = server
         self.sshr = False
+        self.error = None  # the error code of the last failed connect
 
     def connect(self, status_return=False):
         """Initializes the ssh connection object(s).
@@ -45,6 +46,7 @@ class BladerunnerInteractive(object):
                 self.bladerunner.options["port"],
             )
             if error < 0:
+                self.error = error
                 self.log(self.bladerunner.errors[int(math.fabs(error)) - 1])
                 return False if status_return else None
 
@@ -57,9 +59,11 @@ class BladerunnerInteractive(object):
             self.bladerunner.options["port"],
         )
         if error < 0:
+            self.error = error
             self.log(self.bladerunner.errors[int(math.fabs(error)) - 1])
             return False if status_return else None
 
+        self.error = None
         self.sshr = sshr
         return True if status_return else None
 
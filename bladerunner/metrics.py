@@ -0,0 +1,385 @@
+"""Fleet level metrics of runs, for Prometheus textfiles and StatsD.
+
+Counters and histograms are kept per worker thread, so updating them never
+waits on another thread. They're only merged when exported.
+"""
+
+
+from __future__ import division
+
+import os
+import re
+import socket
+import tempfile
+import threading
+
+
+# seconds, the +Inf bucket is implied
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+                   30, 60, 120)
+
+# name => (type, help)
+METRICS = {
+    "bladerunner_hosts_total": ("counter", "Hosts attempted."),
+    "bladerunner_host_failures_total": (
+        "counter",
+        "Hosts which couldn't be run on, by error code.",
+    ),
+    "bladerunner_command_timeouts_total": (
+        "counter",
+        "Commands which did not return before the command timeout.",
+    ),
+    "bladerunner_phase_duration_seconds": (
+        "histogram",
+        "Seconds hosts spent in each phase.",
+    ),
+    "bladerunner_host_duration_seconds": (
+        "histogram",
+        "Seconds from starting to finishing each host.",
+    ),
+    "bladerunner_run_duration_seconds": (
+        "gauge",
+        "Seconds the last run took.",
+    ),
+    "bladerunner_run_hosts": ("gauge", "Hosts in the last run."),
+}
+
+
+class Metrics(object):
+    """Counts and times the hosts of runs.
+
+    Used as one of Bladerunner's phase_callbacks and result_callbacks, with
+    phase_changed and host_finished.
+
+    Usage example::
+
+        metrics = Metrics(statsd=("localhost", 8125))
+        runner.phase_callbacks.append(metrics.phase_changed)
+        runner.result_callbacks.append(metrics.host_finished)
+        runner.run(commands, servers)
+        metrics.write_textfile("/var/lib/node_exporter/bladerunner.prom")
+
+    Args::
+
+        statsd: an optional (host, port) tuple to also send each update to
+                over UDP, as it happens
+        buckets: a tuple of the histograms' upper bounds, in seconds
+        prefix: the string prefix of the StatsD metric names
+    """
+
+    def __init__(self, statsd=None, buckets=DEFAULT_BUCKETS,
+                 prefix="bladerunner"):
+        """Initializes the shards, and the StatsD socket if used."""
+
+        self.buckets = tuple(buckets)
+        self.prefix = prefix
+        self.gauges = {}
+        self._local = threading.local()
+        self._shards = []
+        self._current = {}  # host => (phase, monotonic time it started)
+        self._lock = threading.Lock()
+
+        self.statsd = statsd
+        if statsd is not None:
+            self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        else:
+            self._socket = None
+
+        super(Metrics, self).__init__()
+
+    def _shard(self):
+        """Returns the current thread's counters and histograms."""
+
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = {"counters": {}, "histograms": {}}
+            with self._lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+            return shard
+
+    def increment(self, name, labels=(), value=1):
+        """Increments a counter.
+
+        Args::
+
+            name: the string metric name, see METRICS
+            labels: a tuple of (label, value) tuples
+            value: the integer to increment by
+        """
+
+        counters = self._shard()["counters"]
+        counters[name, labels] = counters.get((name, labels), 0) + value
+        self._send(name, labels, "{0}|c".format(value))
+
+    def observe(self, name, seconds, labels=()):
+        """Adds a value to a histogram.
+
+        Args::
+
+            name: the string metric name, see METRICS
+            seconds: the float value to add
+            labels: a tuple of (label, value) tuples
+        """
+
+        histograms = self._shard()["histograms"]
+        key = (name, labels)
+        if key not in histograms:
+            # a count for each bucket, then the sum and total count
+            histograms[key] = [0] * (len(self.buckets) + 2)
+        histogram = histograms[key]
+
+        for index, bucket in enumerate(self.buckets):
+            if seconds <= bucket:
+                histogram[index] += 1
+                break
+        histogram[-2] += seconds
+        histogram[-1] += 1
+
+        self._send(name, labels, "{0:g}|ms".format(seconds * 1000))
+
+    def set_gauge(self, name, value, labels=()):
+        """Sets a gauge.
+
+        Args::
+
+            name: the string metric name, see METRICS
+            value: the float value to set
+            labels: a tuple of (label, value) tuples
+        """
+
+        with self._lock:
+            self.gauges[name, labels] = value
+        self._send(name, labels, "{0:g}|g".format(value))
+
+    def _send(self, name, labels, value):
+        """Sends an update to StatsD, if used. Errors are ignored."""
+
+        if self._socket is None:
+            return
+
+        parts = [self.prefix, name.replace("bladerunner_", "", 1)]
+        parts.extend(_statsd_name(label_value) for _, label_value in labels)
+        try:
+            self._socket.sendto(
+                "{0}:{1}".format(".".join(parts), value).encode("utf-8"),
+                self.statsd,
+            )
+        except (socket.error, OSError):
+            pass
+
+    def phase_changed(self, server, phase, when):
+        """Times the host's previous phase, used as a phase callback.
+
+        Args::
+
+            server: the string hostname
+            phase: the string phase name, or None if the host is finished
+            when: the float monotonic time of the change
+        """
+
+        previous = self._current.pop(server, None)
+        if previous is not None:
+            self.observe(
+                "bladerunner_phase_duration_seconds",
+                when - previous[1],
+                (("phase", previous[0]),),
+            )
+        if phase is not None:
+            self._current[server] = (phase, when)
+
+    def host_finished(self, results, info):
+        """Counts a finished host, used as a result callback.
+
+        Args::
+
+            results: the results dictionary for a single host
+            info: the info dictionary from Bladerunner's result_callbacks
+        """
+
+        self.increment("bladerunner_hosts_total")
+        self.observe("bladerunner_host_duration_seconds", info["elapsed"])
+
+        error = info.get("error") or 0
+        if error < 0:
+            self.increment(
+                "bladerunner_host_failures_total",
+                (("code", str(error)),),
+            )
+            return
+
+        timeouts = info.get("timeouts") or 0
+        if timeouts:
+            self.increment("bladerunner_command_timeouts_total", (), timeouts)
+
+    def run_finished(self, hosts, seconds):
+        """Sets the gauges of the run.
+
+        Args::
+
+            hosts: the integer number of hosts in the run
+            seconds: the float seconds the run took
+        """
+
+        self.set_gauge("bladerunner_run_hosts", hosts)
+        self.set_gauge("bladerunner_run_duration_seconds", seconds)
+
+    def collect(self):
+        """Merges the shards of each thread.
+
+        Returns:
+            a tuple of (counters, histograms, gauges) dictionaries, each of
+            (name, labels) => value. Histogram values are lists of the
+            count in each bucket, then the sum and total count
+        """
+
+        counters = {}
+        histograms = {}
+        with self._lock:
+            shards = list(self._shards)
+            gauges = dict(self.gauges)
+
+        for shard in shards:
+            for key, value in list(shard["counters"].items()):
+                counters[key] = counters.get(key, 0) + value
+            for key, value in list(shard["histograms"].items()):
+                if key in histograms:
+                    histograms[key] = [
+                        total + count
+                        for total, count in zip(histograms[key], value)
+                    ]
+                else:
+                    histograms[key] = list(value)
+
+        return counters, histograms, gauges
+
+    def textfile(self):
+        """Returns the metrics in the Prometheus text exposition format."""
+
+        counters, histograms, gauges = self.collect()
+
+        by_name = {}
+        for values in (counters, gauges):
+            for (name, labels), value in values.items():
+                by_name.setdefault(name, []).append(
+                    "{0}{1} {2:g}".format(name, _labels(labels), value)
+                )
+
+        for (name, labels), histogram in histograms.items():
+            lines = by_name.setdefault(name, [])
+            cumulative = 0
+            bounds = ["{0:g}".format(bucket) for bucket in self.buckets]
+            for bound, count in zip(bounds, histogram[:-2]):
+                cumulative += count
+                lines.append("{0}_bucket{1} {2}".format(
+                    name,
+                    _labels(labels + (("le", bound),)),
+                    cumulative,
+                ))
+            # the +Inf bucket, anything past the last bound wasn't counted
+            lines.append("{0}_bucket{1} {2}".format(
+                name,
+                _labels(labels + (("le", "+Inf"),)),
+                histogram[-1],
+            ))
+            lines.append("{0}_sum{1} {2:g}".format(
+                name,
+                _labels(labels),
+                histogram[-2],
+            ))
+            lines.append("{0}_count{1} {2}".format(
+                name,
+                _labels(labels),
+                histogram[-1],
+            ))
+
+        output = []
+        for name in sorted(by_name):
+            metric_type, help_text = METRICS.get(name, ("untyped", name))
+            output.append("# HELP {0} {1}".format(name, help_text))
+            output.append("# TYPE {0} {1}".format(name, metric_type))
+            output.extend(sorted(by_name[name], key=_sort_key))
+
+        return "\n".join(output) + "\n"
+
+    def write_textfile(self, path):
+        """Writes the metrics for node_exporter's textfile collector.
+
+        The file is written next to the path then renamed over it, so the
+        collector never reads a partial file. It's readable by others as the
+        umask allows, the collector usually runs as another user.
+
+        Args:
+            path: the string file path to write to, should end in .prom
+        """
+
+        directory = os.path.dirname(os.path.abspath(path))
+        try:
+            fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            # mkstemp always creates the file as 0600
+            umask = os.umask(0)
+            os.umask(umask)
+            os.fchmod(fd, 0o666 & ~umask)
+            with os.fdopen(fd, "w") as temp_file:
+                temp_file.write(self.textfile())
+            os.rename(temp_path, path)
+        except (IOError, OSError) as error:
+            raise SystemExit("Could not write metrics file: {0}".format(error))
+
+    def close(self):
+        """Closes the StatsD socket, if used."""
+
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+
+def _labels(labels):
+    """Returns the Prometheus label string of a tuple of (label, value)."""
+
+    if not labels:
+        return ""
+    return "{{{0}}}".format(",".join(
+        '{0}="{1}"'.format(
+            label,
+            "{0}".format(value).replace("\\", "\\\\").replace('"', '\\"'),
+        )
+        for label, value in labels
+    ))
+
+
+def _sort_key(line):
+    """Sorts histogram buckets numerically, then everything else by line."""
+
+    match = re.search('le="([^"]+)"', line)
+    if match is None:
+        return (line, 0)
+    return (line[:match.start()], float(match.group(1)))
+
+
+def _statsd_name(value):
+    """Returns a label value usable as part of a StatsD metric name."""
+
+    return re.sub("[^\\w-]+", "_", "{0}".format(value)).strip("_")
+
+
+def parse_statsd(address, default_port=8125):
+    """Parses a host[:port] StatsD address.
+
+    Args::
+
+        address: the string address
+        default_port: the integer port if the address doesn't have one
+
+    Returns:
+        a (host, port) tuple
+    """
+
+    host, _, port = address.rpartition(":")
+    if not host:
+        return (address, default_port)
+    try:
+        return (host, int(port))
+    except ValueError:
+        raise SystemExit("Invalid StatsD address: {0}".format(address))
@@ -0,0 +1,176 @@
+"""Normalizers for grouping near-duplicate outputs when consolidating.
+
+A normalizer is any callable taking (output, name) and returning the output
+with the parts that are expected to differ between hosts masked out. They're
+only used to decide which hosts match, the raw outputs are kept.
+"""
+
+
+import re
+
+
+class RegexMask(object):
+    """Replaces everything matching a regular expression.
+
+    Args::
+
+        pattern: the regex string (or compiled pattern) to mask
+        replacement: the string to replace matches with
+        flags: optional integer re flags, when pattern is a string
+    """
+
+    def __init__(self, pattern, replacement="<masked>", flags=0):
+        """Compiles the pattern once."""
+
+        if not hasattr(pattern, "sub"):
+            pattern = re.compile(pattern, flags)
+        self.pattern = pattern
+        self.replacement = replacement
+
+        super(RegexMask, self).__init__()
+
+    def __call__(self, output, name):
+        """Returns the output with the pattern masked."""
+
+        return self.pattern.sub(self.replacement, output)
+
+    def __repr__(self):
+        """Shows the pattern, used by --settings."""
+
+        return "RegexMask({0!r}, {1!r})".format(
+            self.pattern.pattern,
+            self.replacement,
+        )
+
+
+class HostnameMask(object):
+    """Replaces the host's own name, and its short name, in its output.
+
+    Args:
+        replacement: the string to replace the host name with
+    """
+
+    def __init__(self, replacement="<host>"):
+        """Initializes an empty cache of host name patterns."""
+
+        self.replacement = replacement
+        self._patterns = {}
+
+        super(HostnameMask, self).__init__()
+
+    def __call__(self, output, name):
+        """Returns the output with the name of the host masked."""
+
+        name = str(name)
+        if name not in self._patterns:
+            if len(self._patterns) > 4096:
+                self._patterns.clear()
+            names = [name]
+            short_name = name.split(".")[0]
+            if short_name != name and not short_name.isdigit():
+                names.append(short_name)
+            self._patterns[name] = re.compile("|".join(
+                "(?<![\\w.-]){0}(?![\\w-])".format(re.escape(host))
+                for host in names
+            ))
+
+        return self._patterns[name].sub(self.replacement, output)
+
+    def __repr__(self):
+        """Shows the replacement, used by --settings."""
+
+        return "HostnameMask({0!r})".format(self.replacement)
+
+
+class NumericBuckets(object):
+    """Replaces numbers with the range they fall in.
+
+    With a size of 10, both 12 and 17 become <10-20>.
+
+    Args::
+
+        size: the integer size of each bucket
+        pattern: optional regex string of the numbers to bucket, by default
+                 any integer or decimal number
+    """
+
+    def __init__(self, size=10, pattern="\\d+(?:\\.\\d+)?"):
+        """Compiles the pattern once."""
+
+        self.size = size
+        self.pattern = re.compile(pattern)
+
+        super(NumericBuckets, self).__init__()
+
+    def __call__(self, output, name):
+        """Returns the output with the numbers bucketed."""
+
+        return self.pattern.sub(self._bucket, output)
+
+    def _bucket(self, match):
+        """Returns the bucket string for a single matched number."""
+
+        try:
+            number = float(match.group(0))
+        except ValueError:
+            return match.group(0)
+
+        low = int(number // self.size * self.size)
+        return "<{0}-{1}>".format(low, low + self.size)
+
+    def __repr__(self):
+        """Shows the bucket size and pattern, used by --settings."""
+
+        return "NumericBuckets({0!r}, {1!r})".format(
+            self.size,
+            self.pattern.pattern,
+        )
+
+
+TIMESTAMPS = RegexMask(
+    "\\d{4}-\\d{2}-\\d{2}[T ]\\d{2}:\\d{2}(?::\\d{2}(?:\\.\\d+)?)?"
+    "(?:Z|[+-]\\d{2}:?\\d{2})?",
+    "<timestamp>",
+)
+CLOCK_TIMES = RegexMask("\\b\\d{1,2}:\\d{2}(?::\\d{2})?\\b", "<time>")
+PIDS = RegexMask(
+    "(?<=\\bpid[ =:])\\s*\\d+|(?<=\\[)\\d+(?=\\])",
+    "<pid>",
+    re.IGNORECASE,
+)
+UPTIMES = RegexMask(
+    "\\bup\\s+(?:\\d+\\s+days?,\\s+)?(?:\\d+:\\d+|\\d+\\s+min)",
+    "up <uptime>",
+)
+LOAD_AVERAGES = RegexMask(
+    "load averages?:\\s*[\\d.]+,?\\s+[\\d.]+,?\\s+[\\d.]+",
+    "load average: <load>",
+)
+
+# used by the --normalize flag
+DEFAULT_NORMALIZERS = [
+    HostnameMask(),
+    TIMESTAMPS,
+    UPTIMES,
+    LOAD_AVERAGES,
+    CLOCK_TIMES,
+    PIDS,
+]
+
+
+def normalize(output, name, normalizers):
+    """Applies each normalizer to the output in order.
+
+    Args::
+
+        output: the string output of a command
+        name: the name of the host the output is from
+        normalizers: a list of normalizer callables
+
+    Returns:
+        the normalized output string
+    """
+
+    for normalizer in normalizers:
+        output = normalizer(output, name)
+    return output
@@ -0,0 +1,155 @@
+"""Profiling of Bladerunner's own overhead, used by --profile."""
+
+
+from __future__ import division
+
+import os
+import sys
+import pstats
+import cProfile
+import threading
+
+
+# before 3.12 cProfile only profiles the thread it's enabled in, after it
+# profiles every thread and there can only be one enabled at a time
+PER_THREAD = sys.version_info < (3, 12)
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SECTIONS = ["bladerunner", "pexpect", "stdlib and others"]
+
+
+class Profiler(object):
+    """Profiles the main thread and every thread started while running.
+
+    Usage example::
+
+        profiler = Profiler()
+        profiler.start()
+        try:
+            runner.run(commands, servers)
+        finally:
+            profiler.stop()
+            profiler.report(sys.stderr)
+    """
+
+    def __init__(self):
+        """Initializes the main thread's profile."""
+
+        self.profile = cProfile.Profile()
+        self.thread_profiles = []
+        self._lock = threading.Lock()
+
+        super(Profiler, self).__init__()
+
+    def _start_thread(self, frame, event, arg):
+        """Starts a profile in a new thread, replacing this profile hook."""
+
+        profile = cProfile.Profile()
+        with self._lock:
+            self.thread_profiles.append(profile)
+        profile.enable()
+
+    def start(self):
+        """Starts profiling, including any threads started after this."""
+
+        if PER_THREAD:
+            threading.setprofile(self._start_thread)
+        self.profile.enable()
+
+    def stop(self):
+        """Stops profiling. Threads still running are profiled until done."""
+
+        self.profile.disable()
+        if PER_THREAD:
+            threading.setprofile(None)
+
+    def stats(self):
+        """Returns the pstats.Stats of every thread combined."""
+
+        stats = pstats.Stats(self.profile)
+        with self._lock:
+            thread_profiles = list(self.thread_profiles)
+        for profile in thread_profiles:
+            stats.add(profile)
+        return stats
+
+    def report(self, stream, limit=25):
+        """Writes the functions which took the most time to a stream.
+
+        Functions are split into sections of bladerunner's own, pexpect's
+        and everything else, each sorted by the time spent in the function
+        itself, not counting the functions it called.
+
+        Args::
+
+            stream: the file object to write the report to
+            limit: the integer number of functions to show per section
+        """
+
+        stats = self.stats()
+        sections = dict((section, []) for section in SECTIONS)
+        for function, (_, calls, own, total, _) in stats.stats.items():
+            sections[_section(function[0])].append(
+                (own, total, calls, function)
+            )
+
+        stream.write(
+            "profile of {0} function calls in {1:.3f}s over {2} threads\n"
+            "".format(
+                stats.total_calls,
+                stats.total_tt,
+                len(self.thread_profiles) + 1,
+            )
+        )
+
+        for section in SECTIONS:
+            functions = sorted(sections[section], reverse=True)
+            stream.write("\n{0} ({1:.3f}s of own time):\n".format(
+                section,
+                sum(own for own, _, _, _ in functions),
+            ))
+            stream.write("{0:>10} {1:>10} {2:>10}  {3}\n".format(
+                "ncalls",
+                "tottime",
+                "cumtime",
+                "function",
+            ))
+            for own, total, calls, function in functions[:limit]:
+                stream.write("{0:>10} {1:>10.3f} {2:>10.3f}  {3}\n".format(
+                    calls,
+                    own,
+                    total,
+                    _function_name(function),
+                ))
+
+
+def _section(filename):
+    """Returns which section of the report a function's file is in."""
+
+    if filename.startswith(PACKAGE_DIR):
+        return "bladerunner"
+
+    parts = filename.split(os.sep)
+    if "pexpect" in parts or "ptyprocess" in parts:
+        return "pexpect"
+
+    return "stdlib and others"
+
+
+def _function_name(function):
+    """Returns a short name of a pstats (filename, line, name) tuple."""
+
+    filename, line, name = function
+    if filename == "~":
+        return name  # builtins
+
+    if filename.startswith(PACKAGE_DIR):
+        filename = os.path.join("bladerunner", os.path.relpath(
+            filename,
+            PACKAGE_DIR,
+        ))
+    else:
+        filename = os.path.basename(filename)
+
+    return "{0}:{1}({2})".format(filename, line, name)
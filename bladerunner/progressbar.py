@@ -7,7 +7,7 @@ from __future__ import division, unicode_literals
 import os
 import sys
 import time
-import argparse
+import threading
 
 try:
     import fcntl
@@ -17,9 +17,18 @@ except ImportError:
     pass
 
 
+# redraws per second of the render thread, when stdout is or isn't a tty
+REFRESH_RATE = 10
+NON_TTY_REFRESH_RATE = 0.5
+
+
 class ProgressBar(object):
     """A simple textual progress bar.
 
+    By default every update() redraws the bar. After start(), update() only
+    bumps the counter and a single background thread redraws the bar at
+    most refresh_rate times a second, only if the counter has changed.
+
     Args::
 
         total_updates: an integer of how many times update() will be called
@@ -29,6 +38,8 @@ class ProgressBar(object):
             show_counters: a boolean to declare showing the counters or not
             left_padding: a string to pad the left side of the bar with
             right_padding: a string to pad the right side of the bar with
+            refresh_rate: redraws per second once started, defaults to 10,
+                          or 0.5 when stdout isn't a tty
     """
 
     def __init__(self, total_updates, options=None):
@@ -42,6 +53,12 @@ class ProgressBar(object):
         self.total_width = options.get('width') or get_term_width()
 
         self.counter = 0  # update counter
+        self.drawn = 0  # _state() of the last draw
+        self.lock = threading.Lock()  # guards counter, held only to bump it
+        self._write_lock = threading.Lock()
+        self.refresh_rate = options.get("refresh_rate") or _refresh_rate()
+        self._stopping = threading.Event()
+        self._thread = None
         self.chars = {
             "left": ["[", "{", ""],
             "right": ["]", "}", ""],
@@ -106,19 +123,77 @@ class ProgressBar(object):
             ))
         sys.stdout.flush()
 
-    def update(self, increment=1):
-        """Updates self.counter by increment and reprints the progress bar."""
+    def start(self):
+        """Starts the background thread which redraws the bar."""
 
-        self.counter += increment
-        if self.counter > self.total:
+        if self._thread is not None:
             return
-        counter_diff = len(str(self.total)) - len(str(self.counter))
-        percent = (self.counter / self.total) * (self.width + counter_diff)
 
-        sys.stdout.write("\r{left}{spaces}".format(
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._render_loop,
+            name="progressbar",
+        )
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stops the render thread, drawing any final updates."""
+
+        if self._thread is None:
+            return
+
+        self._stopping.set()
+        self._thread.join()
+        self._thread = None
+        self.render()
+
+    def _render_loop(self):
+        """Redraws the bar at the refresh rate until stopped."""
+
+        while not self._stopping.wait(1 / self.refresh_rate):
+            self.render()
+
+    def update(self, increment=1):
+        """Updates self.counter by increment and reprints the progress bar.
+
+        The reprint is left to the render thread if it's been started.
+        """
+
+        with self.lock:
+            self.counter += increment
+
+        if self._thread is None:
+            self.render()
+
+    def render(self):
+        """Reprints the progress bar, if it changed since last drawn."""
+
+        with self._write_lock:
+            with self.lock:
+                counter = self.counter
+                state = self._state()
+            if state == self.drawn or counter > self.total:
+                return
+            self.drawn = state
+            sys.stdout.write(self._draw(counter))
+            sys.stdout.flush()
+
+    def _state(self):
+        """Returns what's drawn, the bar is redrawn when this changes."""
+
+        return self.counter
+
+    def _draw(self, counter):
+        """Returns the string to redraw the bar with counter updates."""
+
+        counter_diff = len(str(self.total)) - len(str(counter))
+        percent = (counter / self.total) * (self.width + counter_diff)
+
+        bar = "\r{left}{spaces}".format(
             left=self.chars["left"][self.style],
             spaces=self.chars[100][self.style] * int(percent),
-        ))
+        )
 
         try:
             if not self.total > self.width * 4:
@@ -129,7 +204,7 @@ class ProgressBar(object):
             halfchar = ""
 
         if self.show_counters:
-            sys.stdout.write("{left}{space}{right} {count}/{total}".format(
+            return bar + "{left}{space}{right} {count}/{total}".format(
                 left=halfchar,
                 space=self.chars["space"][self.style] * (
                     self.width
@@ -138,28 +213,40 @@ class ProgressBar(object):
                     - len(halfchar)
                 ),
                 right=self.chars["right"][self.style],
-                count=self.counter,
+                count=counter,
                 total=self.total
-            ))
-        else:
-            sys.stdout.write("{left}{space}{right}".format(
-                left=halfchar,
-                space=self.chars["space"][self.style] * (
-                    self.width
-                    - int(percent)
-                    - len(halfchar)
-                ),
-                right=self.chars["right"][self.style],
-            ))
-        sys.stdout.flush()
+            )
+
+        return bar + "{left}{space}{right}".format(
+            left=halfchar,
+            space=self.chars["space"][self.style] * (
+                self.width
+                - int(percent)
+                - len(halfchar)
+            ),
+            right=self.chars["right"][self.style],
+        )
 
     def clear(self):
         """Clears the progress bar from the screen and resets the cursor."""
 
-        sys.stdout.write("\r{spaces}".format(spaces=" " * self.total_width))
-        sys.stdout.flush()
-        sys.stdout.write("\r")
-        sys.stdout.flush()
+        self.stop()
+        with self._write_lock:
+            sys.stdout.write("\r{spaces}\r".format(
+                spaces=" " * self.total_width,
+            ))
+            sys.stdout.flush()
+
+
+def _refresh_rate():
+    """Returns the default refresh rate, slower if stdout isn't a tty."""
+
+    try:
+        if sys.stdout.isatty():
+            return REFRESH_RATE
+    except (AttributeError, ValueError):
+        pass
+    return NON_TTY_REFRESH_RATE
 
 
 def rounded(number, round_to):
@@ -233,6 +320,8 @@ def cmd_line_help(name):
 def cmd_line_arguments(args):
     """Sets up argparse for the command line demo."""
 
+    import argparse  # only needed for the demo
+
     parser = argparse.ArgumentParser(
         prog="progressbar",
         description="progressbar -- a simple python progress bar",
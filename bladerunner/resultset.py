@@ -0,0 +1,465 @@
+"""Columnar storage of results, with filters that don't copy the results.
+
+Filters on statuses and outputs are vectorized with NumPy when it's installed
+(pip install bladerunner[numpy]), with a pure python fallback giving the same
+results.
+"""
+
+
+import re
+import hashlib
+import threading
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from bladerunner.formatting import DEFAULT_ENCODING, UNICODE_TYPE, apply_deltas
+
+
+# the error code in a failed login's result, see Bladerunner.errors
+ERROR_CODE = re.compile("\\(err: (-\\d+)\\)$")
+
+
+class _Columns(object):
+    """The append only storage shared by a ResultSet and its filtered views.
+
+    Hosts are stored in the order they're added, with their names, status
+    codes, start times and durations. The rows (one per command result) of a
+    host are contiguous, row_start holds the offsets of each host's rows:
+    host i's rows are from row_start[i] up to row_start[i + 1]. Commands and
+    outputs are stored once each, row_command and row_output refer to them
+    by index, and each output's digest is kept alongside it.
+    """
+
+    def __init__(self):
+        """Initializes empty columns."""
+
+        self.names = []
+        self.status = array("i")
+        self.started = array("d")
+        self.duration = array("d")
+        self.row_start = array("l", [0])
+
+        self.commands = []
+        self.command_ids = {}
+        self.row_command = array("l")
+
+        self.outputs = []
+        self.digests = []
+        self.output_ids = {}  # digest => index in outputs
+        self.row_output = array("l")
+
+        self.lock = threading.Lock()
+
+        super(_Columns, self).__init__()
+
+    def add(self, name, results, info):
+        """Appends a single host's results and info."""
+
+        rows = [
+            (self._command_id(command), self._output_id(output))
+            for command, output in results
+        ]
+
+        with self.lock:
+            for command_id, output_id in rows:
+                self.row_command.append(command_id)
+                self.row_output.append(output_id)
+            self.names.append(name)
+            self.status.append(_status(results, info))
+            self.started.append(info.get("started") or 0.0)
+            self.duration.append(info.get("elapsed") or 0.0)
+            self.row_start.append(len(self.row_command))
+
+    def _command_id(self, command):
+        """Returns the index of a command, adding it if it's new."""
+
+        with self.lock:
+            if command not in self.command_ids:
+                self.command_ids[command] = len(self.commands)
+                self.commands.append(command)
+            return self.command_ids[command]
+
+    def _output_id(self, output):
+        """Returns the index of an output, adding it if it's new."""
+
+        if not isinstance(output, bytes):
+            encoded = UNICODE_TYPE(output).encode(DEFAULT_ENCODING, "replace")
+        else:
+            encoded = output
+        digest = hashlib.sha1(encoded).hexdigest()
+
+        with self.lock:
+            if digest not in self.output_ids:
+                self.output_ids[digest] = len(self.outputs)
+                self.outputs.append(output)
+                self.digests.append(digest)
+            return self.output_ids[digest]
+
+    def rows(self, host):
+        """Returns the range of row indexes of a host."""
+
+        return range(self.row_start[host], self.row_start[host + 1])
+
+    def result(self, host):
+        """Builds the legacy result dictionary for a host."""
+
+        return {
+            "name": self.names[host],
+            "results": [
+                (
+                    self.commands[self.row_command[row]],
+                    self.outputs[self.row_output[row]],
+                )
+                for row in self.rows(host)
+            ],
+        }
+
+
+def _status(results, info):
+    """Returns the status code of a host, 0 for success.
+
+    Args::
+
+        results: the list of (command, output) tuples of the host
+        info: the info dictionary from Bladerunner's result_callbacks
+
+    Returns:
+        the error code from info, or parsed from a failed login's result
+    """
+
+    if info.get("error") is not None:
+        return info["error"]
+
+    if len(results) == 1 and results[0][0] == "login":
+        match = ERROR_CODE.search(results[0][1])
+        if match:
+            return int(match.group(1))
+
+    return 0
+
+
+class ResultSet(object):
+    """Results stored by column rather than as a list of dictionaries.
+
+    Filters return new ResultSets which share the storage, only keeping an
+    array of the host indexes selected. Indexing or iterating a ResultSet
+    gives the same dictionaries as Bladerunner.run, built as they're used.
+
+    Usage example::
+
+        result_set = ResultSet()
+        runner.result_callbacks.append(result_set.add)
+        runner.run(commands, servers)
+        pretty_results(result_set.matching("ERROR").consolidate())
+
+    Args:
+        results: an optional list of results from Bladerunner.run, or
+                 consolidated results, to add
+    """
+
+    def __init__(self, results=None, _columns=None, _selection=None):
+        """Initializes the storage, or a view of another's storage."""
+
+        self._columns = _columns or _Columns()
+        self._selection = _selection
+
+        for server in results or []:
+            if "names" not in server:
+                self.add(server)
+                continue
+            deltas = server.get("deltas") or {}
+            for name in server["names"]:
+                self.add({
+                    "name": name,
+                    "results": apply_deltas(
+                        server["results"],
+                        deltas.get(name),
+                    ),
+                })
+
+        super(ResultSet, self).__init__()
+
+    def add(self, server, info=None):
+        """Adds a single host's results, can be used as a result callback.
+
+        Args::
+
+            server: the results dictionary for a single host
+            info: optional dictionary from Bladerunner's result_callbacks
+        """
+
+        if self._selection is not None:
+            raise ValueError("Results can't be added to a filtered ResultSet")
+
+        self._columns.add(server["name"], server["results"], info or {})
+
+    def indexes(self):
+        """Returns an array of the host indexes in this set."""
+
+        if self._selection is None:
+            return array("l", range(len(self._columns.names)))
+        return self._selection
+
+    def _view(self, selection):
+        """Returns a new ResultSet of the selected host indexes."""
+
+        return ResultSet(_columns=self._columns, _selection=selection)
+
+    def __len__(self):
+        """Returns the number of hosts."""
+
+        if self._selection is None:
+            return len(self._columns.names)
+        return len(self._selection)
+
+    def __getitem__(self, index):
+        """Returns the result dictionary of a host, in the run's format.
+
+        Slices return a ResultSet view of the selected hosts instead.
+        """
+
+        if isinstance(index, slice):
+            return self._view(self.indexes()[index])
+
+        if self._selection is None:
+            return self._columns.result(
+                range(len(self._columns.names))[index]
+            )
+        return self._columns.result(self._selection[index])
+
+    def __iter__(self):
+        """Yields the result dictionaries of each host."""
+
+        for host in self.indexes():
+            yield self._columns.result(host)
+
+    def __repr__(self):
+        """Shows the number of hosts."""
+
+        return "<ResultSet of {0} hosts>".format(len(self))
+
+    @property
+    def names(self):
+        """Returns the list of host names."""
+
+        return [self._columns.names[host] for host in self.indexes()]
+
+    @property
+    def statuses(self):
+        """Returns an array of the status codes, 0 for success."""
+
+        return array("i", (self._columns.status[i] for i in self.indexes()))
+
+    @property
+    def durations(self):
+        """Returns an array of the seconds each host took."""
+
+        return array("d", (self._columns.duration[i] for i in self.indexes()))
+
+    def to_list(self):
+        """Returns the results as a list, as returned from Bladerunner.run."""
+
+        return list(self)
+
+    def _arrays(self, *names):
+        """Returns NumPy copies of this set's host indexes and some columns.
+
+        Args:
+            names: the string names of the _Columns arrays to copy
+
+        Returns:
+            a list of the host indexes array, then each column's array
+        """
+
+        columns = self._columns
+        with columns.lock:
+            arrays = [numpy.array(getattr(columns, name)) for name in names]
+            hosts = len(columns.names)
+
+        if self._selection is None:
+            selection = numpy.arange(hosts)
+        else:
+            selection = numpy.array(self._selection)
+        return [selection] + arrays
+
+    def _filter_status(self, test):
+        """Returns a ResultSet of the hosts whose status passes a test.
+
+        Args:
+            test: a function of a status, or array of statuses, to a boolean
+        """
+
+        if numpy is not None:
+            hosts, status = self._arrays("status")
+            return self._view(array("l", hosts[test(status[hosts])].tolist()))
+
+        status = self._columns.status
+        return self._view(array(
+            "l",
+            (host for host in self.indexes() if test(status[host])),
+        ))
+
+    def failed(self):
+        """Returns a ResultSet of the hosts which couldn't be run on."""
+
+        return self._filter_status(lambda status: status < 0)
+
+    def succeeded(self):
+        """Returns a ResultSet of the hosts which were run on."""
+
+        return self._filter_status(lambda status: status >= 0)
+
+    def by_status(self, status_code):
+        """Returns a ResultSet of the hosts with a status code.
+
+        Args:
+            status_code: the integer status code, eg -7 for connect failures
+        """
+
+        return self._filter_status(lambda status: status == status_code)
+
+    def matching(self, pattern, command=None):
+        """Returns a ResultSet of the hosts with an output matching a regex.
+
+        Each distinct output is only searched once, no matter how many hosts
+        it's from. The hosts of the matching outputs are then found with
+        NumPy, if it's installed.
+
+        Args::
+
+            pattern: a regex string or compiled regex
+            command: an optional command, only its outputs are searched
+        """
+
+        columns = self._columns
+        if not hasattr(pattern, "search"):
+            pattern = re.compile(pattern)
+
+        with columns.lock:
+            outputs = list(columns.outputs)
+        matched = set(
+            index for index, output in enumerate(outputs)
+            if pattern.search(output)
+        )
+
+        command_id = None
+        if command is not None:
+            command_id = columns.command_ids.get(command)
+            if command_id is None:
+                return self._view(array("l"))  # never run, nothing matches
+
+        if numpy is not None:
+            return self._view(self._matching_numpy(matched, command_id))
+
+        selection = array("l")
+        for host in self.indexes():
+            for row in columns.rows(host):
+                if command_id is not None and \
+                   columns.row_command[row] != command_id:
+                    continue
+                if columns.row_output[row] in matched:
+                    selection.append(host)
+                    break
+
+        return self._view(selection)
+
+    def _matching_numpy(self, matched, command_id):
+        """Returns an array of the hosts with any row of a matched output.
+
+        Args::
+
+            matched: a set of the indexes of the matched outputs
+            command_id: an optional index of the only command to check
+        """
+
+        hosts, row_start, row_output, row_command = self._arrays(
+            "row_start",
+            "row_output",
+            "row_command",
+        )
+
+        # outputs may have been added since they were searched
+        lookup = numpy.zeros(
+            max(len(row_output) and int(row_output.max()) + 1,
+                len(matched) and max(matched) + 1),
+            dtype=bool,
+        )
+        lookup[numpy.array(sorted(matched), dtype=numpy.intp)] = True
+        rows = lookup[row_output]
+        if command_id is not None:
+            rows &= row_command == command_id
+
+        # the count of matching rows before each row, to count each host's
+        hits = numpy.concatenate(([0], numpy.cumsum(rows)))
+        found = hits[row_start[hosts + 1]] > hits[row_start[hosts]]
+        return array("l", hosts[found].tolist())
+
+    def group_by(self, key="results"):
+        """Groups the hosts.
+
+        Args:
+            key: "results" to group hosts with matching results, or "status"
+                 to group by status code
+
+        Returns:
+            a list of (key value, ResultSet) tuples, in order of first seen.
+            The key value for results is the tuple of (command, output) index
+            tuples, for status it's the status code. Grouping by status uses
+            NumPy if it's installed
+        """
+
+        columns = self._columns
+        if key == "status" and numpy is not None:
+            hosts, status = self._arrays("status")
+            values = status[hosts]
+            _, first, inverse = numpy.unique(
+                values,
+                return_index=True,
+                return_inverse=True,
+            )
+            return [
+                (
+                    int(values[first[group]]),
+                    self._view(array("l", hosts[inverse == group].tolist())),
+                )
+                for group in numpy.argsort(first)
+            ]
+
+        if key == "results":
+            def get_key(host):
+                return tuple(
+                    (columns.row_command[row], columns.row_output[row])
+                    for row in columns.rows(host)
+                )
+        elif key == "status":
+            def get_key(host):
+                return columns.status[host]
+        else:
+            raise ValueError("Unknown group_by key: {0}".format(key))
+
+        groups = {}
+        order = []
+        for host in self.indexes():
+            value = get_key(host)
+            if value not in groups:
+                groups[value] = array("l")
+                order.append(value)
+            groups[value].append(host)
+
+        return [(value, self._view(groups[value])) for value in order]
+
+    def consolidate(self):
+        """Returns the results consolidated, as formatting.consolidate does."""
+
+        consolidated = []
+        for _, group in self.group_by("results"):
+            result = group[0]
+            consolidated.append({
+                "names": group.names,
+                "results": result["results"],
+            })
+        return consolidated
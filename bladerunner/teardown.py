@@ -0,0 +1,157 @@
+"""Tracking and parallel cleanup of the ssh children Bladerunner spawns."""
+
+
+import time
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Teardown(object):
+    """Keeps track of every spawned pexpect child so they can be reaped.
+
+    Args::
+
+        grace: float seconds a child has to exit on its own before signals
+        threads: integer maximum number of children to close at once
+    """
+
+    def __init__(self, grace=0.5, threads=100):
+        """Initializes an empty set of tracked children."""
+
+        self.grace = grace
+        self.threads = threads
+        self.interrupted = False
+        self._children = set()
+        self._lock = threading.Lock()
+
+        super(Teardown, self).__init__()
+
+    @property
+    def children(self):
+        """Returns a list of the currently tracked children."""
+
+        with self._lock:
+            return list(self._children)
+
+    def track(self, child):
+        """Starts tracking a newly spawned child.
+
+        If the teardown has already been interrupted the child is closed right
+        away, so a worker which was mid-spawn on ^C can't leave one behind.
+
+        Args:
+            child: the pexpect spawn object
+        """
+
+        with self._lock:
+            if not self.interrupted:
+                self._children.add(child)
+                return
+
+        self._close_child(child)
+
+    def release(self, child):
+        """Stops tracking a child, it has been closed elsewhere.
+
+        Args:
+            child: the pexpect spawn object
+        """
+
+        with self._lock:
+            self._children.discard(child)
+
+    def close(self, child):
+        """Closes a single child in this thread, and stops tracking it.
+
+        Args:
+            child: the pexpect spawn object
+        """
+
+        self.release(child)
+        self._close_child(child)
+
+    def interrupt(self):
+        """Closes all children and refuses to track any new ones."""
+
+        with self._lock:
+            self.interrupted = True
+
+        self.close_all()
+
+    def close_all(self, children=None, exclude=None):
+        """Closes tracked children concurrently, reaping them all.
+
+        Args::
+
+            children: optional list of children to close, or None for all
+            exclude: optional list of children to leave open
+
+        Returns:
+            None, all of the closed children are no longer tracked
+        """
+
+        exclude = exclude or []
+        with self._lock:
+            if children is None:
+                children = list(self._children)
+            # sessions through a jumpbox share its child, close it just once
+            closing = []
+            for child in children:
+                if child in self._children and child not in exclude:
+                    self._children.discard(child)
+                    closing.append(child)
+
+        if not closing:
+            return
+
+        with ThreadPoolExecutor(max_workers=self.threads) as executor:
+            for _ in executor.map(self._close_child, closing):
+                pass
+
+    def _close_child(self, child):
+        """Closes a single child, escalating from exit to SIGTERM to SIGKILL.
+
+        Args:
+            child: the pexpect spawn object to close
+        """
+
+        try:
+            child.sendline("exit")
+        except (OSError, ValueError):
+            pass
+
+        for sig in (None, signal.SIGTERM, signal.SIGKILL):
+            try:
+                if sig is not None:
+                    child.kill(sig)
+                if _wait_for_exit(child, self.grace if sig is None else 0.1):
+                    break
+            except OSError:
+                break  # the child exited between isalive() and os.kill
+
+        try:
+            # closes the pty and waitpid's the child so it can't zombie
+            child.close(force=True)
+        except Exception:  # pokemon! nothing left we can do for this child
+            pass
+
+
+def _wait_for_exit(child, timeout):
+    """Polls a child until it has exited or the timeout has passed.
+
+    Args::
+
+        child: the pexpect spawn object
+        timeout: float seconds to wait for
+
+    Returns:
+        True if the child has exited
+    """
+
+    deadline = time.time() + timeout
+    while child.isalive():
+        if time.time() >= deadline:
+            return False
+        time.sleep(0.01)
+    return True
@@ -0,0 +1,388 @@
+"""A fake ssh command simulating hosts, for tests and benchmarks.
+
+The FakeFleet's ssh_command is used as Bladerunner's ssh option. Each host
+Bladerunner connects to then runs this file as a fake shell in the pty
+pexpect gives it, behaving as configured for that host. Nothing is resolved
+or connected to, so one machine can emulate thousands of hosts.
+
+Usage example::
+
+    with FakeFleet(password="hunter7") as fleet:
+        fleet.add("web*", commands={"uptime": "up 3 days"}, latency=0.1)
+        fleet.add("db3", refuse=True)
+        runner = Bladerunner({"ssh": fleet.ssh_command, "password": "hunter7"})
+        results = runner.run("uptime", ["web1", "web2", "db1", "db3"])
+
+This file only imports the standard library, and is run directly rather
+than as part of the package, so the fake shells start as fast as they can.
+"""
+
+
+from __future__ import print_function
+
+import os
+import sys
+import json
+import time
+import fnmatch
+import argparse
+import tempfile
+
+try:
+    import termios
+except ImportError:
+    termios = None
+
+
+# the settings of each host, unless configured otherwise
+HOST_DEFAULTS = {
+    # the shell prompt, formatted. Modern bash turns on bracketed paste mode
+    # before each prompt, which Bladerunner relies on to end the output
+    "prompt": "\x1b[?2004h{user}@{host}:~$ ",
+    "password": None,  # the password to ask for, or None to not ask
+    "host_key": False,  # ask to accept a new host key first
+    "banner": "",  # printed after logging in, formatted
+    "connect_delay": 0,  # seconds before the first prompt
+    "refuse": False,  # refuse the connection
+    "hang_login": False,  # never give a prompt after logging in
+    "latency": 0,  # seconds before each command's output
+    "commands": {},  # command => output
+    # output of commands not in commands, formatted with the command, user,
+    # host and count (of times the command has been run in the session)
+    "output": "",
+    "output_size": 0,  # pad each command's output with lines to this size
+    "hang": [],  # commands which never return, until interrupted
+    "fail": [],  # commands which drop the connection
+}
+
+
+class FakeFleet(object):
+    """A configuration of fake hosts, written to a file for the fake shells.
+
+    Hosts are configured with fnmatch patterns of their names, the first
+    matching pattern added is used. Hosts without a match use the defaults.
+
+    Args:
+        defaults: keyword arguments of HOST_DEFAULTS to change for all hosts
+    """
+
+    def __init__(self, **defaults):
+        """Initializes an empty fleet with the defaults."""
+
+        _check_settings(defaults)
+        self.defaults = defaults
+        self.hosts = []  # [pattern, settings]
+        self.path = None
+
+        super(FakeFleet, self).__init__()
+
+    def add(self, pattern, **settings):
+        """Configures the hosts matching a pattern.
+
+        Args::
+
+            pattern: the fnmatch pattern string of host names
+            settings: keyword arguments of HOST_DEFAULTS to change
+        """
+
+        _check_settings(settings)
+        self.hosts.append([pattern, settings])
+        if self.path is not None:
+            self.save()
+
+    def save(self):
+        """Writes the configuration, returning the path of the file."""
+
+        if self.path is None:
+            fd, self.path = tempfile.mkstemp(
+                prefix="bladerunner-fleet-",
+                suffix=".json",
+            )
+            os.close(fd)
+
+        with open(self.path, "w") as config_file:
+            json.dump({"defaults": self.defaults, "hosts": self.hosts},
+                      config_file)
+        return self.path
+
+    @property
+    def ssh_command(self):
+        """Returns the string command to use as Bladerunner's ssh option."""
+
+        return fake_ssh_command(self.save())
+
+    def close(self):
+        """Removes the configuration file."""
+
+        if self.path is not None:
+            os.remove(self.path)
+            self.path = None
+
+    def __enter__(self):
+        """Returns the fleet for use as a context manager."""
+
+        return self
+
+    def __exit__(self, *args):
+        """Removes the configuration file."""
+
+        self.close()
+
+
+def fake_ssh_command(config_path):
+    """Returns the command running a fake shell with a fleet configuration.
+
+    Args:
+        config_path: the string path of the FakeFleet's saved configuration
+    """
+
+    script = os.path.abspath(__file__)
+    if script.endswith((".pyc", ".pyo")):
+        script = script[:-1]
+
+    return "{0} {1} --fleet {2}".format(sys.executable, script, config_path)
+
+
+def _check_settings(settings):
+    """Raises a ValueError for any settings which don't exist."""
+
+    unknown = set(settings) - set(HOST_DEFAULTS)
+    if unknown:
+        raise ValueError("Unknown fake host settings: {0}".format(
+            ", ".join(sorted(unknown))
+        ))
+
+
+def host_settings(config, host):
+    """Returns the settings of a host from a fleet configuration.
+
+    Args::
+
+        config: the dictionary saved by FakeFleet
+        host: the string host name
+
+    Returns:
+        a dictionary of every key in HOST_DEFAULTS
+    """
+
+    settings = dict(HOST_DEFAULTS)
+    settings.update(config.get("defaults") or {})
+    for pattern, host_config in config.get("hosts") or []:
+        if fnmatch.fnmatch(host, pattern):
+            settings.update(host_config)
+            break
+    return settings
+
+
+def command_output(settings, command, user, host, count=1):
+    """Returns the output of a command on a fake host.
+
+    Args::
+
+        settings: the dictionary of host settings
+        command: the string command
+        user: the string user name
+        host: the string host name
+        count: the integer number of times the command has been run
+
+    Returns:
+        the string output, without a trailing newline
+    """
+
+    if command in settings["commands"]:
+        output = settings["commands"][command]
+    else:
+        output = settings["output"].format(
+            command=command,
+            user=user,
+            host=host,
+            count=count,
+        )
+
+    if len(output) < settings["output_size"]:
+        if output:
+            output += "\n"
+        line = "{0} output from {1}\n".format(command, host)
+        padding = settings["output_size"] - len(output)
+        lines = line * (padding // len(line) + 1)
+        output = "{0}{1}".format(output, lines[:padding].rstrip("\n"))
+
+    return output
+
+
+class FakeShell(object):
+    """A fake host's login and shell, on stdin and stdout.
+
+    Args::
+
+        settings: the dictionary of host settings
+        user: the string user name logging in
+        host: the string host name
+    """
+
+    def __init__(self, settings, user, host):
+        """Initializes with the host's settings."""
+
+        self.settings = settings
+        self.user = user
+        self.host = host
+        self.prompt = settings["prompt"].format(user=user, host=host)
+        self.counts = {}  # command => times it's been run
+
+        super(FakeShell, self).__init__()
+
+    def write(self, string):
+        """Writes to stdout immediately."""
+
+        sys.stdout.write(string)
+        sys.stdout.flush()
+
+    def readline(self, echo=True):
+        """Reads a line from stdin, optionally without echoing it."""
+
+        fileno = sys.stdin.fileno()
+        if not echo and termios is not None and os.isatty(fileno):
+            attributes = termios.tcgetattr(fileno)
+            quiet = list(attributes)
+            quiet[3] &= ~termios.ECHO
+            termios.tcsetattr(fileno, termios.TCSADRAIN, quiet)
+            try:
+                line = sys.stdin.readline()
+            finally:
+                termios.tcsetattr(fileno, termios.TCSADRAIN, attributes)
+            self.write("\n")
+        else:
+            line = sys.stdin.readline()
+
+        if not line:
+            raise SystemExit(0)  # EOF, the connection was closed
+        return line.rstrip("\r\n")
+
+    def login(self):
+        """Goes through the host key and password prompts.
+
+        Returns:
+            the integer exit code if the login failed, or None
+        """
+
+        time.sleep(self.settings["connect_delay"])
+
+        if self.settings["refuse"]:
+            self.write("ssh: connect to host {0} port 22: Connection "
+                       "refused\n".format(self.host))
+            return 255
+
+        if self.settings["host_key"]:
+            self.write(
+                "The authenticity of host '{0}' can't be established.\n"
+                "Are you sure you want to continue connecting "
+                "(yes/no)? ".format(self.host)
+            )
+            if self.readline() != "yes":
+                self.write("Host key verification failed.\n")
+                return 255
+
+        if self.settings["password"] is not None:
+            for _ in range(3):
+                self.write("{0}@{1}'s password: ".format(self.user, self.host))
+                if self.readline(echo=False) == self.settings["password"]:
+                    break
+                self.write("Permission denied, please try again.\n")
+            else:
+                self.write("{0}@{1}: Permission denied "
+                           "(publickey,password).\n".format(
+                               self.user, self.host))
+                return 255
+
+        if self.settings["hang_login"]:
+            while True:
+                time.sleep(60)
+
+        if self.settings["banner"]:
+            self.write("{0}\n".format(self.settings["banner"].format(
+                user=self.user,
+                host=self.host,
+            )))
+
+        return None
+
+    def run_command(self, command):
+        """Runs a single command, returning an exit code to disconnect."""
+
+        if command in ("exit", "logout"):
+            self.write("logout\n")
+            return 0
+
+        if command in self.settings["fail"]:
+            self.write("Connection to {0} closed by remote host.\n".format(
+                self.host,
+            ))
+            return 255
+
+        if command in self.settings["hang"]:
+            while True:
+                time.sleep(60)
+
+        time.sleep(self.settings["latency"])
+
+        self.counts[command] = self.counts.get(command, 0) + 1
+        output = command_output(
+            self.settings,
+            command,
+            self.user,
+            self.host,
+            self.counts[command],
+        )
+        if output:
+            self.write("{0}\n".format(output))
+        return None
+
+    def run(self):
+        """Logs in then runs commands until exit, returning the exit code."""
+
+        try:
+            exit_code = self.login()
+        except KeyboardInterrupt:
+            return 255
+        if exit_code is not None:
+            return exit_code
+
+        while True:
+            try:
+                self.write(self.prompt)
+                command = self.readline().strip()
+                if not command:
+                    continue
+                exit_code = self.run_command(command)
+            except KeyboardInterrupt:
+                self.write("^C\n")
+                continue
+            if exit_code is not None:
+                return exit_code
+
+
+def main(args=None):
+    """Runs a fake shell, as ssh would run a real one.
+
+    Args:
+        args: the list of string arguments, the last is the user@host
+    """
+
+    parser = argparse.ArgumentParser(
+        prog="bladerunner-fake-ssh",
+        description="A fake ssh, for testing Bladerunner.",
+    )
+    parser.add_argument("--fleet", metavar="FILE", required=True)
+    parser.add_argument("target", metavar="USER@HOST")
+    options, _ = parser.parse_known_args(args)
+
+    with open(options.fleet) as config_file:
+        config = json.load(config_file)
+
+    user, _, host = options.target.rpartition("@")
+    shell = FakeShell(host_settings(config, host), user, host)
+    raise SystemExit(shell.run())
+
+
+if __name__ == "__main__":
+    main()
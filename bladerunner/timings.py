@@ -0,0 +1,202 @@
+"""Timing of each host's phases and commands, and a summary of the run."""
+
+
+from __future__ import division
+
+import math
+import time
+import threading
+from array import array
+
+from bladerunner.dashboard import PHASES
+from bladerunner.formatting import OutputSink
+
+
+# time.monotonic is python 3.3+, fall back to the wall clock before that
+monotonic = getattr(time, "monotonic", time.time)
+
+SUMMARY_PERCENTILES = [50, 95, 99]
+
+
+class Timings(object):
+    """Records the seconds each host spends in each phase and command.
+
+    Used as one of Bladerunner's phase_callbacks, with phase_changed. The
+    time spent in a phase is from the host entering it until the host enters
+    its next phase, or finishes.
+
+    Usage example::
+
+        timings = Timings()
+        runner.phase_callbacks.append(timings.phase_changed)
+        runner.run(commands, servers)
+        timings_results(timings)
+    """
+
+    def __init__(self):
+        """Initializes empty timings."""
+
+        self.lock = threading.Lock()
+        self._current = {}  # host => (phase, monotonic time it started)
+        self._hosts = {}  # host => {"phases": {}, "commands": []}
+        self.phases = {}  # phase => array of seconds, across all hosts
+        self.commands = {}  # command => array of seconds, across all hosts
+
+        super(Timings, self).__init__()
+
+    def _host(self, server):
+        """Returns the timings of a host, creating them if needed."""
+
+        if server not in self._hosts:
+            self._hosts[server] = {"phases": {}, "commands": []}
+        return self._hosts[server]
+
+    def phase_changed(self, server, phase, when):
+        """Ends the host's previous phase and starts the next.
+
+        Args::
+
+            server: the string hostname
+            phase: the string phase name, or None if the host is finished
+            when: the float monotonic time of the change
+        """
+
+        with self.lock:
+            previous = self._current.pop(server, None)
+            if previous is not None:
+                previous_phase, started = previous
+                seconds = when - started
+                phases = self._host(server)["phases"]
+                phases[previous_phase] = (
+                    phases.get(previous_phase, 0) + seconds
+                )
+                self.phases.setdefault(previous_phase, array("d")).append(
+                    seconds
+                )
+            if phase is not None:
+                self._current[server] = (phase, when)
+
+    def command_finished(self, server, command, seconds):
+        """Records the time a command took on a host.
+
+        Args::
+
+            server: the string hostname
+            command: the string command
+            seconds: the float seconds from sending it to its output
+        """
+
+        with self.lock:
+            self._host(server)["commands"].append((command, seconds))
+            self.commands.setdefault(command, array("d")).append(seconds)
+
+    def pop(self, server):
+        """Removes and returns a finished host's timings.
+
+        Args:
+            server: the string hostname
+
+        Returns:
+            a dictionary of phases (phase => seconds) and commands (a list of
+            (command, seconds) tuples, in the order they were sent)
+        """
+
+        with self.lock:
+            return self._hosts.pop(server, None) or {
+                "phases": {},
+                "commands": [],
+            }
+
+    def summary(self):
+        """Returns the percentiles of each phase and command.
+
+        Returns:
+            a dictionary with phases and commands keys, each a list of (name,
+            stats) tuples. stats is a dictionary of count, max and each of
+            the SUMMARY_PERCENTILES (in seconds). Phases are in run order,
+            commands are sorted
+        """
+
+        with self.lock:
+            phases = [
+                (phase, sorted(self.phases[phase]))
+                for phase in PHASES if phase in self.phases
+            ]
+            commands = [
+                (command, sorted(seconds))
+                for command, seconds in sorted(self.commands.items())
+            ]
+
+        return {
+            "phases": [(name, _stats(ordered)) for name, ordered in phases],
+            "commands": [
+                (name, _stats(ordered)) for name, ordered in commands
+            ],
+        }
+
+
+def _stats(ordered):
+    """Returns the count, max and percentiles of a sorted list of seconds."""
+
+    stats = {"count": len(ordered), "max": ordered[-1]}
+    for rank in SUMMARY_PERCENTILES:
+        stats[rank] = percentile(ordered, rank)
+    return stats
+
+
+def percentile(ordered, rank):
+    """Linear interpolated percentile of a sorted list, as NumPy does.
+
+    Args::
+
+        ordered: a sorted list of numbers
+        rank: the number percentile to return, from 0 to 100
+    """
+
+    position = (len(ordered) - 1) * rank / 100
+    lower = int(math.floor(position))
+    upper = int(math.ceil(position))
+    return ordered[lower] + (
+        (ordered[upper] - ordered[lower]) * (position - lower)
+    )
+
+
+def timings_results(timings, options=None, sink=None):
+    """Prints a table of the percentiles of each phase and command.
+
+    Args::
+
+        timings: the Timings object from the run
+        options: the options dictionary, uses the 'output_file' key
+    """
+
+    summary = timings.summary()
+    rows = [
+        (phase, stats) for phase, stats in summary["phases"]
+    ] + [
+        ("$ {0}".format(command), stats)
+        for command, stats in summary["commands"]
+    ]
+    if not rows:
+        return
+
+    name_width = max(len(name) for name, _ in rows + [("timings", None)])
+    columns = ["p{0}".format(percentile) for percentile in SUMMARY_PERCENTILES]
+    columns.append("max")
+
+    with sink or OutputSink(options) as sink:
+        sink.write("{0}  {1:>7}  {2}".format(
+            "timings".ljust(name_width),
+            "count",
+            "  ".join(column.rjust(9) for column in columns),
+        ), end="\n")
+        for name, stats in rows:
+            values = [stats[percentile] for percentile in SUMMARY_PERCENTILES]
+            values.append(stats["max"])
+            sink.write("{0}  {1:>7}  {2}".format(
+                name.ljust(name_width),
+                stats["count"],
+                "  ".join(
+                    "{0:.3f}s".format(value).rjust(9) for value in values
+                ),
+            ), end="\n")
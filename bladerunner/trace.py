@@ -0,0 +1,186 @@
+"""Timeline traces of runs, in the Chrome trace event format.
+
+The files written open in chrome://tracing or https://ui.perfetto.dev, with
+a track for each worker thread showing the hosts it ran.
+"""
+
+
+import json
+import threading
+
+from bladerunner.timings import monotonic
+
+
+class Tracer(object):
+    """Records the spans of each host's phases and commands.
+
+    Used as one of Bladerunner's phase_callbacks, with phase_changed.
+    Events are stored as tuples in a preallocated ring buffer, once it's
+    full the oldest events are overwritten. They're only converted to
+    trace events when written.
+
+    Usage example::
+
+        tracer = Tracer()
+        runner.phase_callbacks.append(tracer.phase_changed)
+        runner.run(commands, servers)
+        tracer.write("run.trace.json")
+
+    Args:
+        size: the integer number of events to keep
+    """
+
+    def __init__(self, size=2 ** 16):
+        """Preallocates the ring buffer."""
+
+        self.size = size
+        self.events = [None] * size
+        self.started = monotonic()
+        self.threads = {}  # thread ident => (track id, thread name)
+        self.recorded = 0  # including those overwritten
+        self._current = {}  # host => (phase, monotonic start, host start)
+        self._lock = threading.Lock()
+
+        super(Tracer, self).__init__()
+
+    def _record(self, *event):
+        """Adds an event tuple to the ring buffer."""
+
+        with self._lock:
+            self.events[self.recorded % self.size] = event
+            self.recorded += 1
+
+    def _track(self):
+        """Returns the track id of the current thread."""
+
+        thread = threading.current_thread()
+        try:
+            return self.threads[thread.ident][0]
+        except KeyError:
+            with self._lock:
+                if thread.ident not in self.threads:
+                    self.threads[thread.ident] = (
+                        len(self.threads) + 1,
+                        thread.name,
+                    )
+                return self.threads[thread.ident][0]
+
+    def phase_changed(self, server, phase, when):
+        """Ends the host's previous phase span and starts the next.
+
+        When the host finishes, a span for the whole host is also recorded.
+
+        Args::
+
+            server: the string hostname
+            phase: the string phase name, or None if the host is finished
+            when: the float monotonic time of the change
+        """
+
+        track = self._track()
+        previous = self._current.pop(server, None)
+        if previous is None:
+            host_started = when
+        else:
+            previous_phase, started, host_started = previous
+            self._record(
+                "X", previous_phase, "phase", track, started,
+                when - started, server,
+            )
+
+        if phase is None:
+            self._record(
+                "X", server, "host", track, host_started,
+                when - host_started, server,
+            )
+        else:
+            self._current[server] = (phase, when, host_started)
+
+    def command_finished(self, server, command, started, seconds):
+        """Records the span of a command.
+
+        Args::
+
+            server: the string hostname
+            command: the string command
+            started: the float monotonic time it was sent
+            seconds: the float seconds until its output
+        """
+
+        self._record(
+            "X", command, "command", self._track(), started, seconds, server,
+        )
+
+    def instant(self, name, server=None):
+        """Records an instant event on the current thread's track.
+
+        Args::
+
+            name: the string name of the event
+            server: the optional string hostname it happened on
+        """
+
+        self._record("i", name, "event", self._track(), monotonic(), 0, server)
+
+    def trace_events(self):
+        """Returns the events as a list of trace event dictionaries."""
+
+        with self._lock:
+            recorded = self.recorded
+            if recorded > self.size:
+                start = recorded % self.size
+                events = self.events[start:] + self.events[:start]
+            else:
+                events = self.events[:recorded]
+
+        trace_events = [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": 1,
+                "tid": track,
+                "args": {"name": name},
+            }
+            for track, name in sorted(self.threads.values())
+        ]
+
+        for event in events:
+            kind, name, category, track, started, seconds, server = event
+            trace_event = {
+                "name": name,
+                "cat": category,
+                "ph": kind,
+                "pid": 1,
+                "tid": track,
+                "ts": round((started - self.started) * 1e6, 3),
+            }
+            if kind == "X":
+                trace_event["dur"] = round(seconds * 1e6, 3)
+            else:
+                trace_event["s"] = "t"
+            if server is not None:
+                trace_event["args"] = {"host": server}
+            trace_events.append(trace_event)
+
+        return trace_events
+
+    def write(self, path):
+        """Writes the trace to a file.
+
+        Args:
+            path: the string file path to write to
+        """
+
+        trace = {
+            "traceEvents": self.trace_events(),
+            "displayTimeUnit": "ms",
+            "otherData": {
+                "dropped_events": max(self.recorded - self.size, 0),
+            },
+        }
+
+        try:
+            with open(path, "w") as trace_file:
+                json.dump(trace, trace_file)
+        except (IOError, OSError) as error:
+            raise SystemExit("Could not write trace file: {0}".format(error))
@@ -0,0 +1,159 @@
+"""Watch mode, re-running commands on warm sessions to find what changed."""
+
+
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from bladerunner.formatting import OutputSink
+
+
+class Watch(object):
+    """Re-runs commands on interactive sessions, tracking changes per host.
+
+    Sessions are set up with the runner's setup_interactive and kept open
+    between polls. Hosts which couldn't be logged in to are retried on each
+    poll.
+
+    Usage example::
+
+        runner = Bladerunner(options)
+        watch = Watch(runner, ["uptime"], servers)
+        try:
+            while True:
+                pretty_results(watch.poll(), options)
+                time.sleep(5)
+        finally:
+            watch.close()
+
+    Args::
+
+        runner: the Bladerunner object, its options are used for the sessions
+        commands: a list of string commands to run on every poll
+        servers: a list of hostnames or networks, as Bladerunner.run takes
+    """
+
+    def __init__(self, runner, commands, servers):
+        """Sets up the sessions, they're connected on the first poll."""
+
+        self.runner = runner
+        self.commands = list(commands)
+        self.servers = runner._prep_servers(self.commands, list(servers))
+        self.previous = {}  # host => list of (command, output) tuples
+        self.iterations = 0
+
+        runner.setup_interactive(self.servers, connect=False)
+
+        super(Watch, self).__init__()
+
+    def _poll_host(self, server):
+        """Runs the commands on a host, connecting first if needed.
+
+        Returns:
+            a list of (command, output) tuples
+        """
+
+        session = self.runner.interactive_hosts[server]
+        if not session.sshr:
+            if not session.connect(status_return=True):
+                self._close_failed()
+                error = session.error or -1
+                return [("login", self.runner.errors[abs(error) - 1])]
+
+        results = []
+        for command in self.commands:
+            output = session.run(command)
+            if not output or output == "\n":
+                output = "no output from: {0}".format(command)
+            results.append((command, output))
+        return results
+
+    def _close_failed(self):
+        """Closes the jumpbox child a failed connect leaves, if unused.
+
+        Otherwise every poll of a host which can't be logged in to would
+        leave another child, and its file descriptors, open.
+        """
+
+        runner = self.runner
+        if not runner.options["jump_host"] or not runner.sshc:
+            return
+
+        sessions = runner.interactive_hosts.values()
+        in_use = [session.sshr for session in sessions]
+        if runner.sshc not in in_use:
+            runner.teardown.close(runner.sshc)
+            runner.sshc = None
+
+    def poll(self):
+        """Runs the commands on every host once.
+
+        Returns:
+            a list of results dictionaries, as Bladerunner.run returns, of
+            the hosts whose output changed since the last poll (every host
+            on the first poll), in the order of the servers. If interrupted,
+            hosts not yet started are cancelled and the hosts still running
+            are left to close() to end
+        """
+
+        # connecting through a jumpbox shares its connection, one at a time
+        if self.runner.options["jump_host"]:
+            max_threads = 1
+        else:
+            max_threads = self.runner.options["threads"]
+
+        executor = ThreadPoolExecutor(max_workers=max_threads)
+        futures = dict(
+            (server, executor.submit(self._poll_host, server))
+            for server in self.servers
+        )
+        try:
+            wait(list(futures.values()))
+        except KeyboardInterrupt:
+            # don't wait on hung hosts, close() ends their sessions
+            for future in futures.values():
+                future.cancel()
+            executor.shutdown(wait=False)
+            raise
+        executor.shutdown()
+
+        changed = []
+        for server in self.servers:
+            results = futures[server].result()
+            if self.previous.get(server) != results:
+                changed.append({"name": server, "results": results})
+            self.previous[server] = results
+
+        self.iterations += 1
+        return changed
+
+    def close(self):
+        """Ends every session, and closes any children left behind."""
+
+        self.runner.end_interactive()
+        self.runner.teardown.close_all()
+
+
+def watch_header(watch, changed, interval, options=None, sink=None):
+    """Prints a line about a poll, before the hosts which changed.
+
+    Args::
+
+        watch: the Watch object which polled
+        changed: the list of results from the poll
+        interval: the float seconds between polls
+        options: the options dictionary, uses the 'output_file' key
+    """
+
+    with sink or OutputSink(options) as sink:
+        sink.write(
+            "Every {0:g}s: {1}  {2}  (poll {3}, {4} of {5} hosts "
+            "changed)".format(
+                interval,
+                "; ".join(watch.commands),
+                time.strftime("%H:%M:%S"),
+                watch.iterations,
+                len(changed),
+                len(watch.servers),
+            ),
+            end="\n",
+        )
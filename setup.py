@@ -57,10 +57,13 @@ setup(
     extras_require={
         ":python_version < '3.2'": "futures >= 2.2.0",
         ":python_version < '3.3'": "ipaddress >= 1.0.7, < 2.0.0",
+        "numpy": "numpy >= 1.7.0",
     },
     entry_points={
         'console_scripts': [
             'bladerunner = bladerunner.cmdline:main',
+            'bladerunner-query = bladerunner.archive:query_main',
+            'bladerunnerd = bladerunner.daemon:main',
         ]
     },
     url="https://github.com/a-tal/bladerunner",
@@ -0,0 +1,166 @@
+"""Tests for the numeric aggregation of outputs."""
+
+
+import re
+import pytest
+from mock import patch
+
+from bladerunner import aggregate
+
+
+@pytest.fixture
+def load_results():
+    """Returns results of uptime from 10 hosts, one with a high load."""
+
+    results = [
+        {
+            "name": "host{0}".format(index),
+            "results": [(
+                "uptime",
+                "up 3 days,  load average: {0}.00, 0.50, 0.25".format(
+                    index % 3),
+            )],
+        }
+        for index in range(9)
+    ]
+    results.append({
+        "name": "busy",
+        "results": [("uptime", "up 9 days,  load average: 40.00, 9.0, 2.0")],
+    })
+    results.append({"name": "down", "results": [("login", "nope")]})
+    return results
+
+
+def test_extract_value():
+    """Numbers are found with an optional field and regex."""
+
+    assert aggregate.extract_value("used 42%") == 42
+    assert aggregate.extract_value("a 1 2.5e3", field=2) == 2500
+    assert aggregate.extract_value("a 1", field=5) is None
+    pattern = re.compile("average: ([\\d.]+)")
+    assert aggregate.extract_value("load average: 1.5, 2", pattern) == 1.5
+    assert aggregate.extract_value("nothing here", pattern) is None
+    assert aggregate.extract_value("no numbers") is None
+
+
+def test_extract_values(load_results):
+    """Each host gets a value from its first matching output."""
+
+    names, values, missing = aggregate.extract_values(
+        load_results,
+        pattern="average: ([\\d.]+)",
+    )
+
+    assert names[:3] == ["host0", "host1", "host2"]
+    assert values[:3] == [0.0, 1.0, 2.0]
+    assert values[-1] == 40.0
+    assert missing == ["down"]
+
+
+def test_extract_values_skips_failures():
+    """Failed, timed out and silent hosts are counted as without a value."""
+
+    results = [
+        {"name": "ok", "results": [("nproc", "4")]},
+        {"name": "bad", "results": [("login", "Password denied (err: -5)")]},
+        {"name": "slow", "results": [
+            ("sleep 30", "did not return after issuing: sleep 30"),
+        ]},
+        {"name": "quiet", "results": [
+            ("echo 2 >/dev/null", "no output from: echo 2 >/dev/null"),
+        ]},
+        {"name": "later", "results": [
+            ("sleep 5", "did not return after issuing: sleep 5"),
+            ("nproc", "8"),
+        ]},
+    ]
+
+    names, values, missing = aggregate.extract_values(results)
+
+    assert names == ["ok", "later"]
+    assert values == [4.0, 8.0]
+    assert missing == ["bad", "slow", "quiet"]
+
+
+def test_extract_values_consolidated():
+    """Consolidated groups give every host in the group the value."""
+
+    results = [
+        {"names": ["a", "b"], "results": [("df", "12%"), ("wc", "3")]},
+    ]
+    names, values, _ = aggregate.extract_values(results, command="wc")
+    assert names == ["a", "b"]
+    assert values == [3.0, 3.0]
+
+
+def test_aggregate_python(load_results):
+    """The pure python statistics of the extracted values."""
+
+    names, values, _ = aggregate.extract_values(
+        load_results,
+        pattern="average: ([\\d.]+)",
+    )
+    with patch.object(aggregate, "numpy", None):
+        stats = aggregate.aggregate(names, values, bins=4)
+
+    assert stats["count"] == 10
+    assert stats["min"] == 0
+    assert stats["max"] == 40
+    assert stats["mean"] == pytest.approx(4.9)
+    assert stats["percentiles"][50] == 1.0
+    assert stats["percentiles"][90] == pytest.approx(5.8)
+    assert stats["histogram"] == [
+        (0, 10, 9),
+        (10, 20, 0),
+        (20, 30, 0),
+        (30, 40, 1),
+    ]
+    assert stats["outliers"] == [("busy", 40.0)]
+
+
+def test_aggregate_numpy_matches(load_results):
+    """NumPy and the fallback should give the same statistics."""
+
+    pytest.importorskip("numpy")
+
+    names, values, _ = aggregate.extract_values(load_results)
+    vectorized = aggregate.aggregate(names, values)
+    with patch.object(aggregate, "numpy", None):
+        fallback = aggregate.aggregate(names, values)
+
+    for key in ("count", "min", "max", "mean", "std"):
+        assert vectorized[key] == pytest.approx(fallback[key])
+    assert vectorized["percentiles"] == pytest.approx(fallback["percentiles"])
+    assert [count for _, _, count in vectorized["histogram"]] == \
+        [count for _, _, count in fallback["histogram"]]
+    assert vectorized["outliers"] == fallback["outliers"]
+
+
+def test_aggregate_single_value():
+    """A single distinct value still gets a histogram."""
+
+    with patch.object(aggregate, "numpy", None):
+        stats = aggregate.aggregate(["a", "b"], [5.0, 5.0], bins=2)
+
+    assert stats["histogram"] == [(4.5, 5.0, 0), (5.0, 5.5, 2)]
+    assert stats["std"] == 0
+    assert stats["outliers"] == []
+    assert aggregate.aggregate([], []) == {"count": 0}
+
+
+def test_aggregate_results(load_results, capfd):
+    """The report includes the stats, outliers and hosts without values."""
+
+    aggregate.aggregate_results(
+        load_results,
+        {"value_regex": "average: ([\\d.]+)", "width": 60},
+    )
+    stdout, _ = capfd.readouterr()
+
+    assert "count: 10 hosts (1 without a value)" in stdout
+    assert "max: 40" in stdout
+    assert "p50: 1" in stdout
+    assert "outliers: 1\n  busy: 40\n" in stdout
+    assert "without a value: down" in stdout
+    for line in stdout.splitlines():
+        assert len(line) <= 60
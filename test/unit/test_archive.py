@@ -0,0 +1,251 @@
+"""Tests for the SQLite results archive."""
+
+
+import os
+import sys
+import pytest
+import sqlite3
+import tempfile
+from mock import patch
+
+from bladerunner import archive
+from bladerunner.archive import Archive, ArchiveWriter
+from bladerunner.formatting import consolidate
+
+
+@pytest.fixture
+def fake_results():
+    """Returns a dummy result set."""
+
+    result_set_a = [
+        ("echo 'hello world'", "hello world"),
+        ("cat dog", "cat: dog: No such file or directory"),
+    ]
+    result_set_b = [
+        ("echo 'hello world'", "hello world"),
+        ("cat cat", "cat: cat: No such file or directory")
+    ]
+
+    return [
+        {"name": "server_a_1", "results": result_set_a},
+        {"name": "server_a_2", "results": result_set_a},
+        {"name": "server_b_1", "results": result_set_b},
+        {"name": "server_b_2", "results": result_set_b},
+        {"name": "server_c_1", "results": result_set_a + result_set_b},
+    ]
+
+
+@pytest.fixture
+def db_path():
+    """Returns a path to a new temporary database."""
+
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    os.remove(path)
+    yield path
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def archive_run(path, results, commands=None):
+    """Writes a list of results to the archive as a single run."""
+
+    with ArchiveWriter(path, commands, batch_size=2) as writer:
+        for result in results:
+            writer.write_result(result, {"error": 0, "started": 1.0})
+    return writer.run_id
+
+
+def test_writer_round_trip(db_path, fake_results):
+    """Archived results come back in the structure from Bladerunner.run."""
+
+    run_id = archive_run(db_path, fake_results, ["echo 'hello world'"])
+
+    reader = Archive(db_path)
+    assert reader.results() == fake_results
+    assert reader.results(run_id) == fake_results
+    assert consolidate(reader.results()) == consolidate(fake_results)
+
+    runs = reader.runs()
+    assert len(runs) == 1
+    assert runs[0]["hosts"] == len(fake_results)
+    assert runs[0]["commands"] == ["echo 'hello world'"]
+    assert runs[0]["finished"] >= runs[0]["started"]
+
+
+def test_outputs_are_content_addressed(db_path, fake_results):
+    """Identical outputs across hosts and runs are stored once."""
+
+    archive_run(db_path, fake_results)
+    archive_run(db_path, fake_results)
+
+    conn = sqlite3.connect(db_path)
+    outputs = conn.execute("SELECT COUNT(*) FROM outputs").fetchone()[0]
+    hosts = conn.execute("SELECT COUNT(*) FROM hosts").fetchone()[0]
+    unique = set(
+        output for server in fake_results for _, output in server["results"]
+    )
+    assert outputs == len(unique)
+    assert hosts == len(fake_results)
+
+
+def test_filters(db_path, fake_results):
+    """Results can be filtered by host, command and the output text."""
+
+    archive_run(db_path, fake_results)
+    reader = Archive(db_path)
+
+    assert [r["name"] for r in reader.results(hosts=["server_b_1"])] == [
+        "server_b_1",
+    ]
+
+    by_command = reader.results(commands=["cat cat"])
+    assert len(by_command) == 3
+    for result in by_command:
+        assert [command for command, _ in result["results"]] == ["cat cat"]
+
+    searched = reader.results(search="dog")
+    assert [r["name"] for r in searched] == [
+        "server_a_1",
+        "server_a_2",
+        "server_c_1",
+    ]
+
+
+def test_search_without_fts(db_path, fake_results):
+    """Searching falls back to LIKE without a full text index."""
+
+    archive_run(db_path, fake_results)
+    reader = Archive(db_path)
+    reader.fts = False
+
+    assert len(reader.results(search="dog")) == 3
+
+
+def test_search_without_fts_literal(db_path, fake_results):
+    """LIKE wildcards in a search without a full text index are literal."""
+
+    archive_run(db_path, fake_results)
+    reader = Archive(db_path)
+    reader.fts = False
+
+    assert reader.results(search="%") == []
+    assert reader.results(search="_") == []
+
+
+def test_changed(db_path, fake_results):
+    """Only the changed commands on changed hosts should be returned."""
+
+    first = archive_run(db_path, fake_results)
+    fake_results[0]["results"] = [
+        ("echo 'hello world'", "hello moon"),
+        fake_results[0]["results"][1],
+    ]
+    fake_results.append({"name": "server_d_1", "results": [("uptime", "up")]})
+    second = archive_run(db_path, fake_results)
+
+    reader = Archive(db_path)
+    assert reader.changed(first, second) == [
+        {"name": "server_a_1", "results": [fake_results[0]["results"][0]]},
+        {"name": "server_d_1", "results": [("uptime", "up")]},
+    ]
+    assert reader.changed(second) == []
+
+
+def test_find_run(db_path, fake_results):
+    """Runs can be found by id, or the latest at or before a time."""
+
+    with patch.object(archive.time, "time", return_value=100.0):
+        first = archive_run(db_path, fake_results)
+    second = archive_run(db_path, fake_results)
+
+    reader = Archive(db_path)
+    assert reader.find_run() == second
+    assert reader.find_run(str(first)) == first
+    with patch.object(archive, "parse_time", return_value=150.0):
+        assert reader.find_run("1970-01-01") == first
+    with pytest.raises(ValueError):
+        reader.find_run(second + 1)
+
+
+def test_parse_time():
+    """A date alone should include the whole day."""
+
+    day = archive.parse_time("2015-11-27")
+    start = archive.parse_time("2015-11-27 00:00")
+    assert 86399 < day - start < 86400
+    with pytest.raises(ValueError):
+        archive.parse_time("last tuesday")
+
+
+def test_writer_open_error():
+    """Archives which can't be opened should exit before running."""
+
+    with pytest.raises(SystemExit):
+        ArchiveWriter(os.path.join(tempfile.mkdtemp(), "no", "such.db"))
+
+
+def test_writer_errors(db_path, fake_results):
+    """Errors in the writer thread exit, rather than being lost."""
+
+    locked = sqlite3.OperationalError("database is locked")
+    writer = ArchiveWriter(db_path)
+    with patch.object(writer, "_insert", side_effect=locked):
+        writer.write_result(fake_results[0])
+        with pytest.raises(SystemExit) as error:
+            writer.close()
+
+    assert "database is locked" in error.exconly()
+    with pytest.raises(SystemExit):
+        writer.write_result(fake_results[1])
+
+
+def test_writer_waits_for_locks(db_path):
+    """Concurrent runs wait for each other's locks on the database."""
+
+    with patch.object(archive.sqlite3, "connect",
+                      wraps=sqlite3.connect) as p_connect:
+        ArchiveWriter(db_path).close()
+
+    p_connect.assert_called_once_with(db_path, timeout=archive.DEFAULT_TIMEOUT)
+
+
+def test_query_main(db_path, fake_results, capfd):
+    """The query command prints the archived results."""
+
+    archive_run(db_path, fake_results)
+
+    with patch.object(sys, "argv", ["bladerunner-query", db_path, "--csv"]):
+        archive.query_main()
+    stdout, _ = capfd.readouterr()
+    assert "server,command,result" in stdout
+    for server in fake_results:
+        assert server["name"] in stdout
+
+    with patch.object(sys, "argv", ["bladerunner-query", db_path, "--runs"]):
+        archive.query_main()
+    stdout, _ = capfd.readouterr()
+    assert "{0} hosts".format(len(fake_results)) in stdout
+
+
+def test_query_main_no_results(db_path, fake_results):
+    """The query command exits with a message if nothing matches."""
+
+    archive_run(db_path, fake_results)
+    argv = ["bladerunner-query", db_path, "--host", "nowhere"]
+    with patch.object(sys, "argv", argv):
+        with pytest.raises(SystemExit) as error:
+            archive.query_main()
+    assert "No results" in error.exconly()
+
+
+def test_query_main_missing_archive(tmpdir):
+    """The query command exits without creating a mistyped archive."""
+
+    path = str(tmpdir.join("missing.db"))
+    argv = ["bladerunner-query", path, "--runs"]
+    with patch.object(sys, "argv", argv):
+        with pytest.raises(SystemExit) as error:
+            archive.query_main()
+    assert "No archive found" in error.exconly()
+    assert not tmpdir.join("missing.db").exists()
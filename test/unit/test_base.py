@@ -7,6 +7,7 @@ import random
 import pytest
 import pexpect
 import tempfile
+from mock import ANY
 from mock import call
 from mock import Mock
 from mock import patch
@@ -14,6 +15,7 @@ from mock import patch
 from bladerunner import base
 from bladerunner import Bladerunner
 from bladerunner import ProgressBar
+from bladerunner.testing import FakeFleet
 from bladerunner.formatting import FakeStdOut
 
 
@@ -315,6 +317,39 @@ def test_run_parallel_no_check():
     assert results == ["wat", "ok"]
 
 
+def test_run_parallel_interrupted():
+    """On ^C all children should be torn down before the pool is joined."""
+
+    runner = Bladerunner()
+    map_patch = patch.object(
+        base.ThreadPoolExecutor,
+        "map",
+        side_effect=KeyboardInterrupt,
+    )
+
+    with map_patch:
+        with patch.object(runner.teardown, "interrupt") as p_interrupt:
+            with pytest.raises(KeyboardInterrupt):
+                runner._run_parallel_no_check(["nowhere"])
+
+    p_interrupt.assert_called_once_with()
+
+
+def test_run_reaps_leftovers():
+    """Children left from failed logins are closed at the end of run."""
+
+    runner = Bladerunner()
+    session = Mock()
+    runner.interactive_hosts = {"fake": session}
+
+    with patch.object(runner, "_run_parallel"):
+        with patch.object(runner.teardown, "close_all") as p_close_all:
+            runner.run("nothing", "nowhere")
+
+    # interactive sessions are left alone
+    p_close_all.assert_called_once_with(exclude=[session.sshr])
+
+
 def test_run_safely_to_serial():
     """Ensure we only carry on with parallel no check on good first login."""
 
@@ -449,6 +484,248 @@ def test_run_single_success():
     assert p_update.called
 
 
+def test_result_callbacks():
+    """Each host's results are passed to the callbacks as they finish."""
+
+    runner = Bladerunner()
+    callback = Mock()
+    runner.result_callbacks.append(callback)
+
+    with patch.object(base.time, "time", side_effect=[10, 12.5]):
+        with patch.object(runner, "connect", return_value=(None, -3)):
+            ret = runner._run_single("nowhere")
+
+    callback.assert_called_once_with(
+        ret,
+        {"error": -3, "started": 10, "elapsed": 2.5, "timeouts": 0},
+    )
+
+
+def test_phase_callbacks():
+    """Each host's phases are passed to the callbacks in order."""
+
+    runner = Bladerunner({"ssh": "fakessh"})
+    callback = Mock()
+    runner.phase_callbacks.append(callback)
+
+    def fake_connect(*args):
+        runner._phase("nowhere", "connecting")
+        runner._phase("nowhere", "logging in")
+        return ("ok", 1)
+
+    def fake_send(sshc, server):
+        runner._phase(server, "running")
+        return {"name": server, "results": []}
+
+    with patch.object(runner, "connect", side_effect=fake_connect):
+        with patch.object(runner, "send_commands", side_effect=fake_send):
+            with patch.object(runner, "close"):
+                runner._run_single("nowhere")
+
+    assert [c[0][:2] for c in callback.call_args_list] == [
+        ("nowhere", "connecting"),
+        ("nowhere", "logging in"),
+        ("nowhere", "running"),
+        ("nowhere", "closing"),
+        ("nowhere", None),
+    ]
+
+
+def test_connect_resolving_phase():
+    """A host which can't resolve only goes through the resolving phase."""
+
+    runner = Bladerunner()
+    callback = Mock()
+    runner.phase_callbacks.append(callback)
+
+    with patch.object(base, "can_resolve", return_value=False):
+        assert runner.connect("nowhere", "me", None, 22) == (None, -3)
+
+    callback.assert_called_once_with("nowhere", "resolving", ANY)
+
+
+def test_timings_in_results():
+    """With timings on, each host's results include its timings."""
+
+    runner = Bladerunner({"ssh": "fakessh", "timings": True})
+    runner.commands = ["uptime"]
+
+    with patch.object(runner, "_run_parallel", return_value=[]):
+        runner.run("uptime", "nowhere")
+    assert isinstance(runner.timings, base.Timings)
+    assert runner.phase_callbacks == []
+
+    runner.phase_callbacks.append(runner.timings.phase_changed)
+    with patch.object(base, "monotonic", side_effect=[1, 2, 3, 5, 6, 7]):
+        with patch.object(runner, "connect", return_value=("ok", 1)):
+            with patch.object(runner, "_send_cmd", return_value="up"):
+                with patch.object(runner, "close"):
+                    runner._phase("nowhere", "connecting")
+                    ret = runner._run_single("nowhere")
+
+    assert ret["timings"] == {
+        "phases": {"connecting": 1, "running": 4, "closing": 1},
+        "commands": [("uptime", 2)],
+    }
+
+
+def test_trace_written():
+    """With a trace file, the run's trace is written at the end."""
+
+    runner = Bladerunner({"trace": "run.json"})
+
+    with patch.object(base, "Tracer") as p_tracer:
+        with patch.object(runner, "_run_parallel", return_value=[]):
+            runner.run("nothing", "nowhere")
+
+    p_tracer.return_value.write.assert_called_once_with("run.json")
+    assert runner.phase_callbacks == []
+
+
+def test_trace_interrupts():
+    """Interrupts are traced as instant events."""
+
+    runner = Bladerunner({"trace": "run.json"})
+    runner.tracer = Mock()
+
+    with patch.object(runner, "_push_expect_forward"):
+        runner.send_interrupt(Mock())
+
+    runner.tracer.instant.assert_called_once_with("interrupt")
+
+
+def test_metrics_written():
+    """With a metrics file, the run's metrics are written at the end."""
+
+    runner = Bladerunner({"metrics_file": "run.prom", "statsd": "stats:99"})
+
+    with patch.object(base, "Metrics") as p_metrics:
+        with patch.object(runner, "_run_parallel", return_value=[]):
+            runner.run("nothing", ["one", "two"])
+
+    metrics = p_metrics.return_value
+    p_metrics.assert_called_once_with(statsd=("stats", 99))
+    metrics.run_finished.assert_called_once_with(2, ANY)
+    metrics.write_textfile.assert_called_once_with("run.prom")
+    assert metrics.close.called
+    assert runner.phase_callbacks == []
+    assert runner.result_callbacks == []
+
+
+def test_metrics_written_on_errors():
+    """Failed runs still have their metrics written and sent."""
+
+    runner = Bladerunner({
+        "metrics_file": "run.prom",
+        "jump_host": "jumpbox",
+        "jump_pass": "hunter7",
+    })
+
+    with patch.object(base, "Metrics") as p_metrics:
+        with patch.object(runner, "connect", return_value=(None, -7)):
+            with pytest.raises(SystemExit):
+                runner.run("nothing", ["one", "two"])
+
+    metrics = p_metrics.return_value
+    metrics.run_finished.assert_called_once_with(2, ANY)
+    metrics.write_textfile.assert_called_once_with("run.prom")
+    assert metrics.close.called
+
+
+def test_command_timeouts_info():
+    """Commands which timed out are counted in the result callbacks' info."""
+
+    runner = Bladerunner()
+    runner.commands = ["one", "two", "three"]
+    callback = Mock()
+    runner.result_callbacks.append(callback)
+
+    with patch.object(runner, "_send_cmd", side_effect=[-1, "ok", -1]):
+        results = runner.send_commands(Mock(), "nowhere")
+    runner._host_finished(results, 0, 0)
+
+    assert callback.call_args[0][1]["timeouts"] == 2
+    assert runner.command_timeouts == {}
+
+
+def test_dashboard_callbacks():
+    """The dashboard is attached to the callbacks only during the run."""
+
+    runner = Bladerunner({"progressbar": True, "dashboard": True})
+
+    attached = []
+
+    def fake_run(servers):
+        attached.extend(runner.phase_callbacks + runner.result_callbacks)
+        return []
+
+    with patch.object(base, "Dashboard") as p_dashboard:
+        with patch.object(runner, "_run_parallel", side_effect=fake_run):
+            runner.run("nothing", ["one", "two"])
+
+    dashboard = p_dashboard.return_value
+    p_dashboard.assert_called_once_with(2, runner.options, runner.errors)
+    assert attached == [dashboard.phase_changed, dashboard.host_finished]
+    assert runner.phase_callbacks == []
+    assert runner.result_callbacks == []
+    assert dashboard.start.called
+    assert dashboard.clear.called
+
+
+@pytest.mark.parametrize("error", [KeyboardInterrupt, SystemExit])
+def test_run_cleanup_on_errors(error):
+    """The bar is cleared and collectors detached when a run fails."""
+
+    runner = Bladerunner({
+        "progressbar": True,
+        "dashboard": True,
+        "timings": True,
+        "trace": "run.json",
+    })
+
+    with patch.object(base, "Dashboard") as p_dashboard:
+        with patch.object(runner, "_run_parallel", side_effect=error):
+            with pytest.raises(error):
+                runner.run("nothing", ["one", "two"])
+
+    assert p_dashboard.return_value.clear.called
+    assert runner.phase_callbacks == []
+    assert runner.result_callbacks == []
+
+
+def test_run_without_keeping_results():
+    """With keep_results off, run only passes results to the callbacks."""
+
+    runner = Bladerunner({"keep_results": False, "delay": 1})
+    callback = Mock()
+    runner.result_callbacks.append(callback)
+
+    with patch.object(base.time, "sleep"):
+        with patch.object(runner, "connect", return_value=(None, -3)):
+            ret = runner.run("hi", ["one", "two"])
+
+    assert ret == []
+    assert [c[0][0]["name"] for c in callback.call_args_list] == [
+        "one",
+        "two",
+    ]
+
+
+def test_safely_without_keeping_results():
+    """The first host of a safe run also only goes to the callbacks."""
+
+    runner = Bladerunner({"keep_results": False})
+    callback = Mock()
+    runner.result_callbacks.append(callback)
+
+    with patch.object(runner, "connect", return_value=(None, -3)):
+        with patch.object(runner, "_run_serial", return_value=[]):
+            ret = runner._run_parallel_safely(["one", "two"])
+
+    assert ret == []
+    assert callback.call_args[0][0]["name"] == "one"
+
+
 def test_send_cmd_unix_endings(unicode_chr):
     """Ensure the correct line ending is used when unix is specified."""
 
@@ -743,6 +1020,7 @@ def test_connect_new_connection():
     )
     assert runner.sshc == sshr  # could be used as a jumpbox in future connects
     assert sshr.logfile_read == FakeStdOut  # debug is set, logging to stdout
+    assert runner.teardown.children == [sshr]  # tracked for later cleanup
 
 
 def test_connect_new_exceptions(pexpect_exceptions):
@@ -999,9 +1277,22 @@ def test_close_and_terminate():
 
     runner = Bladerunner()
     sshc = Mock()
+    runner.teardown.track(sshc)
     runner.close(sshc, True)
     sshc.sendline.assert_called_once_with("exit")
     assert sshc.terminate.called
+    assert runner.teardown.children == []
+
+
+def test_close_already_closed():
+    """Children already closed by the teardown are not sent anything."""
+
+    runner = Bladerunner()
+    sshc = Mock()
+    sshc.closed = True
+    runner.close(sshc, False)
+    assert not sshc.sendline.called
+    assert not sshc.expect.called
 
 
 def test_close_keep_open(pexpect_exceptions):
@@ -1070,6 +1361,25 @@ def test_end_interactive():
     runner.end_interactive("fake")
 
 
+def test_end_interactive_teardown():
+    """The children of all ended sessions are closed together."""
+
+    runner = Bladerunner()
+    hosts = {"one": Mock(), "two": Mock(), "three": Mock()}
+    runner.interactive_hosts = dict(hosts)
+
+    with patch.object(runner.teardown, "close_all") as p_close_all:
+        runner.end_interactive(["one", "two"])
+
+    assert p_close_all.call_count == 1
+    closed = p_close_all.call_args[0][0]
+    assert sorted(closed, key=id) == sorted(
+        [hosts["one"].sshr, hosts["two"].sshr],
+        key=id,
+    )
+    assert list(runner.interactive_hosts) == ["three"]
+
+
 def test_run_interactive(capfd):
     """Ensure the calls to run a command on a list of hosts interactively."""
 
@@ -1244,3 +1554,29 @@ def test_interactive_connect_failure():
 
     assert res is None
     patched_connect.assert_called_once_with(status_return=True)
+
+
+def test_failed_logins_are_closed():
+    """Children of failed logins are closed as they fail, not at the end."""
+
+    with FakeFleet(password="hunter7") as fleet:
+        runner = Bladerunner({
+            "ssh": fleet.ssh_command,
+            "password": "wrong",
+            "threads": 4,
+            "password_safety": False,
+        })
+        tracked = []
+        runner.result_callbacks.append(
+            lambda results, info: tracked.append(len(runner.teardown.children))
+        )
+        hosts = ["host{0}".format(index) for index in range(20)]
+        results = runner.run("uptime", hosts)
+
+    assert len(results) == 20
+    assert all(
+        result["results"] == [("login", "Password denied (err: -5)")]
+        for result in results
+    )
+    assert max(tracked) <= 4
+    assert runner.teardown.children == []
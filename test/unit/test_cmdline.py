@@ -9,8 +9,16 @@ import tempfile
 from mock import call
 from mock import patch
 
+from bladerunner import base
+from bladerunner import daemon
 from bladerunner import cmdline
+from bladerunner import watch
+from bladerunner import archive
+from bladerunner import timings
+from bladerunner import aggregate
+from bladerunner import profiling
 from bladerunner.base import Bladerunner
+from bladerunner.normalizers import DEFAULT_NORMALIZERS
 from bladerunner.cmdline import (
     argparse_unlisted,
     cmdline_entry,
@@ -36,6 +44,7 @@ def option_mismatches():
         "shell_prompts": "match",
         "extra_prompts": "match",
         "csv_char": "csv-separator",
+        "keep_results": "stream",
         "progressbar": "--",
         "cmd_timeout": "command-timeout",
         "width": "--",
@@ -448,19 +457,54 @@ def test_stacked_is_called_when_flat():
 def test_main_calls():
     """Verify the console entry point calls with mock."""
 
-    with patch.object(cmdline, "cmdline_entry", return_value=(1, 2, 3)):
-        with patch.object(cmdline, "Bladerunner") as br_patch:
+    options = {"style": 0}
+    with patch.object(cmdline, "cmdline_entry", return_value=(1, 2, options)):
+        with patch.object(base, "Bladerunner") as br_patch:
             with patch.object(cmdline, "cmdline_exit") as exit_patch:
                 cmdline.main()
 
     # the 3rd return from cmdline_entry is the options dict, used in BR init
-    br_patch.assert_called_once_with(3)
+    br_patch.assert_called_once_with(options)
 
     # run should be called with the 1st and 2nd return as commands and servers
     br_patch.run.aassert_called_once_with(1, 2)
 
-    # finally, the exit call takes the return from run and the initial options
-    exit_patch.assert_called_once_with(br_patch().run(), 3)
+    # finally, the exit call takes the return from run, the initial options
+    # and the runner's timings
+    exit_patch.assert_called_once_with(
+        br_patch().run(),
+        options,
+        br_patch().timings,
+    )
+
+
+def test_exit_with_timings():
+    """The timings are summarized after the results."""
+
+    with patch.object(cmdline, "pretty_results") as p_pretty:
+        with patch.object(timings, "timings_results") as p_timings:
+            with pytest.raises(SystemExit):
+                cmdline_exit(["fake"], {"style": 0}, "timings")
+
+    p_pretty.assert_called_once_with(["fake"], {"style": 0})
+    p_timings.assert_called_once_with("timings", {"style": 0})
+
+
+def test_main_profile():
+    """With --profile, the whole main flow runs under the profiler."""
+
+    sys.argv.extend(["--profile", "uptime", "nowhere"])
+    with patch.object(profiling, "Profiler") as p_profiler:
+        with patch.object(cmdline, "run_main") as p_run_main:
+            cmdline.main()
+
+    profiler = p_profiler.return_value
+    assert profiler.mock_calls == [
+        call.start(),
+        call.stop(),
+        call.report(sys.stderr),
+    ]
+    p_run_main.assert_called_once_with()
 
 
 def test_main_kb_interrupt():
@@ -471,3 +515,235 @@ def test_main_kb_interrupt():
             cmdline.main()
 
     assert "interrupted" in error.exconly()
+
+
+def test_main_kb_interrupt_teardown():
+    """A KeyboardInterrupt during the run tears down all ssh children."""
+
+    with patch.object(cmdline, "cmdline_entry", return_value=(1, 2, {})):
+        with patch.object(base, "Bladerunner") as br_patch:
+            br_patch().run.side_effect = KeyboardInterrupt
+            with pytest.raises(SystemExit) as error:
+                cmdline.main()
+
+    assert "interrupted" in error.exconly()
+    br_patch().teardown.interrupt.assert_called_once_with()
+
+
+def test_main_streams_csv():
+    """With --stream the CSV rows are written from the result callbacks."""
+
+    options = {"csv_stream": True}
+    with patch.object(cmdline, "cmdline_entry", return_value=(1, 2, options)):
+        with patch.object(base, "Bladerunner") as br_patch:
+            br_patch().result_callbacks = []
+            with patch.object(cmdline, "CsvWriter") as writer_patch:
+                with patch.object(cmdline, "cmdline_exit") as exit_patch:
+                    with pytest.raises(SystemExit):
+                        cmdline.main()
+
+    writer_patch.assert_called_once_with(options, stream=True)
+    writer = writer_patch().__enter__()
+    assert br_patch().result_callbacks == [writer.write_result]
+    br_patch().run.assert_called_once_with(1, 2)
+    assert not exit_patch.called
+
+
+def test_stream_settings():
+    """Streaming implies CSV, no kept results and no progressbar."""
+
+    sys.argv.extend(["--stream", "-nN", "w", "host"])
+    _, _, options = cmdline_entry()
+
+    assert options["style"] == -1
+    assert options["csv_stream"] is True
+    assert options["keep_results"] is False
+    assert options["progressbar"] is False
+
+
+def test_main_streams_jsonl():
+    """With --jsonl the JSON Lines are written from the result callbacks."""
+
+    options = {"jsonl": True}
+    with patch.object(cmdline, "cmdline_entry", return_value=(1, 2, options)):
+        with patch.object(base, "Bladerunner") as br_patch:
+            br_patch().result_callbacks = []
+            with patch.object(cmdline, "JsonlWriter") as writer_patch:
+                with pytest.raises(SystemExit):
+                    cmdline.main()
+
+    writer_patch.assert_called_once_with(options, stream=True)
+    writer = writer_patch().__enter__()
+    assert br_patch().result_callbacks == [writer.write_result]
+
+
+def test_jsonl_settings():
+    """Grouped JSON Lines implies JSON Lines, which doesn't keep results."""
+
+    sys.argv.extend(["--jsonl-groups", "-nN", "w", "host"])
+    _, _, options = cmdline_entry()
+
+    assert options["jsonl"] is True
+    assert options["jsonl_groups"] is True
+    assert options["keep_results"] is False
+    assert options["progressbar"] is False
+    assert options["style"] == 0
+
+
+def test_main_archives_results():
+    """With --archive the results are also written to the archive."""
+
+    options = {"archive": "results.db", "style": 0}
+    with patch.object(cmdline, "cmdline_entry", return_value=(1, 2, options)):
+        with patch.object(base, "Bladerunner") as br_patch:
+            br_patch().result_callbacks = []
+            with patch.object(archive, "ArchiveWriter") as archive_patch:
+                with patch.object(cmdline, "cmdline_exit") as exit_patch:
+                    cmdline.main()
+
+    archive_patch.assert_called_once_with("results.db", 1)
+    assert br_patch().result_callbacks == [archive_patch().write_result]
+    archive_patch().close.assert_called_once_with()
+    exit_patch.assert_called_once_with(
+        br_patch().run(),
+        options,
+        br_patch().timings,
+    )
+
+
+def test_normalize_settings():
+    """Masks and the default normalizers are set from the flags."""
+
+    sys.argv.extend(["--normalize", "-M", "[0-9]+", "-e", "-nN", "w", "host"])
+    _, _, options = cmdline_entry()
+
+    assert options["normalizers"][0]("pid 123", "host") == "pid <masked>"
+    assert options["normalizers"][1:] == DEFAULT_NORMALIZERS
+
+
+def test_summary_exit():
+    """Summary output is used over stacked and pretty results."""
+
+    options = {"summary": 5, "style": 0, "stacked": True}
+    with patch.object(cmdline, "summary_results") as summary_patch:
+        with pytest.raises(SystemExit):
+            cmdline_exit(["fake"], options)
+
+    summary_patch.assert_called_once_with(["fake"], options)
+
+
+def test_summary_hosts_settings():
+    """A summary hosts file implies the default summary."""
+
+    sys.argv.extend(["--summary-hosts", "hosts.jsonl", "-nN", "w", "host"])
+    _, _, options = cmdline_entry()
+
+    assert options["summary"] == 10
+    assert options["summary_hosts"] == "hosts.jsonl"
+
+
+def test_aggregate_exit():
+    """Aggregate output is used over every other output style."""
+
+    options = {"aggregate": True, "summary": 5, "style": -1}
+    with patch.object(aggregate, "aggregate_results") as aggregate_patch:
+        with pytest.raises(SystemExit):
+            cmdline_exit(["fake"], options)
+
+    aggregate_patch.assert_called_once_with(["fake"], options)
+
+
+def test_aggregate_settings():
+    """A value regex or field implies aggregation, bad regexes exit."""
+
+    sys.argv.extend(["--value-field", "2", "-nN", "w", "host"])
+    _, _, options = cmdline_entry()
+    assert options["aggregate"] is True
+    assert options["value_field"] == 2
+
+    sys.argv[1:] = ["--value-regex", "(", "-nN", "w", "host"]
+    with pytest.raises(SystemExit) as error:
+        cmdline_entry()
+    assert "Invalid --value-regex" in error.exconly()
+
+
+def test_daemon_settings():
+    """A daemon socket implies running on the daemon."""
+
+    sys.argv.extend(["--daemon-socket", "/run/br.sock", "-nN", "w", "host"])
+    _, _, options = cmdline_entry()
+
+    assert options["daemon"] is True
+    assert options["daemon_socket"] == "/run/br.sock"
+
+
+def test_main_daemon():
+    """With --daemon the job is run by bladerunnerd, not a local runner."""
+
+    options = {"daemon": True, "daemon_socket": None, "style": 0}
+    with patch.object(cmdline, "cmdline_entry", return_value=(1, 2, options)):
+        with patch.object(daemon, "run_job") as job_patch:
+            with patch.object(base, "Bladerunner") as br_patch:
+                with patch.object(cmdline, "cmdline_exit") as exit_patch:
+                    exit_patch.side_effect = SystemExit
+                    with pytest.raises(SystemExit):
+                        cmdline.main()
+
+    assert job_patch.call_args[0][:4] == (None, 1, 2, options)
+    exit_patch.assert_called_once_with(job_patch(), options)
+    assert not br_patch.called
+
+
+def test_main_daemon_streams():
+    """Streamed output is written as the daemon sends each host."""
+
+    options = {"daemon": True, "daemon_socket": "br.sock", "jsonl": True}
+    with patch.object(cmdline, "cmdline_entry", return_value=(1, 2, options)):
+        with patch.object(daemon, "run_job") as job_patch:
+            with patch.object(cmdline, "JsonlWriter") as writer_patch:
+                with pytest.raises(SystemExit):
+                    cmdline.main()
+
+    callback = job_patch.call_args[0][4]
+    callback({"name": "host", "results": []})
+    writer = writer_patch().__enter__()
+    writer.write_result.assert_called_once_with(
+        {"name": "host", "results": []}
+    )
+
+
+def test_watch_settings():
+    """The watch interval is given in seconds, and must be positive."""
+
+    sys.argv.extend(["--watch", "2.5", "-nN", "w", "host"])
+    _, _, options = cmdline_entry()
+    assert options["watch"] == 2.5
+
+    sys.argv[-5:] = ["--watch", "0", "-nN", "w", "host"]
+    with pytest.raises(SystemExit) as error:
+        cmdline_entry()
+    assert "--watch" in error.exconly()
+
+
+def test_main_watch():
+    """With --watch only the hosts which changed are output each poll."""
+
+    options = {"watch": 5, "style": 0}
+    changed = [[{"name": "a"}, {"name": "b"}], [], [{"name": "b"}]]
+    with patch.object(cmdline, "cmdline_entry", return_value=(1, 2, options)):
+        with patch.object(base, "Bladerunner") as br_patch:
+            with patch.object(watch, "Watch") as watch_patch:
+                watch_patch().poll.side_effect = changed + [KeyboardInterrupt]
+                with patch.object(watch, "watch_header"):
+                    with patch.object(cmdline, "cmdline_output") as p_output:
+                        with patch("time.sleep") as p_sleep:
+                            with pytest.raises(SystemExit):
+                                cmdline.main()
+
+    watch_patch.assert_called_with(br_patch(options), 1, 2)
+    assert p_output.mock_calls == [
+        call(changed[0], options),
+        call(changed[2], options),
+    ]
+    assert p_sleep.call_count == 3
+    watch_patch().close.assert_called_once_with()
@@ -0,0 +1,277 @@
+"""Tests for bladerunnerd and its client."""
+
+
+import os
+import json
+import socket
+import shutil
+import pytest
+import tempfile
+import threading
+
+from mock import patch
+
+from bladerunner.testing import FakeFleet
+from bladerunner.daemon import _remove_stale_socket, default_socket_path
+from bladerunner.daemon import BladerunnerDaemon, SessionPool, run_job
+
+
+@pytest.fixture
+def fleet():
+    """Returns a fake fleet, with a host the password doesn't work on."""
+
+    with FakeFleet(password="hunter7") as fake_fleet:
+        fake_fleet.add("web*", commands={"uptime": "up 3 days"})
+        fake_fleet.add("locked", password="other")
+        yield fake_fleet
+
+
+@pytest.fixture
+def options(fleet):
+    """Returns job options to run on the fake fleet."""
+
+    return {"ssh": fleet.ssh_command, "password": "hunter7", "threads": 5}
+
+
+@pytest.fixture
+def socket_path():
+    """Returns a socket path in a new temporary directory."""
+
+    directory = tempfile.mkdtemp()
+    yield os.path.join(directory, "bladerunnerd.sock")
+    shutil.rmtree(directory)
+
+
+@pytest.fixture
+def daemon(socket_path):
+    """Returns a daemon serving in a thread, stopped after the test."""
+
+    server = BladerunnerDaemon(socket_path, idle_timeout=60)
+    thread = threading.Thread(target=server.serve)
+    thread.start()
+    yield server
+    server.shutdown()
+    thread.join()
+
+
+def test_sessions_are_reused(options):
+    """Hosts are only connected to once across jobs."""
+
+    pool = SessionPool()
+    try:
+        first = pool.run_host("web1", ["uptime"], options)
+        session = pool.session("web1", options)
+        sshr = session.interactive.sshr
+        second = pool.run_host("web1", ["uptime", "whoami"], options)
+    finally:
+        pool.close()
+
+    assert first == {"name": "web1", "results": [("uptime", "up 3 days")]}
+    assert second["results"] == [
+        ("uptime", "up 3 days"),
+        ("whoami", "no output from: whoami"),
+    ]
+    assert sshr is not None
+    assert session.interactive.sshr is None  # ended by close
+    assert pool.sessions == {}
+
+
+def test_sessions_by_connection_options(options):
+    """Different users or ports get their own sessions to a host."""
+
+    pool = SessionPool()
+    first = pool.session("web1", options)
+    assert pool.session("web1", dict(options, cmd_timeout=5)) is first
+    assert pool.session("web1", dict(options, username="other")) is not first
+    assert pool.session("web1", dict(options, port=2222)) is not first
+    assert len(pool.sessions) == 3
+
+
+def test_login_failure(options):
+    """Failed logins report the error and aren't kept in the pool."""
+
+    pool = SessionPool()
+    results = pool.run_host("locked", ["uptime"], options)
+
+    assert results == {
+        "name": "locked",
+        "results": [("login", "Password denied (err: -5)")],
+    }
+    assert pool.sessions == {}
+
+
+def test_reap(options):
+    """Sessions idle past the timeout are ended, unless in use."""
+
+    pool = SessionPool(idle_timeout=10)
+    idle = pool.session("web1", options)
+    busy = pool.session("web2", options)
+    fresh = pool.session("web3", options)
+    idle.last_used = busy.last_used = fresh.last_used - 60
+
+    with busy.lock:
+        pool.reap(now=fresh.last_used)
+
+    assert idle.ended
+    assert not busy.ended
+    assert set(pool.sessions.values()) == set([busy, fresh])
+
+
+def test_run_job(daemon, socket_path, options):
+    """Results are streamed back for each host, then returned together."""
+
+    streamed = []
+    results = run_job(
+        socket_path,
+        ["uptime"],
+        ["web1", "web2", "locked"],
+        options,
+        streamed.append,
+    )
+
+    assert sorted(results, key=lambda result: result["name"]) == [
+        {"name": "locked",
+         "results": [("login", "Password denied (err: -5)")]},
+        {"name": "web1", "results": [("uptime", "up 3 days")]},
+        {"name": "web2", "results": [("uptime", "up 3 days")]},
+    ]
+    assert streamed == results
+
+    # the second job uses the sessions from the first
+    sessions = dict(daemon.pool.sessions)
+    assert len(sessions) == 2
+    run_job(socket_path, ["uptime"], ["web1", "web2"], options)
+    assert daemon.pool.sessions == sessions
+
+
+def test_run_job_not_kept(daemon, socket_path, options):
+    """Without keep_results, results are only given to the callback."""
+
+    streamed = []
+    options["keep_results"] = False
+    results = run_job(socket_path, ["uptime"], ["web1"], options,
+                      streamed.append)
+
+    assert results == []
+    assert streamed == [{"name": "web1", "results": [("uptime", "up 3 days")]}]
+
+
+def test_invalid_job(daemon, socket_path):
+    """Invalid jobs get an error back."""
+
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.connect(socket_path)
+    try:
+        client.sendall(b'{"commands": ["uptime"]}\n')
+        response = json.loads(client.makefile("rb").readline().decode("utf-8"))
+    finally:
+        client.close()
+
+    assert response["error"].startswith("Invalid job")
+
+
+def test_no_daemon(socket_path):
+    """The client exits if the daemon isn't running."""
+
+    with pytest.raises(SystemExit) as error:
+        run_job(socket_path, ["uptime"], ["web1"], {})
+
+    assert "Could not connect to bladerunnerd" in error.exconly()
+
+
+def test_socket_permissions(daemon, socket_path):
+    """Only the user running the daemon can use its socket."""
+
+    assert os.stat(socket_path).st_mode & 0o077 == 0
+
+
+def test_already_running(daemon, socket_path):
+    """A second daemon can't take over the socket of a running one."""
+
+    with pytest.raises(SystemExit) as error:
+        _remove_stale_socket(socket_path)
+
+    assert "already running" in error.exconly()
+
+
+def test_stale_socket(socket_path):
+    """Sockets left behind by a daemon that's gone are removed."""
+
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(socket_path)
+    stale.close()
+
+    _remove_stale_socket(socket_path)
+
+    assert not os.path.exists(socket_path)
+
+
+def test_default_socket_path():
+    """The default socket is in a directory of the user's own."""
+
+    with patch.dict(os.environ, {"XDG_RUNTIME_DIR": "/run/user/1000"}):
+        path = default_socket_path()
+
+    assert path == "/run/user/1000/bladerunnerd-{0}/bladerunnerd.sock".format(
+        os.getuid()
+    )
+
+
+def test_socket_directory_created(socket_path):
+    """The daemon creates a missing socket directory, only for this user."""
+
+    path = os.path.join(os.path.dirname(socket_path), "new", "br.sock")
+    server = BladerunnerDaemon(path)
+    server.server_close()
+
+    assert os.stat(os.path.dirname(path)).st_mode & 0o777 == 0o700
+
+
+def test_shared_socket_directory(socket_path):
+    """Sockets in directories other users can write to aren't used."""
+
+    os.chmod(os.path.dirname(socket_path), 0o777)
+    with pytest.raises(SystemExit) as error:
+        run_job(socket_path, ["uptime"], ["web1"], {"password": "hunter7"})
+
+    assert "writable by other users" in error.exconly()
+
+
+def test_socket_directory_owner(daemon, socket_path):
+    """Sockets in directories owned by other users aren't used."""
+
+    with patch("os.getuid", return_value=os.getuid() + 1):
+        with pytest.raises(SystemExit) as error:
+            run_job(socket_path, ["uptime"], ["web1"], {"password": "hunter7"})
+
+    assert "not a directory owned by this user" in error.exconly()
+
+
+def test_daemon_owner(daemon, socket_path):
+    """Jobs aren't sent to a daemon running as another user."""
+
+    real_lstat = os.lstat
+    other_uid = os.getuid() + 1
+
+    class Owned(object):
+        """The socket's details, as if this user owned it."""
+
+        def __init__(self, details):
+            self.st_mode = details.st_mode
+            self.st_uid = other_uid
+
+    def lstat(path):
+        """Returns the real details, owned by the patched user."""
+
+        return Owned(real_lstat(path))
+
+    received = []
+    daemon.run_job = lambda *args: received.append(args)
+    with patch("os.getuid", return_value=other_uid):
+        with patch("os.lstat", side_effect=lstat):
+            with pytest.raises(SystemExit) as error:
+                run_job(socket_path, ["uptime"], ["web1"],
+                        {"password": "hunter7"})
+
+    assert "running as another user" in error.exconly()
+    assert received == []
@@ -0,0 +1,110 @@
+"""Tests for the live run dashboard."""
+
+
+from mock import patch
+
+from bladerunner import dashboard
+from bladerunner.dashboard import Dashboard
+
+
+ERRORS = ["error {0}".format(index) for index in range(7)]
+
+
+def test_phases_in_flight():
+    """Hosts move between phases, and leave them when finished."""
+
+    dash = Dashboard(10, {"width": 80}, ERRORS)
+    dash.phase_changed("one", "resolving", 1)
+    dash.phase_changed("two", "resolving", 1)
+    dash.phase_changed("one", "connecting", 2)
+    dash.phase_changed("two", None, 3)
+
+    stats = dash.stats()
+    assert stats["in_flight"] == {
+        "resolving": 0,
+        "connecting": 1,
+        "logging in": 0,
+        "running": 0,
+        "closing": 0,
+    }
+    assert dash.phases == {"one": "connecting"}
+
+
+def test_error_counts():
+    """Each error code is counted as hosts finish."""
+
+    dash = Dashboard(10, {"width": 80}, ERRORS)
+    dash.host_finished({}, {"error": -7})
+    dash.host_finished({}, {"error": -7})
+    dash.host_finished({}, {"error": -3})
+    dash.host_finished({}, {"error": 0})
+
+    errors = dash.stats()["errors"]
+    assert errors[-7] == 2
+    assert errors[-3] == 1
+    assert sum(errors.values()) == 3
+
+
+def test_rate_and_eta():
+    """The rate is averaged since start, then over the recent window."""
+
+    dash = Dashboard(100, {"width": 80, "rate_window": 3}, ERRORS)
+    dash.started = 0
+
+    with patch.object(dashboard.time, "time", side_effect=[5, 10]):
+        dash.host_finished({}, {"error": 0})
+        dash.host_finished({}, {"error": 0})
+    dash.counter = 2
+    stats = dash.stats(now=10)
+    assert stats["rate"] == 0.2
+    assert stats["eta"] == 490
+
+    with patch.object(dashboard.time, "time", side_effect=[11, 12]):
+        dash.host_finished({}, {"error": 0})
+        dash.host_finished({}, {"error": 0})
+    dash.counter = 4
+    # the window is the last 3 finishes, 10 to 12
+    assert dash.stats(now=12)["rate"] == 1
+    assert dash.stats(now=12)["eta"] == 96
+
+
+def test_no_eta_without_rate():
+    """The ETA is unknown until a host finishes."""
+
+    dash = Dashboard(10, {"width": 80}, ERRORS)
+    assert dash.stats()["eta"] is None
+
+
+def test_draw_fits_width():
+    """The line is padded or cut to the width, with the stats after the bar."""
+
+    dash = Dashboard(10, {"width": 80}, ERRORS)
+    dash.counter = 1
+    dash.phase_changed("one", "running", 1)
+    dash.host_finished({}, {"error": -7})
+
+    line = dash._draw(1)
+    assert line.startswith("\r[")
+    assert len(line) == 81
+    assert " 1/10 " in line
+    assert "running 1" in line
+    assert "err -7=1" in line
+    assert "connecting" not in line
+
+    dash = Dashboard(10, {"width": 30}, ERRORS)
+    dash.phase_changed("one", "running", 1)
+    assert len(dash._draw(0)) == 31
+
+
+def test_redraws_on_change(capfd):
+    """Phase changes redraw the line even when the counter hasn't moved."""
+
+    dash = Dashboard(10, {"width": 60}, ERRORS)
+    dash.render()
+    stdout, _ = capfd.readouterr()
+    assert "resolving" not in stdout
+
+    dash.phase_changed("one", "resolving", 1)
+    dash.render()
+    stdout, _ = capfd.readouterr()
+    assert "resolving 1" in stdout
@@ -5,8 +5,11 @@
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import io
 import os
+import csv
 import sys
+import json
 import pytest
 import tempfile
 from mock import call
@@ -19,6 +22,7 @@ else:
     import __builtin__
 
 from bladerunner import formatting
+from bladerunner.normalizers import HostnameMask
 
 
 @pytest.fixture
@@ -98,18 +102,65 @@ def test_no_empties():
     assert emptyless == ["something", "else", "and", "things"]
 
 
-def test_no_empties_encodings(fake_unicode_encode_error):
-    """All of DEFAULT_ENCODINGS should be tried on items in the input list."""
+def test_no_empties_encodings(fake_unicode_decode_error):
+    """All of DEFAULT_ENCODINGS should be tried on undecodable bytes lines."""
 
     decode_patch = patch.object(
         formatting.codecs,
-        "encode",
-        side_effect=fake_unicode_encode_error,
+        "decode",
+        side_effect=fake_unicode_decode_error,
+    )
+    with decode_patch as patched_decode:
+        assert formatting.no_empties([b"something "]) == [b"something"]
+
+    # the whole block is tried first, then each line with all encodings
+    assert patched_decode.call_args_list == [
+        call(b"something ", formatting.DEFAULT_ENCODING),
+    ] + [call(b"something ", enc) for enc in formatting.DEFAULT_ENCODINGS]
+
+
+def test_no_empties_decodes_bytes():
+    """Bytes items are decoded, strings are only stripped."""
+
+    assert formatting.no_empties([b" caf\xc3\xa9 ", "", " ok "]) == [
+        "caf\xe9",
+        "ok",
+    ]
+
+
+def test_decode_output_once():
+    """A block of valid output should be decoded with a single call."""
+
+    with patch.object(formatting.codecs, "decode", return_value="ok") as p_dec:
+        assert formatting.decode_output(b"one\ntwo\nthree") == "ok"
+
+    p_dec.assert_called_once_with(
+        b"one\ntwo\nthree",
+        formatting.DEFAULT_ENCODING,
+    )
+
+
+def test_decode_output_mixed_encodings():
+    """Lines which are not utf-8 should not change how the others decode."""
+
+    output = b"caf\xc3\xa9\r\ncaf\xe9\n"
+    assert formatting.decode_output(output) == "caf\xe9\r\ncaf\xe9\n"
+    assert formatting.decode_output("already text") == "already text"
+
+
+def test_format_output_matches_per_line():
+    """Formatting the whole block should match formatting line by line."""
+
+    output = (
+        b"prompt# cmd\r\n\x1b[1;31mred\x1b[0m\r\ncaf\xe9\rcaf\xc3\xa9"
+        b"\n\n   indented\t\nprompt#"
     )
-    with decode_patch as patched_encode:
-        assert formatting.no_empties(["something"]) == []
+    per_line = [formatting.format_line(line) for line in
+                output.splitlines()[1:-1]]
+    expected = "\n".join(line for line in per_line if line)
 
-    assert_all_encodings("something", patched_encode)
+    assert formatting.format_output(output, "cmd") == expected
+    assert expected == "red\ncaf\xe9\ncaf\xe9\nindented\t"
 
 
 def test_format_output():
@@ -195,6 +246,108 @@ def test_consolidate_results(fake_results):
         assert result_set["names"] in expected_groups
 
 
+def test_consolidate_does_not_mutate(fake_results):
+    """The caller's result dictionaries should be left as they were."""
+
+    before = [dict(server) for server in fake_results]
+    formatting.consolidate(fake_results)
+    assert fake_results == before
+
+
+def test_consolidate_incrementally(fake_results):
+    """Servers can be added one by one, as they finish."""
+
+    consolidator = formatting.Consolidator()
+    groups = [consolidator.add(server) for server in fake_results]
+
+    assert groups[0] is groups[3]
+    assert groups[4] is groups[6]
+    assert len(consolidator.groups) == 3
+    assert consolidator.groups == formatting.consolidate(fake_results)
+
+    # adding an already consolidated group merges its names in
+    consolidator.add({"names": ["x", "y"], "results": groups[4]["results"]})
+    assert consolidator.groups[1]["names"][-2:] == ["x", "y"]
+
+
+def test_consolidate_digest_collisions(fake_results):
+    """Matching digests with different results should not be grouped."""
+
+    with patch.object(formatting, "results_digest", return_value="same"):
+        groups = formatting.consolidate(fake_results)
+
+    assert [len(group["names"]) for group in groups] == [4, 3, 1]
+
+
+def test_consolidate_normalized():
+    """Normalized results group near-duplicates, keeping raw deltas."""
+
+    results = [
+        {"name": "web1", "results": [("hostname", "web1"), ("id", "ok")]},
+        {"name": "web2", "results": [("hostname", "web2"), ("id", "ok")]},
+        {"name": "web3", "results": [("hostname", "db"), ("id", "ok")]},
+    ]
+    groups = formatting.consolidate(results, [HostnameMask()])
+
+    assert groups == [
+        {
+            "names": ["web1", "web2"],
+            "results": [("hostname", "web1"), ("id", "ok")],
+            "deltas": {"web2": [(0, "web2")]},
+        },
+        {
+            "names": ["web3"],
+            "results": [("hostname", "db"), ("id", "ok")],
+            "deltas": {},
+        },
+    ]
+
+
+def test_consolidate_normalized_groups(fake_results):
+    """Consolidated groups with deltas can be consolidated again."""
+
+    results = [
+        {"name": "web1", "results": [("hostname", "web1")]},
+        {"name": "web2", "results": [("hostname", "web2")]},
+        {"name": "web3", "results": [("hostname", "web3")]},
+    ]
+    mask = HostnameMask()
+    first = formatting.consolidate(results[:2], [mask])
+    groups = formatting.consolidate(first + results[2:], [mask])
+
+    assert len(groups) == 1
+    assert groups[0]["names"] == ["web1", "web2", "web3"]
+    assert groups[0]["deltas"] == {
+        "web2": [(0, "web2")],
+        "web3": [(0, "web3")],
+    }
+
+
+def test_normalizers_in_prepare_results():
+    """Pretty results should group with the normalizers in the options."""
+
+    results = [
+        {"name": "web1", "results": [("hostname", "web1")]},
+        {"name": "web2", "results": [("hostname", "web2")]},
+    ]
+    groups, _ = formatting.prepare_results(
+        results,
+        {"normalizers": [HostnameMask()]},
+    )
+    assert len(groups) == 1
+
+
+def test_results_digest():
+    """Digests should be stable and depend on the command boundaries."""
+
+    assert formatting.results_digest([("a", "b")]) == \
+        formatting.results_digest([["a", "b"]])
+    assert formatting.results_digest([("ab", "c")]) != \
+        formatting.results_digest([("a", "bc")])
+    assert formatting.results_digest([("a", "b"), ("c", "d")]) != \
+        formatting.results_digest([("a", "b", "c", "d")])
+
+
 def test_csv_results(fake_results, capfd):
     """Ensure CSV results print correctly."""
 
@@ -220,6 +373,22 @@ def test_csv_custom_char(fake_results, capfd):
             assert results in stdout
 
 
+def test_csv_multiple_char_separator(capfd):
+    """Separators longer than a character still work from the library."""
+
+    formatting.csv_results(
+        [{"name": "a", "results": [("echo 'x||y'", 'say "hi"'), ("w", "ok")]}],
+        {"csv_char": "||"},
+    )
+    stdout, _ = capfd.readouterr()
+
+    assert stdout == (
+        "server||command||result\r\n"
+        "a||\"echo 'x||y'\"||\"say \"\"hi\"\"\"\r\n"
+        "a||w||ok\r\n"
+    )
+
+
 def test_csv_on_consolidated(fake_results, capfd):
     """CSV results should still work post consolidation."""
 
@@ -233,6 +402,117 @@ def test_csv_on_consolidated(fake_results, capfd):
             assert results in stdout
 
 
+def test_csv_quoting(capfd):
+    """Embedded quotes, separators and newlines should be quoted properly."""
+
+    results = [{
+        "name": "server a",
+        "results": [('echo "hi, there"', 'hi, "there"\n\n  second line')],
+    }]
+    formatting.csv_results(results)
+    stdout, _ = capfd.readouterr()
+
+    rows = list(csv.reader(io.StringIO(stdout)))
+    assert rows == [
+        ["server", "command", "result"],
+        ["server a", 'echo "hi, there"', 'hi, "there"\nsecond line'],
+    ]
+
+
+def test_csv_writer_streams(fake_results, capfd):
+    """A streaming CsvWriter writes each host out as it's given."""
+
+    with formatting.CsvWriter(stream=True) as writer:
+        writer.write_result(fake_results[0])
+        stdout, _ = capfd.readouterr()
+        assert fake_results[0]["name"] in stdout
+        assert stdout.startswith("server,command,result\r\n")
+
+        writer.write_result(fake_results[1])
+        stdout, _ = capfd.readouterr()
+        assert fake_results[1]["name"] in stdout
+        assert "server,command" not in stdout
+
+
+def test_jsonl_results(fake_results, capfd):
+    """Each host should be written as a single JSON object."""
+
+    formatting.jsonl_results(fake_results)
+    stdout, _ = capfd.readouterr()
+
+    lines = [json.loads(line) for line in stdout.splitlines()]
+    assert [line["name"] for line in lines] == [
+        server["name"] for server in fake_results
+    ]
+    for line, server in zip(lines, fake_results):
+        assert line["results"] == [
+            {"command": command, "output": output}
+            for command, output in server["results"]
+        ]
+        assert line["error"] is None
+
+
+def test_jsonl_writer_info(capfd):
+    """The info from the result callbacks is included with each host."""
+
+    info = {"error": -3, "started": 100.5, "elapsed": 1.25}
+    with formatting.JsonlWriter(stream=True) as writer:
+        writer.write_result(
+            {"name": "nowhere", "results": [("login", "nope")]},
+            info,
+        )
+        stdout, _ = capfd.readouterr()
+
+    line = json.loads(stdout)
+    assert line["error"] == -3
+    assert line["started"] == 100.5
+    assert line["elapsed"] == 1.25
+    assert "timings" not in line
+
+
+def test_jsonl_writer_timings(capfd):
+    """Each host's timings are included when the run was timed."""
+
+    with formatting.JsonlWriter(stream=True) as writer:
+        writer.write_result({
+            "name": "nowhere",
+            "results": [("uptime", "up")],
+            "timings": {
+                "phases": {"connecting": 0.5, "running": 0.25},
+                "commands": [("uptime", 0.25)],
+            },
+        }, {})
+        stdout, _ = capfd.readouterr()
+
+    assert json.loads(stdout)["timings"] == {
+        "phases": {"connecting": 0.5, "running": 0.25},
+        "commands": [{"command": "uptime", "seconds": 0.25}],
+    }
+
+
+def test_jsonl_writer_groups(fake_results, capfd):
+    """With jsonl_groups the groups are written after all of the hosts."""
+
+    with formatting.JsonlWriter({"jsonl_groups": True}) as writer:
+        for server in fake_results:
+            writer.write_result(server)
+
+    stdout, _ = capfd.readouterr()
+    lines = [json.loads(line) for line in stdout.splitlines()]
+    hosts = lines[:len(fake_results)]
+    groups = lines[len(fake_results):]
+
+    assert all("name" in host for host in hosts)
+    expected = formatting.consolidate(fake_results)
+    assert [group["names"] for group in groups] == [
+        group["names"] for group in expected
+    ]
+    for group, expected_group in zip(groups, expected):
+        assert group["group"] == formatting.results_digest(
+            expected_group["results"]
+        )
+
+
 def test_prepare_results(fake_results):
     """Ensure the results and options dicts are prepared for printing."""
 
@@ -267,16 +547,47 @@ def test_minimum_left_len(fake_results):
 
 
 def test_pretty_results(fake_results):
-    """Ensure pretty results is calling everything it should."""
+    """Ensure pretty results writes every chunk to a single sink."""
+
+    with patch.object(formatting, "OutputSink") as patched_sink:
+        formatting.pretty_results(fake_results)
+
+    sink = patched_sink().__enter__()
+
+    # the header, one chunk per group of results, then the bottom line
+    assert sink.write.call_count == 5
+
+
+def test_pretty_rows_first_group_only(fake_results):
+    """Only the first group should get the jumpbox split, even if equal."""
+
+    results, options = formatting.prepare_results(
+        fake_results,
+        {"jump_host": "some_server", "style": 1},
+    )
+    results.append(dict(results[0]))  # an equal, but not identical group
+    chunks = list(formatting.pretty_rows(results, options))
+
+    frame = formatting.PrettyFrame(options)
+    assert chunks[0] == frame.header
+    assert chunks[1].startswith(frame.first_split)
+    for chunk in chunks[2:-1]:
+        assert chunk.startswith(frame.split)
+    assert chunks[-1] == frame.bottom
+    assert frame.first_split != frame.split
+
 
-    with patch.object(formatting, "pretty_header") as patched_header:
-        with patch.object(formatting, "_pretty_result") as patched_result:
-            with patch.object(formatting, "write") as patched_write:
-                formatting.pretty_results(fake_results)
+def test_pretty_frame_widths(fake_results):
+    """Every row of the frame should be the full width."""
 
-    assert patched_header.called
-    assert patched_result.called
-    assert patched_write.called
+    for style in range(4):
+        results, options = formatting.prepare_results(
+            fake_results,
+            {"width": 80, "style": style, "jump_host": "jumper"},
+        )
+        output = "".join(formatting.pretty_rows(results, options))
+        for line in output.splitlines():
+            assert len(line) == 80
 
 
 def test_pretty_header(fake_results, capfd):
@@ -386,6 +697,71 @@ def test_writing_to_file():
         assert string in openoutput.read()
 
 
+def test_sink_opens_file_once(fake_results):
+    """A report should open the output file once, not for every write."""
+
+    output_file = tempfile.mktemp()
+    options = {"output_file": output_file, "width": 80}
+    real_open = formatting.io.open
+
+    with patch.object(formatting.io, "open", side_effect=real_open) as p_open:
+        formatting.pretty_results(fake_results, options)
+        formatting.stacked_results(fake_results, options)
+        formatting.csv_results(fake_results, options)
+
+    assert p_open.call_count == 3
+    for open_call in p_open.call_args_list:
+        assert open_call == call(output_file, "a", encoding="utf-8")
+
+    with open(output_file, "r") as openoutput:
+        output = openoutput.read()
+    os.remove(output_file)
+
+    assert "server_a_1" in output
+    assert "server,command,result" in output
+
+
+def test_sink_buffers(capfd):
+    """Output is only written once the buffer is full or on close."""
+
+    sink = formatting.OutputSink({}, buffer_size=10)
+    sink.write("12345")
+    assert capfd.readouterr()[0] == ""
+    sink.write("6789", end="0")
+    assert capfd.readouterr()[0] == "1234567890"
+    sink.write("abc")
+    sink.close()
+    assert capfd.readouterr()[0] == "abc"
+
+
+def test_sink_nested_contexts(capfd):
+    """Only the outermost context should flush and close the sink."""
+
+    with formatting.OutputSink() as sink:
+        with sink as inner:
+            inner.write("inner")
+        assert capfd.readouterr()[0] == ""
+        sink.write(" outer")
+
+    assert capfd.readouterr()[0] == "inner outer"
+
+
+def test_sink_encoding_fallback(fake_unicode_encode_error):
+    """Chunks which can't be encoded fall back to write."""
+
+    options = {"output_file": tempfile.mktemp()}
+    sink = formatting.OutputSink(options)
+    sink.write("some data")
+
+    with patch.object(formatting, "write") as p_write:
+        with patch.object(formatting.io, "open") as p_open:
+            p_open().write.side_effect = fake_unicode_encode_error
+            sink.close()
+
+    p_write.assert_called_once_with("some data", options)
+    assert p_open().close.called
+
+
 def test_errors_writing_to_stdout(fake_unicode_decode_error):
     """We should prompt the user if there's an error printing."""
 
@@ -608,6 +984,83 @@ def test_stacked_multiline_servers(fake_results, capfd):
     assert stdout == "\n".join(expected)
 
 
+def test_stacked_rows_per_group(fake_results):
+    """Stacked rows are generated one chunk per group of servers."""
+
+    results, options = formatting.prepare_results(fake_results, {"width": 20})
+    chunks = list(formatting.stacked_rows(results, options))
+
+    assert len(chunks) == 3
+    assert not chunks[0].startswith("=")
+    for chunk in chunks[1:]:
+        assert chunk.startswith("{0}\n".format("=" * 20))
+
+
+def many_hosts_results():
+    """Returns results with groups of 50, 20, 5, 1 and 1 hosts."""
+
+    results = []
+    for group, count in enumerate([50, 20, 5, 1, 1]):
+        for host in range(count):
+            results.append({
+                "name": "host{0}-{1}".format(group, host),
+                "results": [("uname", "output {0}".format(group))],
+            })
+    return results
+
+
+def test_summary_results(capfd):
+    """Only the top groups are shown, with samples and a long tail."""
+
+    formatting.summary_results(many_hosts_results(), {"summary": 2})
+    stdout, _ = capfd.readouterr()
+
+    assert "50 hosts" in stdout
+    assert "20 hosts" in stdout
+    assert "host0-0" in stdout and "host0-2" in stdout
+    assert "host0-3" not in stdout
+    assert "output 0" in stdout and "output 1" in stdout
+    assert "output 2" not in stdout
+    assert "7 hosts" in stdout and "in 3 groups" in stdout
+    assert "3 other outputs, not shown" in stdout
+
+
+def test_summary_hosts_file(capfd):
+    """Every group's hosts are written to the side file, largest first."""
+
+    hosts_file = tempfile.mktemp()
+    try:
+        formatting.summary_results(
+            many_hosts_results(),
+            {"summary": 1, "summary_hosts": hosts_file, "stacked": True},
+        )
+        stdout, _ = capfd.readouterr()
+        with io.open(hosts_file, encoding="utf-8") as open_file:
+            groups = [json.loads(line) for line in open_file]
+    finally:
+        os.remove(hosts_file)
+
+    assert "see {0}".format(hosts_file) in stdout
+    assert [group["count"] for group in groups] == [50, 20, 5, 1, 1]
+    assert [group["rank"] for group in groups] == [1, 2, 3, 4, 5]
+    assert groups[1]["names"][0] == "host1-0"
+    assert len(groups[0]["names"]) == 50
+
+
+def test_summary_group():
+    """Summarized groups count hosts and note varied outputs."""
+
+    group = {
+        "names": ["a", "b"],
+        "results": [("cmd", "out")],
+        "deltas": {"b": [(0, "other out")]},
+    }
+    assert formatting.summary_group(group, samples=1) == {
+        "names": ["2 hosts", "a", "...", "1 varied"],
+        "results": [("cmd", "out")],
+    }
+
+
 def test_all_passwords_are_hidden():
     """Passwords from Bladerunner.options should be hidden in the output.
 
@@ -635,3 +1088,45 @@ def test_all_passwords_are_hidden():
         output = bytes(output, "utf-8")
 
     assert formatting.format_output(output, "faked", options) == expected
+
+
+def test_cleaner_is_reused():
+    """The same cleaner should be used for the same passwords."""
+
+    options = {"password": ["hunter7", "hunter8"], "second_password": "x"}
+    cleaner = formatting.get_cleaner(options)
+
+    assert formatting.get_cleaner(dict(options)) is cleaner
+    assert formatting.get_cleaner({"password": "other"}) is not cleaner
+    assert cleaner.passwords == ["hunter7", "hunter8", "x"]
+
+
+def test_cleaner_fragments_cached():
+    """Long commands are only split into fragments once."""
+
+    cleaner = formatting.OutputCleaner()
+    command = "x" * 30 + "y" * 30 + "z" * 5
+
+    fragments = cleaner.fragments(command)
+    assert fragments == ["x" * 30, "y" * 30, "z" * 5]
+    assert cleaner.fragments(command) is fragments
+    assert cleaner.fragments("short") == []
+
+
+def test_cleaner_matches_format_line():
+    """Cleaning a block should give the same lines format_line would."""
+
+    options = {"password": "hunter7"}
+    output = (
+        b"prompt# cmd\n  \x1b[32mgreen\x1b[0m hunter7\r\n\x1b[m\x0f\x1b[4Gtab"
+        b"\n\t\n\x0c  spaced  \nprompt#"
+    )
+    expected = []
+    for line in output.splitlines()[1:-1]:
+        line = formatting.format_line(line, options)
+        if line:
+            expected.append(line)
+
+    cleaner = formatting.OutputCleaner(options)
+    assert cleaner.clean(output, "cmd") == "\n".join(expected)
+    assert expected == ["green *******", "tab", "spaced  "]
@@ -6,6 +6,7 @@ import pytest
 
 from bladerunner import interactive
 from bladerunner.base import Bladerunner
+from bladerunner.testing import FakeFleet
 from bladerunner.interactive import BladerunnerInteractive
 
 
@@ -552,3 +553,26 @@ def test_interactive_context_error():
 
     patched_login.assert_called_once_with()
     assert "connection failure str..." in raised_error.exconly()
+
+
+def test_interactive_with_trace():
+    """Interactive sessions work with trace set, it only traces runs."""
+
+    with FakeFleet(password="hunter7", hang=["sleep"]) as fleet:
+        fleet.add("locked", password="other")
+        runner = Bladerunner({
+            "ssh": fleet.ssh_command,
+            "password": "hunter7",
+            "cmd_timeout": 1,
+            "trace": "run.json",
+        })
+
+        locked = runner.interactive("locked", connect=False)
+        assert locked.connect(status_return=True) is False
+        assert locked.error == -5
+
+        # a command which never returns is interrupted
+        with runner.interactive("web1") as session:
+            session.run("sleep")
+
+    assert runner.tracer is None
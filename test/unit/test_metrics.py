@@ -0,0 +1,177 @@
+"""Tests for the Prometheus and StatsD metrics."""
+
+
+import os
+import socket
+import pytest
+import tempfile
+import threading
+
+from bladerunner.metrics import Metrics, parse_statsd
+
+
+def test_counters_merge_threads():
+    """Each thread counts into its own shard, merged when collected."""
+
+    metrics = Metrics()
+
+    def worker():
+        for _ in range(1000):
+            metrics.increment("bladerunner_hosts_total")
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    counters, _, _ = metrics.collect()
+    assert counters[("bladerunner_hosts_total", ())] == 4000
+    assert len(metrics._shards) == 4
+
+
+def test_host_finished():
+    """Hosts, failures by code, timeouts and durations are counted."""
+
+    metrics = Metrics()
+    metrics.host_finished(
+        {"name": "a", "results": [("login", "nope (err: -7)")]},
+        {"error": -7, "elapsed": 20},
+    )
+    metrics.host_finished(
+        {"name": "b", "results": [
+            ("uptime", "did not return after issuing: uptime"),
+            ("df", "12%"),
+        ]},
+        {"error": 0, "elapsed": 0.3, "timeouts": 1},
+    )
+    # output which only looks like a timeout isn't counted
+    metrics.host_finished(
+        {"name": "c", "results": [
+            ("cat log", "did not return after issuing: reboot"),
+        ]},
+        {"error": 0, "elapsed": 0},
+    )
+
+    counters, histograms, _ = metrics.collect()
+    assert counters == {
+        ("bladerunner_hosts_total", ()): 3,
+        ("bladerunner_host_failures_total", (("code", "-7"),)): 1,
+        ("bladerunner_command_timeouts_total", ()): 1,
+    }
+    durations = histograms[("bladerunner_host_duration_seconds", ())]
+    assert durations[-2:] == [20.3, 3]
+
+
+def test_phase_histograms():
+    """The time in each phase is observed when the host leaves it."""
+
+    metrics = Metrics(buckets=(1, 5))
+    metrics.phase_changed("a", "connecting", 0)
+    metrics.phase_changed("a", "running", 2)
+    metrics.phase_changed("a", None, 12)
+
+    _, histograms, _ = metrics.collect()
+    assert histograms[
+        ("bladerunner_phase_duration_seconds", (("phase", "connecting"),))
+    ] == [0, 1, 2, 1]
+    assert histograms[
+        ("bladerunner_phase_duration_seconds", (("phase", "running"),))
+    ] == [0, 0, 10, 1]
+
+
+def test_textfile():
+    """The exposition format has cumulative buckets, sums and counts."""
+
+    metrics = Metrics(buckets=(1, 5))
+    metrics.observe("bladerunner_host_duration_seconds", 0.5)
+    metrics.observe("bladerunner_host_duration_seconds", 3)
+    metrics.observe("bladerunner_host_duration_seconds", 30)
+    metrics.increment("bladerunner_host_failures_total", (("code", "-3"),))
+    metrics.run_finished(3, 31.5)
+
+    lines = metrics.textfile().splitlines()
+    assert lines[:7] == [
+        "# HELP bladerunner_host_duration_seconds Seconds from starting to "
+        "finishing each host.",
+        "# TYPE bladerunner_host_duration_seconds histogram",
+        'bladerunner_host_duration_seconds_bucket{le="1"} 1',
+        'bladerunner_host_duration_seconds_bucket{le="5"} 2',
+        'bladerunner_host_duration_seconds_bucket{le="+Inf"} 3',
+        "bladerunner_host_duration_seconds_count 3",
+        "bladerunner_host_duration_seconds_sum 33.5",
+    ]
+    assert "# TYPE bladerunner_host_failures_total counter" in lines
+    assert 'bladerunner_host_failures_total{code="-3"} 1' in lines
+    assert "bladerunner_run_duration_seconds 31.5" in lines
+    assert "bladerunner_run_hosts 3" in lines
+
+
+def test_write_textfile():
+    """The textfile is written whole, replacing any previous one."""
+
+    metrics = Metrics()
+    metrics.increment("bladerunner_hosts_total")
+
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "bladerunner.prom")
+    with open(path, "w") as old_file:
+        old_file.write("old")
+
+    metrics.write_textfile(path)
+    with open(path) as prom_file:
+        assert "bladerunner_hosts_total 1" in prom_file.read()
+    assert os.listdir(directory) == ["bladerunner.prom"]
+
+    with pytest.raises(SystemExit):
+        metrics.write_textfile(os.path.join(directory, "no", "such.prom"))
+
+
+def test_write_textfile_mode():
+    """The textfile is readable by others as the umask allows."""
+
+    path = os.path.join(tempfile.mkdtemp(), "bladerunner.prom")
+    umask = os.umask(0o022)
+    try:
+        Metrics().write_textfile(path)
+    finally:
+        os.umask(umask)
+
+    assert os.stat(path).st_mode & 0o777 == 0o644
+
+
+def test_statsd():
+    """Updates are sent to a StatsD listener as they happen."""
+
+    listener = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    listener.bind(("127.0.0.1", 0))
+    listener.settimeout(5)
+
+    metrics = Metrics(statsd=listener.getsockname())
+    try:
+        metrics.increment("bladerunner_host_failures_total", (("code", "-7"),))
+        metrics.observe(
+            "bladerunner_phase_duration_seconds",
+            0.25,
+            (("phase", "logging in"),),
+        )
+        metrics.set_gauge("bladerunner_run_hosts", 10)
+        received = [listener.recv(1024) for _ in range(3)]
+    finally:
+        metrics.close()
+        listener.close()
+
+    assert received == [
+        b"bladerunner.host_failures_total.-7:1|c",
+        b"bladerunner.phase_duration_seconds.logging_in:250|ms",
+        b"bladerunner.run_hosts:10|g",
+    ]
+
+
+def test_parse_statsd():
+    """The port is optional, defaulting to 8125."""
+
+    assert parse_statsd("localhost") == ("localhost", 8125)
+    assert parse_statsd("stats.local:9125") == ("stats.local", 9125)
+    with pytest.raises(SystemExit):
+        parse_statsd("localhost:nope")
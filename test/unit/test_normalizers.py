@@ -0,0 +1,94 @@
+"""Tests for the consolidation normalizers."""
+
+
+import re
+
+from bladerunner import normalizers
+from bladerunner.normalizers import (
+    HostnameMask,
+    NumericBuckets,
+    RegexMask,
+    normalize,
+)
+
+
+def test_regex_mask():
+    """Every match of the pattern should be replaced."""
+
+    mask = RegexMask("[0-9a-f]{8}", "<id>")
+    assert mask("job deadbeef and 0badf00d", "host") == "job <id> and <id>"
+
+
+def test_regex_mask_compiled():
+    """Precompiled patterns are used as is."""
+
+    mask = RegexMask(re.compile("error", re.I))
+    assert mask("ERROR: nope", "host") == "<masked>: nope"
+
+
+def test_hostname_mask():
+    """The host's full and short names are masked, but not other hosts."""
+
+    mask = HostnameMask()
+    output = "web1.example.com (web1) talks to web10 and web1-db"
+    assert mask(output, "web1.example.com") == (
+        "<host> (<host>) talks to web10 and web1-db"
+    )
+
+
+def test_hostname_mask_ip():
+    """IP addresses shouldn't have their first octet masked."""
+
+    mask = HostnameMask()
+    assert mask("10.0.0.1 and 10.0.0.10", "10.0.0.1") == "<host> and 10.0.0.10"
+
+
+def test_numeric_buckets():
+    """Numbers are replaced with the range they're in."""
+
+    buckets = NumericBuckets(size=10)
+    assert buckets("12 and 17.5 and 20", "host") == (
+        "<10-20> and <10-20> and <20-30>"
+    )
+
+
+def test_numeric_buckets_pattern():
+    """Only the numbers matching the pattern are bucketed."""
+
+    buckets = NumericBuckets(size=100, pattern="(?<=mem: )\\d+")
+    assert buckets("mem: 1234 cpus: 8", "host") == "mem: <1200-1300> cpus: 8"
+
+
+def test_default_normalizers():
+    """The defaults mask uptime output between hosts."""
+
+    one = "10:01:02 up 3 days,  4:05,  1 user,  load average: 0.00, 0.01, 0.05"
+    two = "11:11:12 up 9 days, 14:05,  1 user,  load average: 1.00, 0.21, 0.15"
+    defaults = normalizers.DEFAULT_NORMALIZERS
+    assert normalize(one, "a", defaults) == normalize(two, "b", defaults)
+
+
+def test_pids_and_timestamps():
+    """PIDs and ISO timestamps are masked by the defaults."""
+
+    output = "2015-11-27T10:01:02Z sshd[1234]: started pid=99"
+    assert normalize(output, "host", normalizers.DEFAULT_NORMALIZERS) == (
+        "<timestamp> sshd[<pid>]: started pid=<pid>"
+    )
+
+
+def test_normalize_order():
+    """Normalizers are applied in order."""
+
+    calls = []
+
+    def first(output, name):
+        calls.append("first")
+        return output + "1"
+
+    def second(output, name):
+        calls.append("second")
+        return output + "2"
+
+    assert normalize("x", "host", [first, second]) == "x12"
+    assert calls == ["first", "second"]
@@ -1,7 +1,9 @@
 """Tests for Bladerunner as a package."""
 
 
+import sys
 import pytest
+import subprocess
 
 import bladerunner
 
@@ -31,3 +33,46 @@ def test_package_exports(method, dir_bladerunner):
     """Ensure the top level functions/methods/objects don't change."""
 
     assert method in dir_bladerunner
+
+
+def test_exports_are_lazy():
+    """Importing bladerunner alone doesn't import pexpect and friends."""
+
+    output = subprocess.check_output([
+        sys.executable,
+        "-c",
+        "import sys, bladerunner; print(sorted(set(sys.modules) & set(["
+        "'pexpect', 'concurrent.futures', 'six', 'bladerunner.base'])))",
+    ])
+
+    assert output.decode("utf-8").strip() == "[]"
+
+
+def test_base_without_aggregate():
+    """Running commands doesn't import the aggregate module, or NumPy."""
+
+    output = subprocess.check_output([
+        sys.executable,
+        "-c",
+        "import sys, bladerunner.base; print(sorted(set(sys.modules) & set(["
+        "'numpy', 'bladerunner.aggregate'])))",
+    ])
+
+    assert output.decode("utf-8").strip() == "[]"
+
+
+def test_exports_import_on_use():
+    """Exports are imported from their modules when first used."""
+
+    from bladerunner.base import Bladerunner
+    from bladerunner.formatting import consolidate
+
+    assert bladerunner.Bladerunner is Bladerunner
+    assert bladerunner.consolidate is consolidate
+
+
+def test_unknown_attribute():
+    """Names which aren't exported still raise AttributeError."""
+
+    with pytest.raises(AttributeError):
+        bladerunner.not_an_export
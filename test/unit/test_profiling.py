@@ -0,0 +1,75 @@
+"""Tests for profiling bladerunner's own overhead."""
+
+
+import io
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+
+from bladerunner import profiling
+from bladerunner.formatting import consolidate
+from bladerunner.profiling import Profiler
+
+
+def consolidate_some(count):
+    """Consolidates a few results, as something to profile."""
+
+    return consolidate([
+        {"name": str(index), "results": [("uptime", str(index % 3))]}
+        for index in range(count)
+    ])
+
+
+def test_profiles_worker_threads():
+    """Functions run in a pool's threads are included in the report."""
+
+    profiler = Profiler()
+    profiler.start()
+    try:
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            list(executor.map(consolidate_some, [100, 200]))
+    finally:
+        profiler.stop()
+
+    if profiling.PER_THREAD:
+        assert profiler.thread_profiles
+
+    stats = profiler.stats()
+    consolidated = [
+        value for function, value in stats.stats.items()
+        if function[2] == "consolidate"
+    ]
+    assert consolidated[0][1] == 2
+
+
+def test_report_sections():
+    """The report splits bladerunner's functions from everything else."""
+
+    profiler = Profiler()
+    profiler.start()
+    try:
+        consolidate_some(100)
+    finally:
+        profiler.stop()
+
+    stream = io.StringIO()
+    profiler.report(stream, limit=5)
+    report = stream.getvalue()
+
+    bladerunner = report.index("\nbladerunner (")
+    pexpect = report.index("\npexpect (")
+    others = report.index("\nstdlib and others (")
+    assert report.startswith("profile of ")
+    assert bladerunner < report.index("formatting.py") < pexpect < others
+
+
+@pytest.mark.parametrize("filename, section", [
+    (profiling.PACKAGE_DIR + "/base.py", "bladerunner"),
+    ("/usr/lib/python3/site-packages/pexpect/spawnbase.py", "pexpect"),
+    ("/usr/lib/python3/site-packages/ptyprocess/ptyprocess.py", "pexpect"),
+    ("/usr/lib/python3/threading.py", "stdlib and others"),
+    ("~", "stdlib and others"),
+])
+def test_section(filename, section):
+    """Files are sorted into sections by their location."""
+
+    assert profiling._section(filename) == section
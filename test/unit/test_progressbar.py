@@ -3,6 +3,7 @@
 
 import os
 import pytest
+import threading
 from mock import call
 from mock import Mock
 from mock import patch
@@ -168,6 +169,67 @@ def test_update_quarters(capfd):
     assert "[=]" in stdout
 
 
+def test_threaded_updates(capfd):
+    """Concurrent updates aren't lost and only the render thread draws."""
+
+    # slow enough that the only draw is the final one from stop()
+    pbar = ProgressBar(400, {"width": 20, "refresh_rate": 0.001})
+
+    def worker():
+        for _ in range(100):
+            pbar.update()
+
+    workers = [threading.Thread(target=worker) for _ in range(4)]
+    with patch.object(pbar, "_draw", wraps=pbar._draw) as p_draw:
+        pbar.start()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        assert not p_draw.called
+        pbar.stop()
+
+    assert pbar.counter == 400
+    p_draw.assert_called_once_with(400)
+    stdout, _ = capfd.readouterr()
+    assert stdout.endswith("[==================]")
+
+
+def test_render_skips_unchanged(capfd):
+    """The render thread only redraws when the counter has changed."""
+
+    pbar = ProgressBar(4, {"width": 8})
+    pbar.start()
+    pbar.update()
+    pbar.stop()
+    stdout, _ = capfd.readouterr()
+    assert "[=-    ]" in stdout
+
+    pbar.render()
+    stdout, _ = capfd.readouterr()
+    assert stdout == ""
+
+
+@pytest.mark.parametrize("isatty, rate", [(True, 10), (False, 0.5)])
+def test_refresh_rate(isatty, rate):
+    """The refresh rate drops when stdout isn't a tty."""
+
+    with patch.object(progressbar.sys, "stdout") as p_stdout:
+        p_stdout.isatty.return_value = isatty
+        assert ProgressBar(10, {"width": 20}).refresh_rate == rate
+
+
+def test_clear_stops_thread(capfd):
+    """Clearing the bar stops the render thread."""
+
+    pbar = ProgressBar(10, {"width": 20})
+    pbar.start()
+    pbar.clear()
+    assert pbar._thread is None
+    stdout, _ = capfd.readouterr()
+    assert stdout == "\r{0}\r".format(" " * 20)
+
+
 def test_clear(capfd):
     """Ensure we print whitespace over the bar and carriage return."""
 
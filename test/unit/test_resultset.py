@@ -0,0 +1,192 @@
+"""Tests for the columnar ResultSet."""
+
+
+import re
+import pytest
+from mock import patch
+
+from bladerunner import resultset
+from bladerunner.formatting import consolidate
+from bladerunner.resultset import ResultSet
+
+
+@pytest.fixture
+def results():
+    """Returns results from 5 hosts, two of which failed to connect."""
+
+    return [
+        {"name": "web1", "results": [("uptime", "fine"), ("df", "12%")]},
+        {"name": "web2", "results": [("uptime", "ERROR"), ("df", "12%")]},
+        {"name": "web3", "results": [("uptime", "fine"), ("df", "12%")]},
+        {"name": "db1", "results": [("login", "timeout (err: -7)")]},
+        {"name": "db2", "results": [("login", "auth (err: -3)")]},
+    ]
+
+
+def test_round_trip(results):
+    """Indexing and iterating gives back the run's results."""
+
+    result_set = ResultSet(results)
+
+    assert len(result_set) == 5
+    assert result_set.to_list() == results
+    assert result_set[1] == results[1]
+    assert result_set[-1] == results[-1]
+    assert result_set.names == ["web1", "web2", "web3", "db1", "db2"]
+
+
+def test_slicing(results):
+    """Slices are views of the selected hosts."""
+
+    result_set = ResultSet(results)
+    sliced = result_set[1:4]
+
+    assert sliced._columns is result_set._columns
+    assert sliced.to_list() == results[1:4]
+    assert sliced[::-2].names == ["db1", "web2"]
+    assert result_set.failed()[:1].names == ["db1"]
+
+
+def test_outputs_are_stored_once(results):
+    """Matching outputs across hosts share the same storage."""
+
+    result_set = ResultSet(results)
+    assert len(result_set._columns.outputs) == 5
+    assert len(result_set._columns.commands) == 3
+
+
+def test_statuses(results):
+    """Failed logins have their error code parsed."""
+
+    result_set = ResultSet(results)
+
+    assert list(result_set.statuses) == [0, 0, 0, -7, -3]
+    assert result_set.failed().names == ["db1", "db2"]
+    assert result_set.succeeded().names == ["web1", "web2", "web3"]
+    assert result_set.by_status(-3).to_list() == [results[4]]
+
+
+def test_add_with_info(results):
+    """The add method can be used as a result callback with info."""
+
+    result_set = ResultSet()
+    result_set.add(results[0], {"error": 0, "started": 10.0, "elapsed": 1.5})
+    result_set.add(results[3], {"error": -7, "started": 11.0, "elapsed": 3})
+
+    assert list(result_set.statuses) == [0, -7]
+    assert list(result_set.durations) == [1.5, 3.0]
+
+
+def test_matching(results):
+    """Hosts with any output matching the pattern are selected."""
+
+    result_set = ResultSet(results)
+
+    assert result_set.matching("ERROR").names == ["web2"]
+    assert result_set.matching(re.compile("^f")).names == ["web1", "web3"]
+    assert result_set.matching("12", command="uptime").names == []
+    assert result_set.matching("12", command="df").names == [
+        "web1",
+        "web2",
+        "web3",
+    ]
+    assert result_set.matching("nope", command="missing").names == []
+    assert result_set.matching("fine", command="missing").names == []
+
+
+def test_views_share_storage(results):
+    """Filters chain without copying, and only the full set can be added to."""
+
+    result_set = ResultSet(results)
+    view = result_set.succeeded().matching("fine")
+
+    assert view._columns is result_set._columns
+    assert view.names == ["web1", "web3"]
+    assert repr(view) == "<ResultSet of 2 hosts>"
+
+    with pytest.raises(ValueError):
+        view.add(results[0])
+
+    result_set.add({"name": "web4", "results": [("uptime", "fine")]})
+    assert len(result_set) == 6
+    assert view.names == ["web1", "web3"]
+
+
+def test_group_by(results):
+    """Hosts are grouped by results or status in the order first seen."""
+
+    result_set = ResultSet(results)
+
+    by_status = result_set.group_by("status")
+    assert [(key, group.names) for key, group in by_status] == [
+        (0, ["web1", "web2", "web3"]),
+        (-7, ["db1"]),
+        (-3, ["db2"]),
+    ]
+
+    by_results = result_set.group_by()
+    assert [group.names for _, group in by_results] == [
+        ["web1", "web3"],
+        ["web2"],
+        ["db1"],
+        ["db2"],
+    ]
+
+    with pytest.raises(ValueError):
+        result_set.group_by("color")
+
+
+def test_consolidate(results):
+    """Consolidating gives the same groups as formatting.consolidate."""
+
+    assert ResultSet(results).consolidate() == consolidate(results)
+
+
+def test_from_consolidated(results):
+    """Consolidated results are expanded back out per host, with deltas."""
+
+    consolidated = [
+        {
+            "names": ["a", "b"],
+            "results": [("uptime", "up 1 day")],
+            "deltas": {"b": [(0, "up 2 days")]},
+        },
+    ]
+    result_set = ResultSet(consolidated)
+
+    assert result_set.to_list() == [
+        {"name": "a", "results": [("uptime", "up 1 day")]},
+        {"name": "b", "results": [("uptime", "up 2 days")]},
+    ]
+
+
+def test_numpy_matches(results):
+    """The NumPy filters select the same hosts as the fallback."""
+
+    pytest.importorskip("numpy")
+
+    result_set = ResultSet(results * 3)
+    view = result_set[2:]
+
+    def select(result_set):
+        """Returns the names of the hosts each filter selects."""
+
+        return [
+            result_set.failed().names,
+            result_set.succeeded().names,
+            result_set.by_status(-7).names,
+            result_set.matching("fine|%").names,
+            result_set.matching("12", command="df").names,
+            result_set.matching("^$").names,
+            [
+                (key, group.names)
+                for key, group in result_set.group_by("status")
+            ],
+        ]
+
+    vectorized = [select(result_set), select(view)]
+    with patch.object(resultset, "numpy", None):
+        fallback = [select(result_set), select(view)]
+
+    assert vectorized == fallback
+    assert [key for key, _ in result_set.group_by("status")] == [0, -7, -3]
@@ -0,0 +1,181 @@
+"""Tests for Bladerunner's teardown of spawned children."""
+
+
+import time
+import signal
+import pexpect
+from mock import call
+from mock import Mock
+from mock import patch
+
+from bladerunner import teardown
+from bladerunner.teardown import Teardown
+
+
+def fake_child(exits_on=None):
+    """Builds a Mock pexpect child which dies on the given signal.
+
+    Args:
+        exits_on: the signal the child exits on, or None to exit on "exit"
+    """
+
+    child = Mock()
+    child.alive = True
+
+    def kill(sig):
+        if sig == exits_on:
+            child.alive = False
+
+    def sendline(line):
+        if exits_on is None:
+            child.alive = False
+
+    child.kill = Mock(side_effect=kill)
+    child.sendline = Mock(side_effect=sendline)
+    child.isalive = Mock(side_effect=lambda: child.alive)
+    return child
+
+
+def test_track_and_release():
+    """Children are tracked until released."""
+
+    tear = Teardown()
+    child = fake_child()
+    tear.track(child)
+    assert tear.children == [child]
+    tear.release(child)
+    assert tear.children == []
+
+
+def test_close_on_exit():
+    """A child which exits politely should never be signalled."""
+
+    tear = Teardown()
+    child = fake_child()
+    tear.track(child)
+    tear.close_all()
+
+    child.sendline.assert_called_once_with("exit")
+    assert not child.kill.called
+    child.close.assert_called_once_with(force=True)
+    assert tear.children == []
+
+
+def test_close_escalates():
+    """Children ignoring exit get SIGTERM, then SIGKILL."""
+
+    tear = Teardown(grace=0.01)
+    stubborn = fake_child(exits_on=signal.SIGKILL)
+    polite = fake_child(exits_on=signal.SIGTERM)
+    tear.track(stubborn)
+    tear.track(polite)
+    tear.close_all()
+
+    assert stubborn.kill.mock_calls == [
+        call(signal.SIGTERM),
+        call(signal.SIGKILL),
+    ]
+    assert polite.kill.mock_calls == [call(signal.SIGTERM)]
+    assert stubborn.close.called and polite.close.called
+
+
+def test_close_untracked_is_ignored():
+    """Only children spawned and tracked by us should be closed."""
+
+    tear = Teardown()
+    tracked = fake_child()
+    untracked = fake_child()
+    excluded = fake_child()
+    tear.track(tracked)
+    tear.track(excluded)
+
+    tear.close_all([tracked, untracked], exclude=[excluded])
+    tear.close_all(exclude=[excluded])
+
+    assert tracked.close.called
+    assert not untracked.close.called
+    assert not excluded.close.called
+    assert tear.children == [excluded]
+
+
+def test_close_single_child():
+    """A single child can be closed right away, and is no longer tracked."""
+
+    tear = Teardown()
+    child = fake_child()
+    other = fake_child()
+    tear.track(child)
+    tear.track(other)
+    tear.close(child)
+
+    child.close.assert_called_once_with(force=True)
+    assert tear.children == [other]
+
+
+def test_close_shared_child_once():
+    """A child given more than once, like a shared jumpbox, closes once."""
+
+    tear = Teardown()
+    jumpbox = fake_child()
+    other = fake_child()
+    tear.track(jumpbox)
+    tear.track(other)
+
+    with patch.object(tear, "_close_child") as p_close:
+        tear.close_all([jumpbox, other, jumpbox, jumpbox])
+
+    assert p_close.mock_calls == [call(jumpbox), call(other)]
+    assert tear.children == []
+
+
+def test_close_errors_are_ignored():
+    """Errors sending to or closing a dead child should not raise."""
+
+    tear = Teardown(grace=0.01)
+    child = fake_child(exits_on=signal.SIGTERM)
+    child.sendline.side_effect = OSError("mock")
+    child.close.side_effect = pexpect.ExceptionPexpect("mock")
+    tear.track(child)
+    tear.close_all()
+
+    child.kill.assert_called_once_with(signal.SIGTERM)
+
+
+def test_interrupt_closes_new_children():
+    """After an interrupt, new children are closed rather than tracked."""
+
+    tear = Teardown()
+    before = fake_child()
+    tear.track(before)
+    tear.interrupt()
+    assert before.close.called
+
+    after = fake_child()
+    tear.track(after)
+    assert after.close.called
+    assert tear.children == []
+
+
+def test_wait_for_exit_timeout():
+    """Waiting should give up once the timeout has passed."""
+
+    child = Mock()
+    child.isalive = Mock(return_value=True)
+    with patch.object(teardown.time, "sleep") as p_sleep:
+        assert teardown._wait_for_exit(child, 0) is False
+    assert not p_sleep.called
+
+
+def test_real_child_is_reaped():
+    """A real process ignoring exit and SIGTERM is killed and reaped."""
+
+    child = pexpect.spawn("sh", ["-c", "trap '' TERM; sleep 30"])
+    tear = Teardown(grace=0.05)
+    tear.track(child)
+
+    start = time.time()
+    tear.close_all()
+
+    assert time.time() - start < 5
+    assert not child.isalive()
+    assert child.signalstatus == signal.SIGKILL
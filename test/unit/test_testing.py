@@ -0,0 +1,136 @@
+"""Tests for the fake ssh fleet simulator."""
+
+
+import os
+import sys
+import json
+
+import pytest
+
+from bladerunner import Bladerunner
+from bladerunner.testing import FakeFleet, HOST_DEFAULTS, host_settings
+from bladerunner.testing import command_output, fake_ssh_command
+
+
+def test_host_settings_defaults():
+    """Hosts without a matching pattern use the fleet's defaults."""
+
+    config = {
+        "defaults": {"latency": 0.5},
+        "hosts": [["web*", {"hang": ["x"]}]],
+    }
+    settings = host_settings(config, "db1")
+
+    assert settings["latency"] == 0.5
+    assert settings["hang"] == []
+    assert set(settings) == set(HOST_DEFAULTS)
+
+
+def test_host_settings_first_match():
+    """Only the first matching pattern's settings are used."""
+
+    config = {"defaults": {}, "hosts": [
+        ["web1", {"refuse": True}],
+        ["web*", {"latency": 1, "refuse": False}],
+    ]}
+
+    assert host_settings(config, "web1")["refuse"] is True
+    assert host_settings(config, "web1")["latency"] == 0
+    assert host_settings(config, "web2")["latency"] == 1
+
+
+def test_command_output():
+    """Commands use their configured output, or the formatted default."""
+
+    settings = dict(HOST_DEFAULTS)
+    settings["commands"] = {"uptime": "up 3 days"}
+    settings["output"] = "{command} on {user}@{host}"
+
+    assert command_output(settings, "uptime", "me", "a") == "up 3 days"
+    assert command_output(settings, "whoami", "me", "a") == "whoami on me@a"
+
+
+def test_command_output_count():
+    """The output can include how many times the command has been run."""
+
+    settings = dict(HOST_DEFAULTS)
+    settings["output"] = "{command} #{count}"
+
+    assert command_output(settings, "date", "me", "a", 3) == "date #3"
+
+
+@pytest.mark.parametrize("output", ["", "first line"])
+def test_command_output_size(output):
+    """Output is padded with lines to the configured size."""
+
+    settings = dict(HOST_DEFAULTS)
+    settings["output"] = output
+    settings["output_size"] = 100
+
+    padded = command_output(settings, "ls", "me", "host")
+    assert 99 <= len(padded) <= 100
+    assert padded.startswith(output)
+    assert "ls output from host" in padded
+    assert not padded.endswith("\n")
+
+
+def test_unknown_settings():
+    """Typos in settings raise a ValueError rather than being ignored."""
+
+    with pytest.raises(ValueError) as error:
+        FakeFleet(latancy=1)
+    assert "latancy" in str(error.value)
+
+    fleet = FakeFleet()
+    with pytest.raises(ValueError):
+        fleet.add("web*", ouptut="nope")
+
+
+def test_save_and_close():
+    """The configuration is saved for the ssh command, and removed after."""
+
+    with FakeFleet(latency=0.1) as fleet:
+        fleet.add("web*", refuse=True)
+        command = fleet.ssh_command
+        path = fleet.path
+        assert command == fake_ssh_command(path)
+        assert command.startswith(sys.executable)
+
+        # adding after saving updates the file
+        fleet.add("db*", latency=2)
+        with open(path) as config_file:
+            config = json.load(config_file)
+
+    assert config == {
+        "defaults": {"latency": 0.1},
+        "hosts": [["web*", {"refuse": True}], ["db*", {"latency": 2}]],
+    }
+    assert not os.path.exists(path)
+    assert fleet.path is None
+
+
+def test_fleet_run():
+    """Bladerunner logs in, runs commands and fails as the hosts are set."""
+
+    with FakeFleet(password="hunter7") as fleet:
+        fleet.add("web*", commands={"uptime": "up 3 days"})
+        fleet.add("refused", refuse=True)
+        fleet.add("locked", password="other")
+        fleet.add("new", host_key=True, output="{command} on {host}")
+        runner = Bladerunner({
+            "ssh": fleet.ssh_command,
+            "password": "hunter7",
+            "threads": 5,
+            "timeout": 10,
+        })
+        results = runner.run("uptime", ["web1", "web2", "refused", "locked",
+                                        "new"])
+
+    outputs = dict((result["name"], result["results"]) for result in results)
+    assert outputs == {
+        "web1": [("uptime", "up 3 days")],
+        "web2": [("uptime", "up 3 days")],
+        "refused": [("login", "Could not connect to remote server (err: -7)")],
+        "locked": [("login", "Password denied (err: -5)")],
+        "new": [("uptime", "uptime on new")],
+    }
@@ -0,0 +1,109 @@
+"""Tests for the per phase and command timings."""
+
+
+import pytest
+
+from bladerunner.formatting import consolidate
+from bladerunner.timings import Timings, percentile, timings_results
+
+
+def test_percentile():
+    """Percentiles are interpolated between the closest values."""
+
+    ordered = [1, 2, 3, 4, 10]
+    assert percentile(ordered, 0) == 1
+    assert percentile(ordered, 50) == 3
+    assert percentile(ordered, 90) == pytest.approx(7.6)
+    assert percentile(ordered, 100) == 10
+
+
+def test_phase_changed():
+    """Each phase lasts until the host's next phase, or it finishes."""
+
+    timings = Timings()
+    timings.phase_changed("one", "resolving", 1.0)
+    timings.phase_changed("one", "connecting", 1.5)
+    timings.phase_changed("one", "running", 4.0)
+    timings.phase_changed("one", None, 10.0)
+
+    assert timings.pop("one") == {
+        "phases": {"resolving": 0.5, "connecting": 2.5, "running": 6.0},
+        "commands": [],
+    }
+    # popped, so it's gone
+    assert timings.pop("one") == {"phases": {}, "commands": []}
+
+
+def test_command_finished():
+    """Commands are kept in order for the host, and pooled for the summary."""
+
+    timings = Timings()
+    timings.command_finished("one", "uptime", 0.25)
+    timings.command_finished("one", "df", 1.5)
+    timings.command_finished("two", "uptime", 0.75)
+
+    assert timings.pop("one")["commands"] == [("uptime", 0.25), ("df", 1.5)]
+    assert list(timings.commands["uptime"]) == [0.25, 0.75]
+
+
+def test_summary():
+    """Phases are summarized in run order with their percentiles."""
+
+    timings = Timings()
+    for index in range(100):
+        host = "host{0}".format(index)
+        timings.phase_changed(host, "connecting", 0)
+        timings.phase_changed(host, "running", index + 1)
+        timings.phase_changed(host, None, 200)
+        timings.command_finished(host, "uptime", 1)
+
+    summary = timings.summary()
+    assert [name for name, _ in summary["phases"]] == ["connecting", "running"]
+
+    connecting = summary["phases"][0][1]
+    assert connecting["count"] == 100
+    assert connecting[50] == pytest.approx(50.5)
+    assert connecting[95] == pytest.approx(95.05)
+    assert connecting[99] == pytest.approx(99.01)
+    assert connecting["max"] == 100
+
+    assert summary["commands"] == [
+        ("uptime", {"count": 100, 50: 1, 95: 1, 99: 1, "max": 1}),
+    ]
+
+
+def test_timings_results(capfd):
+    """The summary is printed as a table of seconds."""
+
+    timings = Timings()
+    timings.phase_changed("one", "logging in", 1)
+    timings.phase_changed("one", None, 3)
+    timings.command_finished("one", "uptime", 0.5)
+
+    timings_results(timings)
+    stdout, _ = capfd.readouterr()
+    lines = stdout.splitlines()
+
+    assert lines[0].split() == ["timings", "count", "p50", "p95", "p99", "max"]
+    assert lines[1].split() == ["logging", "in", "1"] + ["2.000s"] * 4
+    assert lines[2].split() == ["$", "uptime", "1"] + ["0.500s"] * 4
+
+
+def test_timings_results_empty(capfd):
+    """Nothing is printed if nothing was timed."""
+
+    timings_results(Timings())
+    stdout, _ = capfd.readouterr()
+    assert stdout == ""
+
+
+def test_consolidate_drops_timings():
+    """Each host's timings aren't carried into its group."""
+
+    results = [
+        {"name": "one", "results": [("a", "b")], "timings": {"phases": {}}},
+        {"name": "two", "results": [("a", "b")], "timings": {"phases": {}}},
+    ]
+    assert consolidate(results) == [
+        {"names": ["one", "two"], "results": [("a", "b")]},
+    ]
@@ -0,0 +1,130 @@
+"""Tests for the Chrome trace timeline of runs."""
+
+
+import os
+import json
+import pytest
+import tempfile
+import threading
+
+from bladerunner.trace import Tracer
+
+
+def events_named(tracer, name):
+    """Returns the trace events with a name."""
+
+    return [
+        event for event in tracer.trace_events() if event["name"] == name
+    ]
+
+
+def test_phase_spans():
+    """Each phase is a span, and the whole host is one as well."""
+
+    tracer = Tracer()
+    tracer.started = 10
+    tracer.phase_changed("one", "connecting", 11)
+    tracer.phase_changed("one", "running", 11.5)
+    tracer.phase_changed("one", None, 13)
+
+    connecting = events_named(tracer, "connecting")[0]
+    assert connecting["ph"] == "X"
+    assert connecting["cat"] == "phase"
+    assert connecting["ts"] == 1e6
+    assert connecting["dur"] == 0.5e6
+    assert connecting["args"] == {"host": "one"}
+
+    assert events_named(tracer, "running")[0]["dur"] == 1.5e6
+
+    host = events_named(tracer, "one")[0]
+    assert host["cat"] == "host"
+    assert host["ts"] == 1e6
+    assert host["dur"] == 2e6
+
+
+def test_commands_and_instants():
+    """Commands are spans and events are instants on the thread's track."""
+
+    tracer = Tracer()
+    tracer.started = 0
+    tracer.command_finished("one", "uptime", 2, 0.25)
+    tracer.instant("interrupt")
+
+    command = events_named(tracer, "uptime")[0]
+    assert command["cat"] == "command"
+    assert command["ts"] == 2e6
+    assert command["dur"] == 0.25e6
+
+    instant = events_named(tracer, "interrupt")[0]
+    assert instant["ph"] == "i"
+    assert instant["s"] == "t"
+    assert "args" not in instant
+    assert instant["tid"] == command["tid"]
+
+
+def test_thread_tracks():
+    """Each thread gets its own track, named after the thread."""
+
+    tracer = Tracer()
+    tracer.instant("main")
+
+    thread = threading.Thread(
+        target=tracer.instant,
+        args=("worker",),
+        name="worker-thread",
+    )
+    thread.start()
+    thread.join()
+
+    names = dict(
+        (event["tid"], event["args"]["name"])
+        for event in tracer.trace_events() if event["ph"] == "M"
+    )
+    assert names[events_named(tracer, "main")[0]["tid"]] == \
+        threading.current_thread().name
+    assert names[events_named(tracer, "worker")[0]["tid"]] == "worker-thread"
+
+
+def test_ring_buffer():
+    """Once full, the oldest events are overwritten."""
+
+    tracer = Tracer(size=3)
+    for index in range(5):
+        tracer.instant(str(index))
+
+    assert tracer.recorded == 5
+    assert [
+        event["name"] for event in tracer.trace_events() if event["ph"] == "i"
+    ] == ["2", "3", "4"]
+
+
+def test_write():
+    """The trace is written as JSON with the number of events dropped."""
+
+    tracer = Tracer(size=1)
+    tracer.instant("one")
+    tracer.instant("two")
+
+    fd, path = tempfile.mkstemp(suffix=".json")
+    os.close(fd)
+    try:
+        tracer.write(path)
+        with open(path) as trace_file:
+            trace = json.load(trace_file)
+    finally:
+        os.remove(path)
+
+    assert trace["otherData"] == {"dropped_events": 1}
+    assert [event["name"] for event in trace["traceEvents"]] == [
+        "thread_name",
+        "two",
+    ]
+
+
+def test_write_error():
+    """Failing to write the trace exits with the error."""
+
+    path = os.path.join(tempfile.mkdtemp(), "no", "such.json")
+    with pytest.raises(SystemExit) as error:
+        Tracer().write(path)
+    assert "Could not write trace file" in str(error.value)
@@ -0,0 +1,158 @@
+"""Tests for watch mode."""
+
+
+import time
+import signal
+import pytest
+import threading
+from mock import Mock
+from mock import patch
+
+from bladerunner.base import Bladerunner
+from bladerunner.testing import FakeFleet
+from bladerunner.formatting import OutputSink
+from bladerunner.watch import Watch, watch_header
+
+
+@pytest.fixture
+def runner():
+    """Returns a Bladerunner for a fake fleet with changing output."""
+
+    with FakeFleet() as fleet:
+        fleet.add("tick*", output="{command} #{count}")
+        fleet.add("down", refuse=True)
+        yield Bladerunner({"ssh": fleet.ssh_command, "threads": 5})
+
+
+def test_poll_changes(runner):
+    """Every host is returned at first, then only those which changed."""
+
+    watch = Watch(runner, ["date"], ["tick1", "static1", "down"])
+    try:
+        first = watch.poll()
+        second = watch.poll()
+    finally:
+        watch.close()
+
+    assert first == [
+        {"name": "tick1", "results": [("date", "date #1")]},
+        {"name": "static1", "results": [("date", "no output from: date")]},
+        {"name": "down", "results": [
+            ("login", "Could not connect to remote server (err: -7)"),
+        ]},
+    ]
+    assert second == [{"name": "tick1", "results": [("date", "date #2")]}]
+    assert watch.iterations == 2
+
+
+def test_sessions_kept(runner):
+    """Sessions stay connected between polls, and are ended on close."""
+
+    watch = Watch(runner, ["date"], ["tick1"])
+    watch.poll()
+    session = runner.interactive_hosts["tick1"]
+    sshr = session.sshr
+    watch.poll()
+
+    assert session.sshr is sshr
+    watch.close()
+    assert runner.interactive_hosts == {}
+    assert session.sshr is None
+
+
+def test_watch_header():
+    """The header shows the interval, commands and how many changed."""
+
+    class Polled(object):
+        """A watch which has polled once."""
+
+        commands = ["uptime", "date"]
+        servers = ["one", "two", "three"]
+        iterations = 1
+
+    sink = OutputSink()
+    sink.flush = lambda: None
+    watch_header(Polled(), [{"name": "one"}], 2.5, sink=sink)
+
+    line = "".join(sink._buffer)
+    assert line.startswith("Every 2.5s: uptime; date  ")
+    assert line.endswith("(poll 1, 1 of 3 hosts changed)\n")
+
+
+def test_failed_logins_closed(runner):
+    """Hosts which can't be logged in to don't leave children each poll."""
+
+    watch = Watch(runner, ["date"], ["tick1", "down"])
+    tracked = []
+    for _ in range(3):
+        watch.poll()
+        tracked.append(len(runner.teardown.children))
+    watch.close()
+
+    assert tracked == [1, 1, 1]
+    assert runner.teardown.children == []
+
+
+def test_failed_jumpbox_logins_closed():
+    """The jumpbox child of a failed login is closed, unless it's in use."""
+
+    runner = Bladerunner({"jump_host": "jumpbox", "threads": 5})
+    watch = Watch(runner, ["date"], ["up", "down"])
+    jumpbox = Mock()
+    runner.teardown.track(jumpbox)
+
+    def connect(status_return=False):
+        """Logs in to up through the jumpbox, and fails for down."""
+
+        runner.sshc = Mock(**{"isalive.return_value": False})
+        runner.teardown.track(runner.sshc)
+        return False
+
+    up = runner.interactive_hosts["up"]
+    up.sshr = jumpbox
+    with patch.object(runner.interactive_hosts["down"], "connect",
+                      side_effect=connect):
+        with patch.object(up, "run", return_value="fine"):
+            watch.poll()
+            watch.poll()
+
+    assert runner.teardown.children == [jumpbox]
+    assert runner.sshc is None
+
+
+@pytest.mark.skipif(not hasattr(signal, "pthread_kill"),
+                    reason="needs signal.pthread_kill")
+def test_poll_interrupted():
+    """Interrupting a poll cancels the hosts which haven't started yet."""
+
+    with FakeFleet(hang=["date"]) as fleet:
+        runner = Bladerunner({
+            "ssh": fleet.ssh_command,
+            "cmd_timeout": 30,
+            "threads": 1,
+        })
+        watch = Watch(runner, ["date"], ["hung1", "hung2", "hung3"])
+
+        polled = []
+        poll_host = watch._poll_host
+        watch._poll_host = lambda server: (
+            polled.append(server) or poll_host(server)
+        )
+
+        main = threading.current_thread().ident
+        timer = threading.Timer(
+            1,
+            lambda: signal.pthread_kill(main, signal.SIGINT),
+        )
+        started = time.time()
+        timer.start()
+        try:
+            with pytest.raises(KeyboardInterrupt):
+                watch.poll()
+        finally:
+            watch.close()
+        time.sleep(1)  # for anything still queued to have started
+
+    assert time.time() - started < 10
+    assert polled == ["hung1"]
+    assert runner.teardown.children == []